@@ -8,7 +8,7 @@ from typing import Any
 
 import streamlit as st
 
-# Ensure repo root is on `sys.path` so `import shared` works
+# Ensure the project root is on `sys.path` so `import src` works
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 
 if str(PROJECT_ROOT) not in sys.path:
@@ -37,6 +37,12 @@ def load_css():
 
 load_css()
 
+@st.cache_resource
+def get_query_service() -> QueryService:
+    # One service per process, so its in-memory query embedding cache outlives a rerun
+    return QueryService()
+
+
 def init_session_state() -> None:
     if 'ingested' not in st.session_state:
         st.session_state.ingested = False
@@ -195,18 +201,14 @@ def render_query_section(selected_question: str) -> None:
 
     if ask_clicked:
         try:
-            with st.spinner('Retrieving evidence and generating answer...'):
-                service = QueryService()
-                response = service.query(
-                    QueryRequest(
-                        question=question.strip(),
-                        top_k=TOP_K,
-                        min_score=MIN_SCORE,
-                        return_snippets=True
-                    )
+            stream_answer(
+                QueryRequest(
+                    question=question.strip(),
+                    top_k=TOP_K,
+                    min_score=MIN_SCORE,
+                    return_snippets=True
                 )
-
-                st.session_state.last_response = response
+            )
 
         except Exception as exc:
             st.error(f'Query failed: {exc}')
@@ -215,6 +217,34 @@ def render_query_section(selected_question: str) -> None:
         st.warning('Please ingest your documents before asking a question.')
 
 
+def stream_answer(request: QueryRequest) -> None:
+    # Sources show as soon as retrieval is done and the answer grows as it is generated;
+    # the answer section below takes over with the final response and its citations
+    service = get_query_service()
+    status = st.empty()
+    sources = st.empty()
+    answer = st.empty()
+    text = ''
+
+    status.caption('Retrieving evidence...')
+
+    for event, payload in service.query_stream(request):
+        if event == 'sources':
+            filenames = sorted({chunk['filename'] for chunk in payload['retrieved_chunks']})
+            sources.caption('Sources: ' + (', '.join(filenames) if filenames else 'none found'))
+            status.caption('Generating answer...')
+
+        elif event == 'token':
+            text += payload['text']
+            answer.markdown(text + ' ▌')
+
+        elif event == 'done':
+            st.session_state.last_response = QueryResponse.model_validate(payload)
+
+    for placeholder in (status, sources, answer):
+        placeholder.empty()
+
+
 def render_answer_section(response: QueryResponse | None) -> None:
     st.subheader('3. Answer and Sources')
 
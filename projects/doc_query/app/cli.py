@@ -16,6 +16,8 @@ def build_parser() -> argparse.ArgumentParser:
 
     ingest_parser = subparsers.add_parser('ingest', help='Ingest one or more documents')
     ingest_parser.add_argument('paths', nargs='+', help='Paths to documents')
+    ingest_parser.add_argument('--workers', type=int, default=None, help='Parallel worker processes')
+    ingest_parser.add_argument('--rebuild-index', action='store_true')
 
     query_parser = subparsers.add_parser('query', help='Query indexed documents')
     query_parser.add_argument('question', help='Question to ask')
@@ -32,7 +34,13 @@ def main() -> None:
 
     if args.command == 'ingest':
         service = IngestService()
-        response = service.ingest(IngestRequest(paths=args.paths))
+        response = service.ingest(
+            IngestRequest(
+                paths=args.paths,
+                max_workers=args.workers,
+                rebuild_index=args.rebuild_index
+            )
+        )
         print(json.dumps(response.model_dump(mode='json'), indent=2))
     
     elif args.command == 'query':
@@ -1,12 +1,16 @@
 from __future__ import annotations
 
+import json
+from typing import Any, AsyncIterator
+
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 
 from src.config import get_settings
 from src.ingest.catalog import list_document_entries
 from src.observability.logging import get_logger
 from src.schemas.ingest import IngestRequest, IngestResponse
-from src.schemas.query import QueryRequest, QueryResponse
+from src.schemas.query import QueryRequest, QueryResponse, RetrieveBatchRequest, RetrieveBatchResponse
 from src.services.ingest_service import IngestService
 from src.services.query_service import QueryService
 
@@ -54,11 +58,43 @@ def ingest_documents(request: IngestRequest) -> IngestResponse:
     
 
 @app.post('/query', response_model=QueryResponse)
-def query_documents(request: QueryRequest) -> QueryResponse:
+async def query_documents(request: QueryRequest) -> QueryResponse:
     try:
 
-        return query_service.query(request)
+        return await query_service.query_async(request)
     
     except Exception as exc:
         logger.exception('Query failed: %s', exc)
         raise HTTPException(status_code=500, detail=str(exc)) from exc
+
+
+@app.post('/query/stream')
+async def query_documents_stream(request: QueryRequest) -> StreamingResponse:
+    # Server-sent events: `sources`, then `token` per piece of answer text, then `done`
+    return StreamingResponse(
+        stream_events(query_service.query_stream_async(request)),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+async def stream_events(events: AsyncIterator[tuple[str, dict[str, Any]]]) -> AsyncIterator[str]:
+    try:
+        async for event, payload in events:
+            yield f'event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n'
+
+    except Exception as exc:
+        # The status line has already gone out, so failures are reported in-stream
+        logger.exception('Streamed query failed: %s', exc)
+        yield f'event: error\ndata: {json.dumps({"detail": str(exc)})}\n\n'
+
+
+@app.post('/retrieve/batch', response_model=RetrieveBatchResponse)
+def retrieve_batch(request: RetrieveBatchRequest) -> RetrieveBatchResponse:
+    try:
+
+        return query_service.retrieve_batch(request)
+
+    except Exception as exc:
+        logger.exception('Batch retrieval failed: %s', exc)
+        raise HTTPException(status_code=500, detail=str(exc)) from exc
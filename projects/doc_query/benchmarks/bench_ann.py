@@ -0,0 +1,148 @@
+'''
+Recall@k vs latency of each vector index type against the exact flat baseline.
+
+Uses a synthetic clustered corpus by default, or the vectors of the current
+`faiss.index` with `--from-index`. `--quantization` and `--truncate-dimension`
+apply compressed storage to every index; ground truth stays exact full-precision
+search. Synthetic vectors have no Matryoshka structure, so truncation recall is only
+representative with `--from-index`. Run from `projects/doc_query`:
+
+    python -m benchmarks.bench_ann --num-vectors 100000 --dimension 768
+    python -m benchmarks.bench_ann --quantization int8 --truncate-dimension 256
+'''
+from __future__ import annotations
+
+import argparse
+from time import perf_counter
+
+import faiss
+import numpy as np
+
+from src.config import ModelSettings, VectorIndexSettings, get_settings
+from src.retrieval.compression import VectorEncoding
+from src.retrieval.index_factory import build_index_description, create_index
+
+
+def synthetic_corpus(num_vectors: int, dimension: int, num_clusters: int = 200) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((num_clusters, dimension)).astype(np.float32)
+    assignments = rng.integers(0, num_clusters, num_vectors)
+    vectors = centers[assignments] + 0.6 * rng.standard_normal((num_vectors, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def load_index_vectors() -> np.ndarray:
+    index = faiss.read_index(str(get_settings().paths.faiss_index_path))
+    base = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+
+    if not isinstance(base, faiss.IndexFlat):
+        raise ValueError('--from-index needs a flat index to read exact vectors from')
+
+    return base.reconstruct_n(0, base.ntotal)
+
+
+def make_queries(corpus: np.ndarray, num_queries: int) -> np.ndarray:
+    rng = np.random.default_rng(1)
+    picks = corpus[rng.choice(len(corpus), num_queries, replace=False)]
+    queries = picks + 0.3 * rng.standard_normal(picks.shape).astype(np.float32) / np.sqrt(corpus.shape[1])
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def build(corpus: np.ndarray, settings: VectorIndexSettings) -> tuple[faiss.Index, float]:
+    start = perf_counter()
+    sample_size = min(len(corpus), settings.train_sample_size)
+    index = create_index(corpus.shape[1], settings, num_train=sample_size)
+
+    if not index.is_trained:
+        sample = corpus[np.random.default_rng(2).choice(len(corpus), sample_size, replace=False)]
+        index.train(sample)
+
+    index.add_with_ids(corpus, np.arange(len(corpus), dtype=np.int64))
+    return index, perf_counter() - start
+
+
+def measure(index: faiss.Index, queries: np.ndarray, truth: np.ndarray, k: int) -> tuple[float, float, float]:
+    latencies = []
+    hits = 0
+
+    # One query per call, as in the query path
+    for query, expected in zip(queries, truth):
+        start = perf_counter()
+        _, ids = index.search(query[np.newaxis, :], k)
+        latencies.append((perf_counter() - start) * 1000)
+        hits += len(set(ids[0].tolist()) & set(expected.tolist()))
+
+    return hits / truth.size, float(np.mean(latencies)), float(np.percentile(latencies, 95))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='ANN index recall/latency report')
+    parser.add_argument('--num-vectors', type=int, default=100_000)
+    parser.add_argument('--dimension', type=int, default=768)
+    parser.add_argument('--num-queries', type=int, default=500)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--from-index', action='store_true')
+    parser.add_argument('--quantization', choices=['none', 'float16', 'int8'], default='none')
+    parser.add_argument('--truncate-dimension', type=int, default=None)
+    args = parser.parse_args()
+
+    corpus = load_index_vectors() if args.from_index else synthetic_corpus(args.num_vectors, args.dimension)
+    queries = make_queries(corpus, min(args.num_queries, len(corpus)))
+
+    exact = faiss.IndexFlatIP(corpus.shape[1])
+    exact.add(corpus)
+    _, truth = exact.search(queries, args.k)
+
+    storage = {'quantization': args.quantization, 'truncate_dimension': args.truncate_dimension}
+    encoding = VectorEncoding.from_settings(
+        ModelSettings(embedding_dimension=corpus.shape[1]),
+        VectorIndexSettings(**storage)
+    )
+    corpus, queries = encoding.encode(corpus), encoding.encode(queries)
+    dimension = encoding.dimension
+    pq_m = 64 if dimension % 64 == 0 else 16
+
+    configs: list[tuple[VectorIndexSettings, str]] = [(VectorIndexSettings(index_type='flat', **storage), '')]
+
+    for nprobe in (1, 4, 16, 64):
+        configs.append((VectorIndexSettings(index_type='ivf_flat', nprobe=nprobe, **storage), f'nprobe={nprobe}'))
+
+    for nprobe in (4, 16, 64):
+        configs.append(
+            (VectorIndexSettings(index_type='ivf_pq', nprobe=nprobe, pq_m=pq_m, **storage), f'nprobe={nprobe}')
+        )
+
+    for ef_search in (16, 64, 256):
+        configs.append((VectorIndexSettings(index_type='hnsw', ef_search=ef_search, **storage), f'efSearch={ef_search}'))
+
+    built: dict[str, tuple[faiss.Index, float]] = {}
+
+    print(
+        f'corpus={len(corpus)} dim={encoding.source_dimension}->{dimension} '
+        f'quantization={encoding.quantization} queries={len(queries)} k={args.k}'
+    )
+    print(
+        f'{"index":<24}{"params":<14}{"size MB":>9}{"build s":>9}'
+        f'{f"recall@{args.k}":>11}{"mean ms":>10}{"p95 ms":>9}'
+    )
+
+    for settings, params in configs:
+        description = build_index_description(dimension, settings, min(len(corpus), settings.train_sample_size))
+
+        # Query-time knobs do not change the built index, so reuse it across the sweep
+        if description not in built:
+            built[description] = build(corpus, settings)
+
+        index, build_seconds = built[description]
+        faiss.ParameterSpace().set_index_parameters(index, params)
+        size_mb = faiss.serialize_index(index).nbytes / 1e6
+
+        recall, mean_ms, p95_ms = measure(index, queries, truth, args.k)
+        print(
+            f'{description:<24}{params:<14}{size_mb:>9.1f}{build_seconds:>9.1f}'
+            f'{recall:>11.3f}{mean_ms:>10.3f}{p95_ms:>9.3f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
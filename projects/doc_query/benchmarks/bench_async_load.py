@@ -0,0 +1,204 @@
+'''
+Sustained QPS of the sync and async query paths under many concurrent clients.
+
+The API runs under uvicorn in a subprocess with two routes over the same `QueryService`:
+a sync `def` route calling `query` (one threadpool slot per request for its whole
+duration) and the `async def` route calling `query_async`. Gemini is replaced by the
+local stand-in server (`--embed-ms` per embedding, `--generate-ms` per answer) and the
+index holds random vectors. Every request asks a distinct question so the query
+embedding cache never answers it. Run from `projects/doc_query`:
+
+    python -m benchmarks.bench_async_load --clients 200 --duration 20
+'''
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from time import perf_counter
+
+import google.genai as genai
+import httpx
+import numpy as np
+import uvicorn
+
+from benchmarks.bench_streaming_memory import iter_synthetic_chunks, make_embedder
+from benchmarks.embedding_server import StandInEmbeddingServer
+from src.config import get_settings
+from src.ingest.streaming import index_chunk_stream
+from src.retrieval.vector_store import FaissVectorStore
+from src.schemas.query import QueryRequest, QueryResponse
+
+
+def configure(workdir: Path, dimension: int) -> None:
+    settings = get_settings()
+    settings.paths.faiss_index_path = workdir / 'faiss.index'
+    settings.paths.index_metadata_path = workdir / 'index_metadata.json'
+    settings.paths.bm25_index_path = workdir / 'bm25.npz'
+    settings.paths.binary_index_path = workdir / 'binary.index'
+    settings.paths.rescore_vectors_path = workdir / 'rescore_vectors.f32'
+    settings.paths.logs_dir = workdir / 'logs'
+    settings.models.embedding_dimension = dimension
+    settings.embedding_cache.enabled = False
+
+    # Stand-in vectors are random, so no question clears a real similarity threshold
+    settings.retrieval.min_similarity_threshold = 0.0
+
+
+def build_index(workdir: Path, chunks: int, dimension: int) -> None:
+    configure(workdir, dimension)
+
+    with FaissVectorStore().open_writer(rebuild=True) as writer:
+        index_chunk_stream(
+            iter_synthetic_chunks(chunks),
+            embed_texts=make_embedder(dimension),
+            writer=writer,
+            batch_size=1024,
+            queue_size=4
+        )
+        writer.commit()
+
+
+def serve(workdir: Path, dimension: int, base_url: str, port: int) -> None:
+    os.environ.setdefault('GEMINI_API_KEY', 'stand-in-key')
+    configure(workdir, dimension)
+
+    # The API module builds its services on import, so it comes after the settings
+    from app import main
+
+    service = main.query_service
+    stand_in = genai.Client(api_key='stand-in-key', http_options={'base_url': base_url})
+    service.retriever.embedding_client.client = stand_in
+    service.answerer.client = stand_in
+
+    # Every run must reach the stand-in generator, not replies cached by an earlier run
+    service.answerer.response_cache = None
+
+    @main.app.post('/bench/query-sync', response_model=QueryResponse)
+    def query_sync(request: QueryRequest) -> QueryResponse:
+        return service.query(request)
+
+    uvicorn.run(main.app, host='127.0.0.1', port=port, log_level='warning')
+
+
+async def run_load(url: str, clients: int, duration: float) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    deadline = perf_counter() + duration
+    counter = iter(range(10**9))
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        async def worker() -> None:
+            nonlocal errors
+
+            while perf_counter() < deadline:
+                start = perf_counter()
+
+                try:
+                    response = await client.post(url, json={'question': f'What does clause {next(counter)} say?'})
+                except httpx.TransportError:
+                    errors += 1
+                    continue
+
+                if response.status_code == 200:
+                    latencies.append((perf_counter() - start) * 1000)
+                else:
+                    errors += 1
+
+        start = perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        elapsed = perf_counter() - start
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'qps': len(latencies) / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50)) if latencies else 0.0,
+        'p95_ms': float(np.percentile(latencies, 95)) if latencies else 0.0
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(base_url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f'{base_url}/health').status_code == 200:
+                return
+        except httpx.TransportError:
+            time.sleep(0.2)
+
+    raise RuntimeError('API server did not start')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Sync vs async query path load test')
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=20.0, help='Seconds per path')
+    parser.add_argument('--chunks', type=int, default=20_000)
+    parser.add_argument('--dimension', type=int, default=768)
+    parser.add_argument('--embed-ms', type=float, default=80.0)
+    parser.add_argument('--generate-ms', type=float, default=800.0)
+    parser.add_argument('--serve', nargs=3, metavar=('WORKDIR', 'BASE_URL', 'PORT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        workdir, base_url, port = args.serve
+        serve(Path(workdir), args.dimension, base_url, int(port))
+        return
+
+    workdir = Path(tempfile.mkdtemp(prefix='docquery-bench-'))
+    build_index(workdir, args.chunks, args.dimension)
+
+    with StandInEmbeddingServer(
+        dimension=args.dimension,
+        request_latency_ms=args.embed_ms,
+        per_text_latency_ms=0.0,
+        generation_latency_ms=args.generate_ms
+    ) as stand_in:
+        port = free_port()
+        api = subprocess.Popen(
+            [
+                sys.executable, '-m', 'benchmarks.bench_async_load',
+                '--serve', str(workdir), stand_in.base_url, str(port),
+                '--dimension', str(args.dimension)
+            ]
+        )
+
+        try:
+            api_url = f'http://127.0.0.1:{port}'
+            wait_until_up(api_url)
+
+            print(
+                f'clients={args.clients} duration={args.duration:.0f}s chunks={args.chunks} '
+                f'embed={args.embed_ms:.0f}ms generate={args.generate_ms:.0f}ms'
+            )
+            print(f'{"path":<8}{"requests":>10}{"errors":>8}{"qps":>9}{"p50 ms":>10}{"p95 ms":>10}')
+
+            for name, route in (('sync', '/bench/query-sync'), ('async', '/query')):
+                row = asyncio.run(run_load(f'{api_url}{route}', args.clients, args.duration))
+
+                print(
+                    f'{name:<8}{row["requests"]:>10}{row["errors"]:>8}{row["qps"]:>9.1f}'
+                    f'{row["p50_ms"]:>10.0f}{row["p95_ms"]:>10.0f}'
+                )
+        finally:
+            api.terminate()
+            api.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+'''
+Recall@k and latency of the binary first pass with exact rescoring, per rescore multiplier.
+
+Ground truth and the float baseline are exact inner-product search (`IndexFlatIP`).
+Run from `projects/doc_query`:
+
+    python -m benchmarks.bench_binary_rescore --num-vectors 100000 --dimension 3072
+'''
+from __future__ import annotations
+
+import argparse
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+import faiss
+import numpy as np
+
+from benchmarks.bench_ann import make_queries, synthetic_corpus
+from src.retrieval.binary_index import BinaryRescoreIndex, BinaryRescoreWriter
+
+
+def measure(search, queries: np.ndarray, truth: np.ndarray, k: int) -> tuple[float, float, float]:
+    latencies = []
+    hits = 0
+
+    for query, expected in zip(queries, truth):
+        start = perf_counter()
+        _, ids = search(query, k)
+        latencies.append((perf_counter() - start) * 1000)
+        hits += len(set(ids[0].tolist()) & set(expected.tolist()))
+
+    return hits / truth.size, float(np.mean(latencies)), float(np.percentile(latencies, 95))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Binary first pass + rescoring report')
+    parser.add_argument('--num-vectors', type=int, default=100_000)
+    parser.add_argument('--dimension', type=int, default=3072)
+    parser.add_argument('--num-queries', type=int, default=300)
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+
+    corpus = synthetic_corpus(args.num_vectors, args.dimension)
+    queries = make_queries(corpus, min(args.num_queries, len(corpus)))
+
+    exact = faiss.IndexFlatIP(args.dimension)
+    exact.add(corpus)
+    _, truth = exact.search(queries, args.k)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index_path, vectors_path = Path(tmp) / 'binary.index', Path(tmp) / 'rescore_vectors.f32'
+
+        writer = BinaryRescoreWriter(index_path, vectors_path, args.dimension)
+        writer.add(corpus)
+        writer.commit()
+
+        row_ids = np.arange(len(corpus), dtype=np.int64)
+
+        print(f'corpus={len(corpus)} dim={args.dimension} queries={len(queries)} k={args.k}')
+        print(
+            f'float index {exact.ntotal * exact.d * 4 / 1e6:.1f} MB in memory, '
+            f'binary index {writer.index.ntotal * writer.index.code_size / 1e6:.1f} MB in memory'
+        )
+        print(f'{"search":<28}{f"recall@{args.k}":>11}{"mean ms":>10}{"p95 ms":>9}')
+
+        recall, mean_ms, p95_ms = measure(
+            lambda query, k: exact.search(query[np.newaxis, :], k), queries, truth, args.k
+        )
+        print(f'{"IndexFlatIP":<28}{recall:>11.3f}{mean_ms:>10.3f}{p95_ms:>9.3f}')
+
+        for multiplier in (1, 2, 4, 8, 16, 32):
+            binary = BinaryRescoreIndex.load(index_path, vectors_path, row_ids, multiplier)
+            recall, mean_ms, p95_ms = measure(binary.search, queries, truth, args.k)
+            print(f'{f"binary + rescore x{multiplier}":<28}{recall:>11.3f}{mean_ms:>10.3f}{p95_ms:>9.3f}')
+
+
+if __name__ == '__main__':
+    main()
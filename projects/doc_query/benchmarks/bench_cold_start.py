@@ -0,0 +1,159 @@
+'''
+Cold-start time and per-process memory of loading the index with and without mmap.
+
+An index is built once in a temporary folder; every (index type, mode) pair then loads
+it in a fresh subprocess, as a CLI query or a new API worker would, and runs one search.
+`anon MB` is the process's private memory, `file MB` the file pages it maps: with mmap
+the vectors are file pages that every worker serving the same index shares through
+the page cache. The index is timed on its own and as part of the whole snapshot,
+whose chunk metadata is still parsed from JSON in both modes. Embeddings are random.
+Run from `projects/doc_query`:
+
+    python -m benchmarks.bench_cold_start --chunks 200000 --dimension 768
+'''
+from __future__ import annotations
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+from benchmarks.bench_streaming_memory import iter_synthetic_chunks, make_embedder
+from src.config import get_settings
+from src.ingest.streaming import index_chunk_stream
+from src.retrieval.index_factory import read_index
+from src.retrieval.vector_store import FaissVectorStore
+
+
+def configure(workdir: Path, index_type: str, dimension: int, mmap: bool = False) -> None:
+    settings = get_settings()
+    settings.paths.faiss_index_path = workdir / 'faiss.index'
+    settings.paths.index_metadata_path = workdir / 'index_metadata.json'
+    settings.paths.bm25_index_path = workdir / 'bm25.npz'
+    settings.paths.binary_index_path = workdir / 'binary.index'
+    settings.paths.rescore_vectors_path = workdir / 'rescore_vectors.f32'
+    settings.models.embedding_dimension = dimension
+    settings.vector_index.index_type = index_type
+    settings.vector_index.mmap = mmap
+
+
+def memory_mb() -> dict[str, float]:
+    fields = {}
+
+    with open('/proc/self/status') as status:
+        for line in status:
+            name, _, value = line.partition(':')
+
+            if name in ('VmRSS', 'RssAnon', 'RssFile'):
+                fields[name] = int(value.split()[0]) / 1024
+
+    return fields
+
+
+def build(workdir: Path, index_type: str, chunks: int, dimension: int) -> None:
+    configure(workdir, index_type, dimension)
+    store = FaissVectorStore()
+
+    with store.open_writer(rebuild=True) as writer:
+        index_chunk_stream(
+            iter_synthetic_chunks(chunks),
+            embed_texts=make_embedder(dimension),
+            writer=writer,
+            batch_size=1024,
+            queue_size=4
+        )
+        writer.commit()
+
+
+def run_worker(workdir: Path, index_type: str, mode: str, dimension: int) -> dict:
+    configure(workdir, index_type, dimension, mmap=mode == 'mmap')
+    store = FaissVectorStore()
+    before = memory_mb()
+
+    # The FAISS index on its own, then the whole snapshot (chunk metadata, BM25) around it
+    start = perf_counter()
+    index = read_index(store.index_path, mmap=mode == 'mmap')
+    index_ms = (perf_counter() - start) * 1000
+    index_memory = memory_mb()
+    del index
+
+    start = perf_counter()
+    snapshot = store.get_snapshot()
+    snapshot_ms = (perf_counter() - start) * 1000
+
+    query = make_embedder(dimension)(['query'])[0]
+    start = perf_counter()
+    snapshot.search(query, 5)
+    query_ms = (perf_counter() - start) * 1000
+    after = memory_mb()
+
+    return {
+        'index_type': index_type,
+        'mode': mode,
+        'index_ms': index_ms,
+        'index_anon_mb': index_memory['RssAnon'] - before['RssAnon'],
+        'index_file_mb': index_memory['RssFile'] - before['RssFile'],
+        'snapshot_ms': snapshot_ms,
+        'query_ms': query_ms,
+        'snapshot_anon_mb': after['RssAnon'] - before['RssAnon'],
+        'snapshot_file_mb': after['RssFile'] - before['RssFile']
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Index cold-start benchmark')
+    parser.add_argument('--chunks', type=int, default=200_000)
+    parser.add_argument('--dimension', type=int, default=768)
+    parser.add_argument('--index-types', nargs='+', default=['flat', 'hnsw', 'ivf_flat'])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--worker', nargs=3, metavar=('WORKDIR', 'INDEX_TYPE', 'MODE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        workdir, index_type, mode = args.worker
+        print(json.dumps(run_worker(Path(workdir), index_type, mode, args.dimension)))
+        return
+
+    print(f'chunks={args.chunks} dim={args.dimension} (median of {args.repeats} runs)')
+    print(
+        f'{"":<17}{"--------- index ---------":>27}{"------------- snapshot -------------":>38}\n'
+        f'{"index":<10}{"mode":<7}{"load ms":>9}{"anon MB":>9}{"file MB":>9}'
+        f'{"load ms":>11}{"query ms":>10}{"anon MB":>9}{"file MB":>9}'
+    )
+
+    for index_type in args.index_types:
+        workdir = Path(tempfile.mkdtemp(prefix='docquery-bench-'))
+        build(workdir, index_type, args.chunks, args.dimension)
+
+        for mode in ('load', 'mmap'):
+            rows = []
+
+            for _ in range(args.repeats):
+                completed = subprocess.run(
+                    [
+                        sys.executable, '-m', 'benchmarks.bench_cold_start',
+                        '--worker', str(workdir), index_type, mode,
+                        '--dimension', str(args.dimension)
+                    ],
+                    capture_output=True,
+                    text=True,
+                    check=True
+                )
+                rows.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+            median = {key: float(np.median([row[key] for row in rows])) for key in rows[0] if key.endswith(('_ms', '_mb'))}
+
+            print(
+                f'{index_type:<10}{mode:<7}{median["index_ms"]:>9.1f}{median["index_anon_mb"]:>9.0f}'
+                f'{median["index_file_mb"]:>9.0f}{median["snapshot_ms"]:>11.1f}{median["query_ms"]:>10.2f}'
+                f'{median["snapshot_anon_mb"]:>9.0f}{median["snapshot_file_mb"]:>9.0f}'
+            )
+
+
+if __name__ == '__main__':
+    main()
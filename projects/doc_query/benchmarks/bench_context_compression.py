@@ -0,0 +1,225 @@
+'''
+A/B of the grounded prompt with and without query-focused context compression.
+
+Each question asks for one fact stated in a single sentence of a synthetic policy
+document. Its context is what retrieval hands to generation: the chunk holding the fact,
+that chunk's neighbors and two chunks from other documents, packed into the token budget.
+Arm A prompts with the packed chunks, arm B with the same chunks after compression.
+Both arms report prompt tokens, whether the fact sentence is still in the prompt,
+generation latency and how often the answer has the expected value in it.
+
+By default generation goes to the local stand-in server, whose latency grows with prompt
+length (`--prompt-token-ms`) and whose answer is fixed, so the answer-agreement column
+only means something with `--live`. `--live` calls Gemini with `GEMINI_API_KEY` instead.
+Run from `projects/doc_query`:
+
+    python -m benchmarks.bench_context_compression --questions 40
+    python -m benchmarks.bench_context_compression --questions 20 --live
+'''
+from __future__ import annotations
+
+import argparse
+import os
+import random
+from time import perf_counter
+
+import google.genai as genai
+import numpy as np
+
+from benchmarks.embedding_server import StandInEmbeddingServer
+from src.config import get_settings
+from src.generation.answerer import Answerer
+from src.generation.context_compressor import compress_context
+from src.generation.context_packer import estimate_tokens, pack_context
+from src.generation.prompts import build_grounded_prompt
+from src.ingest.chunking import build_chunk_records
+from src.models.retrieval import RetrievedChunk
+
+SUBJECTS = ['The supplier', 'The customer', 'Each party', 'The service provider', 'The licensee', 'The contractor']
+ACTIONS = [
+    'shall maintain accurate records of all deliverables',
+    'must notify the other party of any material change in ownership',
+    'will comply with applicable data protection legislation',
+    'is responsible for the security of its own systems',
+    'may subcontract routine maintenance with prior written consent',
+    'shall keep confidential information in strict confidence',
+    'must provide monthly reports on service availability',
+    'will remedy any breach within a reasonable period'
+]
+CONDITIONS = [
+    'during the term of this agreement',
+    'unless otherwise agreed in writing',
+    'in accordance with the schedules attached hereto',
+    'subject to the limitations set out below',
+    'at its own cost and expense',
+    'to the extent permitted by law'
+]
+FACTS = [
+    ('notice period for termination', 'days', (15, 120)),
+    ('maximum liability cap', 'thousand euros', (50, 900)),
+    ('invoice payment term', 'days', (10, 90)),
+    ('warranty period', 'months', (3, 36)),
+    ('service credit for each hour of downtime', 'percent of the monthly fee', (1, 10))
+]
+
+
+def make_corpus(documents: int, sentences: int, rng: random.Random) -> tuple[list[RetrievedChunk], list[dict]]:
+    settings = get_settings()
+    chunks: list[RetrievedChunk] = []
+    questions: list[dict] = []
+
+    for d in range(documents):
+        document_id = f'doc{d:08x}'
+        product = f'Product {d:03d}'
+        body = [f'{rng.choice(SUBJECTS)} {rng.choice(ACTIONS)} {rng.choice(CONDITIONS)}.' for _ in range(sentences)]
+
+        for topic, unit, (low, high) in FACTS:
+            value = rng.randint(low, high)
+            fact = f'The {topic} under the {product} agreement is {value} {unit}.'
+            body.insert(rng.randrange(len(body)), fact)
+            questions.append({
+                'document_id': document_id,
+                'question': f'What is the {topic} under the {product} agreement?',
+                'fact': fact,
+                'value': str(value)
+            })
+
+        records = build_chunk_records(
+            document_id,
+            f'{document_id}.pdf',
+            [{'page_number': 1, 'text': ' '.join(body)}],
+            settings.chunking.chunk_size,
+            settings.chunking.chunk_overlap,
+            settings.chunking.min_chunk_chars
+        )
+
+        chunks.extend(
+            RetrievedChunk(
+                chunk_id=record.chunk_id,
+                document_id=record.document_id,
+                filename=record.filename,
+                text=record.text,
+                score=0.0,
+                rank=0,
+                page_number=record.page_number,
+                metadata=record.metadata
+            )
+            for record in records
+        )
+
+    return chunks, questions
+
+
+def retrieved_context(question: dict, chunks: list[RetrievedChunk], rng: random.Random) -> list[RetrievedChunk]:
+    settings = get_settings()
+    document_chunks = [chunk for chunk in chunks if chunk.document_id == question['document_id']]
+    target = next(i for i, chunk in enumerate(document_chunks) if question['fact'] in chunk.text)
+    others = [chunk for chunk in chunks if chunk.document_id != question['document_id']]
+
+    context = [document_chunks[target].model_copy(update={'score': 0.8})]
+    context += [
+        document_chunks[i].model_copy(update={'score': 0.8})
+        for i in (target - 1, target + 1)
+        if 0 <= i < len(document_chunks)
+    ]
+    context += [chunk.model_copy(update={'score': 0.5}) for chunk in rng.sample(others, 2)]
+
+    return pack_context(
+        context,
+        max_tokens=settings.prompts.max_context_tokens,
+        max_blocks=settings.prompts.max_context_chunks,
+        max_overlap=settings.chunking.chunk_overlap
+    ).chunks
+
+
+def run_arm(answerer: Answerer, cases: list[tuple[dict, list[RetrievedChunk]]], compress: bool) -> dict:
+    settings = get_settings()
+    tokens: list[int] = []
+    compression_ms: list[float] = []
+    generation_ms: list[float] = []
+    fact_kept = 0
+    correct = 0
+
+    for question, context in cases:
+        if compress:
+            start = perf_counter()
+            context = compress_context(
+                question['question'],
+                context,
+                max_sentences=settings.prompts.compression_max_sentences,
+                neighbor_sentences=settings.prompts.compression_neighbor_sentences
+            ).chunks
+            compression_ms.append((perf_counter() - start) * 1000)
+
+        prompt = build_grounded_prompt(question['question'], context)
+        tokens.append(estimate_tokens(prompt))
+        fact_kept += question['fact'] in prompt
+
+        start = perf_counter()
+        record, _ = answerer.answer(question['question'], context)
+        generation_ms.append((perf_counter() - start) * 1000)
+        correct += question['value'] in record.answer
+
+    return {
+        'prompt_tokens': float(np.mean(tokens)),
+        'compression_ms': float(np.mean(compression_ms)) if compression_ms else 0.0,
+        'fact_kept': fact_kept / len(cases),
+        'generation_p50_ms': float(np.percentile(generation_ms, 50)),
+        'generation_mean_ms': float(np.mean(generation_ms)),
+        'answer_has_value': correct / len(cases)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Prompt context compression A/B')
+    parser.add_argument('--documents', type=int, default=20)
+    parser.add_argument('--sentences', type=int, default=60, help='Filler sentences per document')
+    parser.add_argument('--questions', type=int, default=40)
+    parser.add_argument('--generate-ms', type=float, default=300.0, help='Stand-in base generation latency')
+    parser.add_argument('--prompt-token-ms', type=float, default=0.25, help='Stand-in latency per prompt token')
+    parser.add_argument('--live', action='store_true', help='Generate with Gemini instead of the stand-in')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    chunks, questions = make_corpus(args.documents, args.sentences, rng)
+    cases = [(question, retrieved_context(question, chunks, rng)) for question in rng.sample(questions, args.questions)]
+
+    if not args.live:
+        os.environ.setdefault('GEMINI_API_KEY', 'stand-in-key')
+
+    answerer = Answerer()
+    stand_in = None
+
+    if not args.live:
+        stand_in = StandInEmbeddingServer(
+            dimension=8,
+            generation_latency_ms=args.generate_ms,
+            prompt_token_latency_ms=args.prompt_token_ms
+        ).start()
+        answerer.client = genai.Client(api_key='stand-in-key', http_options={'base_url': stand_in.base_url})
+
+    try:
+        print(
+            f'questions={args.questions} documents={args.documents} '
+            f'generation={"gemini" if args.live else "stand-in"}'
+        )
+        print(
+            f'{"arm":<14}{"tokens":>9}{"compress ms":>13}{"fact kept":>11}'
+            f'{"gen p50 ms":>12}{"gen mean ms":>13}{"answer ok":>11}'
+        )
+
+        for name, compress in (('A full', False), ('B compressed', True)):
+            row = run_arm(answerer, cases, compress)
+
+            print(
+                f'{name:<14}{row["prompt_tokens"]:>9.0f}{row["compression_ms"]:>13.2f}{row["fact_kept"]:>11.0%}'
+                f'{row["generation_p50_ms"]:>12.0f}{row["generation_mean_ms"]:>13.0f}{row["answer_has_value"]:>11.0%}'
+            )
+    finally:
+        if stand_in is not None:
+            stand_in.stop()
+
+
+if __name__ == '__main__':
+    main()
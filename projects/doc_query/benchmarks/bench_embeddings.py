@@ -0,0 +1,91 @@
+'''
+Benchmark per-text vs batched/concurrent embedding against a local stand-in server.
+
+Run from `projects/doc_query`:
+
+    python -m benchmarks.bench_embeddings --num-texts 2000 --latency-ms 80
+'''
+from __future__ import annotations
+
+import argparse
+import os
+from time import perf_counter
+
+import google.genai as genai
+import numpy as np
+
+from benchmarks.embedding_server import StandInEmbeddingServer
+from src.config import get_settings
+from src.retrieval.embeddings import EmbeddingClient
+
+
+def build_client(base_url: str, dimension: int) -> EmbeddingClient:
+    os.environ.setdefault('GEMINI_API_KEY', 'stand-in-key')
+
+    # Measure the network path only; the on-disk embedding cache would serve repeats
+    get_settings().embedding_cache.enabled = False
+
+    client = EmbeddingClient()
+    client.client = genai.Client(api_key='stand-in-key', http_options={'base_url': base_url})
+    client.embedding_dimension = dimension
+    return client
+
+
+def run_sequential(client: EmbeddingClient, texts: list[str]) -> np.ndarray:
+    return np.vstack([client.embed_text(text) for text in texts])
+
+
+def run_batched(
+    client: EmbeddingClient,
+    texts: list[str],
+    batch_size: int,
+    max_concurrent_batches: int
+) -> np.ndarray:
+    client.settings.embeddings.batch_size = batch_size
+    client.settings.embeddings.max_concurrent_batches = max_concurrent_batches
+    return client.embed_texts(texts)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Embedding throughput benchmark')
+    parser.add_argument('--num-texts', type=int, default=1000)
+    parser.add_argument('--dimension', type=int, default=3072)
+    parser.add_argument('--latency-ms', type=float, default=80.0, help='Per-request latency')
+    parser.add_argument('--per-text-ms', type=float, default=0.5, help='Additional latency per text')
+    parser.add_argument('--skip-sequential', action='store_true')
+    args = parser.parse_args()
+
+    texts = [f'Sample chunk {i}: the parties agree to keep information confidential.' for i in range(args.num_texts)]
+    configs = [(100, 1), (100, 4), (100, 8), (50, 8)]
+
+    with StandInEmbeddingServer(
+        dimension=args.dimension,
+        request_latency_ms=args.latency_ms,
+        per_text_latency_ms=args.per_text_ms
+    ) as server:
+        client = build_client(server.base_url, args.dimension)
+        rows: list[tuple[str, float, int]] = []
+
+        if not args.skip_sequential:
+            requests_before = server.request_count
+            start = perf_counter()
+            run_sequential(client, texts)
+            rows.append(('per-text (baseline)', perf_counter() - start, server.request_count - requests_before))
+
+        for batch_size, concurrency in configs:
+            requests_before = server.request_count
+            start = perf_counter()
+            matrix = run_batched(client, texts, batch_size, concurrency)
+            elapsed = perf_counter() - start
+
+            assert matrix.shape == (len(texts), args.dimension)
+            rows.append((f'batch={batch_size} in_flight={concurrency}', elapsed, server.request_count - requests_before))
+
+    print(f'{"mode":<28}{"seconds":>10}{"texts/s":>12}{"requests":>10}')
+
+    for name, elapsed, requests in rows:
+        print(f'{name:<28}{elapsed:>10.2f}{len(texts) / elapsed:>12.1f}{requests:>10}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+'''
+Latency and recall@k of document-filtered search as the retriever runs it (FAISS ID
+selectors) against over-fetching and post-filtering, per share of the corpus allowed.
+
+Chunks get the same stable ids as at ingest, `--chunks-per-document` per document.
+Ground truth is exact search restricted to the allowed chunks. Subsets up to
+`--exact-filter-max-chunks` are scored exactly on flat and HNSW indexes, as in the
+retriever. Run from `projects/doc_query`:
+
+    python -m benchmarks.bench_filtered_search --num-vectors 100000 --dimension 768
+'''
+from __future__ import annotations
+
+import argparse
+from time import perf_counter
+
+import faiss
+import numpy as np
+
+from benchmarks.bench_ann import make_queries, synthetic_corpus
+from src.config import VectorIndexSettings
+from src.retrieval.filters import DocumentFilter
+from src.retrieval.index_factory import create_index, search_parameters, search_subset
+from src.utils.ids import make_faiss_id
+
+
+def build(corpus: np.ndarray, ids: np.ndarray, settings: VectorIndexSettings) -> faiss.Index:
+    sample_size = min(len(corpus), settings.train_sample_size)
+    index = create_index(corpus.shape[1], settings, num_train=sample_size)
+
+    if not index.is_trained:
+        index.train(corpus[np.random.default_rng(2).choice(len(corpus), sample_size, replace=False)])
+
+    index.add_with_ids(corpus, ids)
+    return index
+
+
+def measure(search, queries: np.ndarray, truth: list[set[int]], k: int) -> tuple[float, float]:
+    latencies = []
+    hits = 0
+
+    for query, expected in zip(queries, truth):
+        start = perf_counter()
+        found = search(query[np.newaxis, :], k)
+        latencies.append((perf_counter() - start) * 1000)
+        hits += len(set(found.tolist()) & expected)
+
+    return hits / sum(len(expected) for expected in truth), float(np.mean(latencies))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Filtered search report')
+    parser.add_argument('--num-vectors', type=int, default=100_000)
+    parser.add_argument('--dimension', type=int, default=768)
+    parser.add_argument('--chunks-per-document', type=int, default=100)
+    parser.add_argument('--num-queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--exact-filter-max-chunks', type=int, default=4096)
+    args = parser.parse_args()
+
+    corpus = synthetic_corpus(args.num_vectors, args.dimension)
+    queries = make_queries(corpus, min(args.num_queries, len(corpus)))
+    document_ids = [f'doc{i // args.chunks_per_document:08x}' for i in range(len(corpus))]
+    ids = np.array(
+        [make_faiss_id(document_id, i % args.chunks_per_document) for i, document_id in enumerate(document_ids)],
+        dtype=np.int64
+    )
+    order = np.argsort(ids)
+    all_documents = sorted(set(document_ids))
+    rng = np.random.default_rng(3)
+
+    print(f'corpus={len(corpus)} dim={args.dimension} documents={len(all_documents)} k={args.k}')
+    print(f'{"index":<10}{"allowed":>9}{"search":>14}{f"recall@{args.k}":>11}{"mean ms":>10}')
+
+    for settings in (
+        VectorIndexSettings(index_type='flat', exact_filter_max_chunks=args.exact_filter_max_chunks),
+        VectorIndexSettings(index_type='ivf_flat', nprobe=16),
+        VectorIndexSettings(index_type='hnsw', ef_search=64, exact_filter_max_chunks=args.exact_filter_max_chunks)
+    ):
+        index = build(corpus, ids, settings)
+
+        for share in (0.001, 0.01, 0.1, 1.0):
+            allowed = rng.choice(all_documents, max(1, round(share * len(all_documents))), replace=False)
+            document_filter = DocumentFilter.build(set(allowed.tolist()), ids[order], order)
+
+            subset = faiss.IndexFlatIP(args.dimension)
+            subset.add(corpus[document_filter.row_mask])
+            _, subset_truth = subset.search(queries, args.k)
+            subset_ids = ids[document_filter.row_mask]
+            truth = [set(subset_ids[row[row >= 0]].tolist()) for row in subset_truth]
+
+            params = search_parameters(index, document_filter.id_selector(), document_filter.size / len(corpus))
+            exact_subset = document_filter.size <= settings.exact_filter_max_chunks and isinstance(index, faiss.IndexIDMap2)
+            allowed_ids = set(document_filter.ids.tolist())
+            over_fetch = min(index.ntotal, int(np.ceil(args.k / max(document_filter.size / len(corpus), 1e-9))))
+
+            # Mirrors `IndexSnapshot.search_many`
+            def filtered_search(query: np.ndarray, k: int) -> np.ndarray:
+                if exact_subset:
+                    return search_subset(index, query, k, document_filter.ids)[1][0]
+
+                if document_filter.size == index.ntotal:
+                    return index.search(query, k)[1][0]
+
+                return index.search(query, k, params=params)[1][0]
+
+            def post_filter_search(query: np.ndarray, k: int) -> np.ndarray:
+                found = index.search(query, over_fetch)[1][0]
+                return np.array([i for i in found if i in allowed_ids][:k], dtype=np.int64)
+
+            for name, search in (('filtered', filtered_search), ('post-filter', post_filter_search)):
+                recall, mean_ms = measure(search, queries, truth, args.k)
+                print(f'{settings.index_type:<10}{share:>9.1%}{name:>14}{recall:>11.3f}{mean_ms:>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+'''
+Query latency of one index against the same vectors split over N shards, searched in
+parallel and merged with a heap, as `ShardedSnapshot` does.
+
+Shards are flat in-memory indexes over a synthetic corpus; chunk ids are spread over
+documents so the partition matches ingest. Run from `projects/doc_query`:
+
+    python -m benchmarks.bench_sharded_search --num-vectors 200000 --dimension 768
+'''
+from __future__ import annotations
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+import faiss
+import numpy as np
+
+from benchmarks.bench_ann import make_queries, synthetic_corpus
+from src.retrieval.compression import VectorEncoding
+from src.retrieval.sharded_store import ShardedSnapshot
+from src.retrieval.vector_store import IndexSnapshot
+from src.utils.ids import make_faiss_id, shard_for_faiss_id
+
+
+def make_snapshot(corpus: np.ndarray, ids: np.ndarray) -> IndexSnapshot:
+    index = faiss.IndexIDMap2(faiss.IndexFlatIP(corpus.shape[1]))
+    index.add_with_ids(corpus, ids)
+
+    return IndexSnapshot(index, {}, None, None, VectorEncoding(corpus.shape[1], corpus.shape[1]))
+
+
+def measure(search, queries: np.ndarray, k: int) -> tuple[float, float, np.ndarray]:
+    latencies = []
+    found = []
+
+    for query in queries:
+        start = perf_counter()
+        _, ids = search(query, k)
+        latencies.append((perf_counter() - start) * 1000)
+        found.append(ids[0])
+
+    return float(np.mean(latencies)), float(np.percentile(latencies, 95)), np.array(found)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Sharded search report')
+    parser.add_argument('--num-vectors', type=int, default=200_000)
+    parser.add_argument('--dimension', type=int, default=768)
+    parser.add_argument('--chunks-per-document', type=int, default=50)
+    parser.add_argument('--num-queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+
+    corpus = synthetic_corpus(args.num_vectors, args.dimension)
+    queries = make_queries(corpus, min(args.num_queries, len(corpus)))
+    ids = np.array(
+        [
+            make_faiss_id(f'doc{i // args.chunks_per_document:08x}', i % args.chunks_per_document)
+            for i in range(len(corpus))
+        ],
+        dtype=np.int64
+    )
+
+    single = make_snapshot(corpus, ids)
+    baseline_mean, baseline_p95, truth = measure(single.search, queries, args.k)
+
+    print(f'corpus={len(corpus)} dim={args.dimension} queries={len(queries)} k={args.k}')
+    print(f'{"shards":>6}{"threads":>9}{"mean ms":>10}{"p95 ms":>9}{"same top-k":>12}')
+    print(f'{1:>6}{"-":>9}{baseline_mean:>10.3f}{baseline_p95:>9.3f}{"-":>12}')
+
+    for num_shards in (2, 4, 8):
+        owners = shard_for_faiss_id(ids, num_shards)
+        shards = tuple(make_snapshot(corpus[owners == i], ids[owners == i]) for i in range(num_shards))
+
+        for threads in sorted({1, num_shards}):
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                sharded = ShardedSnapshot(shards, executor)
+                mean_ms, p95_ms, found = measure(sharded.search, queries, args.k)
+
+            same = np.mean([set(a.tolist()) == set(b.tolist()) for a, b in zip(found, truth)])
+            print(f'{num_shards:>6}{threads:>9}{mean_ms:>10.3f}{p95_ms:>9.3f}{same:>12.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+'''
+Peak RSS of materialized vs streaming indexing for growing corpus sizes.
+
+Each (mode, size) pair runs in a fresh subprocess so `ru_maxrss` is not shared.
+Embeddings come from a local random stand-in, and the vector dimension defaults to
+64 so that the FAISS index itself (which must hold every vector) stays small next to
+the pipeline overhead being measured. Run from `projects/doc_query`:
+
+    python -m benchmarks.bench_streaming_memory --sizes 10000 100000 1000000
+'''
+from __future__ import annotations
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+from typing import Iterator
+
+import numpy as np
+
+from src.config import get_settings
+from src.ingest.streaming import index_chunk_stream
+from src.models.chunk import ChunkRecord
+from src.retrieval.vector_store import FaissVectorStore
+
+CHUNK_TEXT = (
+    'Each party shall hold the Confidential Information of the other party in strict '
+    'confidence and shall not disclose it to any third party without prior written consent. '
+) * 5
+
+
+def iter_synthetic_chunks(count: int) -> Iterator[ChunkRecord]:
+    for i in range(count):
+        document_id = f'doc{i // 100:08x}'
+
+        yield ChunkRecord(
+            chunk_id=f'{document_id}_chunk_{i % 100:04d}',
+            document_id=document_id,
+            filename=f'{document_id}.pdf',
+            text=f'{i} {CHUNK_TEXT}',
+            chunk_index=i % 100,
+            page_number=1,
+            metadata={'chunk_index': i % 100, 'page': 1, 'doc_id': document_id}
+        )
+
+
+def make_embedder(dimension: int):
+    rng = np.random.default_rng(0)
+
+    def embed_texts(texts: list[str]) -> np.ndarray:
+        vectors = rng.standard_normal((len(texts), dimension)).astype(np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    return embed_texts
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_worker(mode: str, size: int, dimension: int, batch_size: int) -> dict:
+    settings = get_settings()
+    workdir = Path(tempfile.mkdtemp(prefix='docquery-bench-'))
+    settings.paths.faiss_index_path = workdir / 'faiss.index'
+    settings.paths.index_metadata_path = workdir / 'index_metadata.json'
+    settings.paths.bm25_index_path = workdir / 'bm25.npz'
+    settings.paths.binary_index_path = workdir / 'binary.index'
+    settings.paths.rescore_vectors_path = workdir / 'rescore_vectors.f32'
+    settings.models.embedding_dimension = dimension
+
+    store = FaissVectorStore()
+    embed_texts = make_embedder(dimension)
+    baseline_mb = peak_rss_mb()
+    start = perf_counter()
+
+    if mode == 'materialized':
+        chunks = list(iter_synthetic_chunks(size))
+        texts = [chunk.text for chunk in chunks]
+        embeddings = embed_texts(texts)
+        store.rebuild(chunks, embeddings)
+    else:
+        with store.open_writer(rebuild=True) as writer:
+            index_chunk_stream(
+                iter_synthetic_chunks(size),
+                embed_texts=embed_texts,
+                writer=writer,
+                batch_size=batch_size,
+                queue_size=4
+            )
+            writer.commit()
+
+    elapsed = perf_counter() - start
+    peak_mb = peak_rss_mb()
+
+    return {
+        'mode': mode,
+        'chunks': size,
+        'seconds': elapsed,
+        'peak_rss_mb': peak_mb,
+        'pipeline_rss_mb': peak_mb - baseline_mb,
+        'index_vectors_mb': size * dimension * 4 / (1024 * 1024)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Streaming ingest peak-memory benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--modes', nargs='+', default=['materialized', 'streaming'])
+    parser.add_argument('--dimension', type=int, default=64)
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--worker', nargs=2, metavar=('MODE', 'SIZE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        mode, size = args.worker
+        print(json.dumps(run_worker(mode, int(size), args.dimension, args.batch_size)))
+        return
+
+    print(f'{"mode":<14}{"chunks":>10}{"seconds":>10}{"peak MB":>10}{"pipeline MB":>13}{"vectors MB":>12}')
+
+    for size in args.sizes:
+        for mode in args.modes:
+            completed = subprocess.run(
+                [
+                    sys.executable, '-m', 'benchmarks.bench_streaming_memory',
+                    '--worker', mode, str(size),
+                    '--dimension', str(args.dimension),
+                    '--batch-size', str(args.batch_size)
+                ],
+                capture_output=True,
+                text=True,
+                check=True
+            )
+            row = json.loads(completed.stdout.strip().splitlines()[-1])
+
+            print(
+                f'{row["mode"]:<14}{row["chunks"]:>10}{row["seconds"]:>10.1f}{row["peak_rss_mb"]:>10.0f}'
+                f'{row["pipeline_rss_mb"]:>13.0f}{row["index_vectors_mb"]:>12.0f}'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+class StandInHTTPServer(ThreadingHTTPServer):
+    # Load tests open hundreds of connections at once
+    request_queue_size = 1024
+
+
+class StandInEmbeddingServer:
+    '''
+    Local stand-in for the Gemini `batchEmbedContents` endpoint.
+
+    Every request sleeps for `request_latency_ms` plus `per_text_latency_ms` per text,
+    then returns random unit vectors, so client-side batching and concurrency can be
+    measured without network access or API quota. `generateContent` requests sleep for
+    `generation_latency_ms` plus `prompt_token_latency_ms` per prompt token (about four
+    characters) and return a fixed grounded answer in the prompt's JSON format.
+    '''
+
+    def __init__(
+        self,
+        dimension: int,
+        request_latency_ms: float = 80.0,
+        per_text_latency_ms: float = 0.5,
+        fail_every: int = 0,
+        generation_latency_ms: float = 800.0,
+        prompt_token_latency_ms: float = 0.0
+    ) -> None:
+        self.dimension = dimension
+        self.request_latency_ms = request_latency_ms
+        self.per_text_latency_ms = per_text_latency_ms
+        self.fail_every = fail_every
+        self.generation_latency_ms = generation_latency_ms
+        self.prompt_token_latency_ms = prompt_token_latency_ms
+        self.request_count = 0
+        self.text_count = 0
+        self._lock = threading.Lock()
+        self._server: StandInHTTPServer | None = None
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        assert self._server is not None
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'StandInEmbeddingServer':
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:
+                length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(length) or b'{}')
+
+                if ':generateContent' in self.path or ':streamGenerateContent' in self.path:
+                    self._generate(body, stream=':streamGenerateContent' in self.path)
+                    return
+
+                requests = body.get('requests', [])
+
+                with server._lock:
+                    server.request_count += 1
+                    server.text_count += len(requests)
+                    request_number = server.request_count
+
+                time.sleep((server.request_latency_ms + server.per_text_latency_ms * len(requests)) / 1000)
+
+                if server.fail_every and request_number % server.fail_every == 0:
+                    self._send(503, {'error': {'code': 503, 'message': 'stand-in overload', 'status': 'UNAVAILABLE'}})
+                    return
+
+                vectors = np.random.default_rng(request_number).standard_normal(
+                    (len(requests), server.dimension)
+                ).astype(np.float32)
+
+                self._send(200, {'embeddings': [{'values': row.tolist()} for row in vectors]})
+
+            def _generate(self, body: dict, stream: bool) -> None:
+                answer = json.dumps({
+                    'answer': 'The stand-in answer, supported by the first chunk.',
+                    'grounded': True,
+                    'used_chunk_ranks': [1],
+                    'reason_if_unanswered': None
+                })
+
+                prompt_chars = sum(
+                    len(part.get('text', ''))
+                    for content in body.get('contents', [])
+                    for part in content.get('parts', [])
+                )
+                latency_ms = server.generation_latency_ms + server.prompt_token_latency_ms * prompt_chars / 4
+
+                if not stream:
+                    time.sleep(latency_ms / 1000)
+                    self._send(200, self._candidate(answer))
+                    return
+
+                # Server-sent events, one per slice of the reply, spread over the latency
+                pieces = [answer[i:i + 16] for i in range(0, len(answer), 16)]
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.end_headers()
+
+                for piece in pieces:
+                    time.sleep(latency_ms / 1000 / len(pieces))
+                    self.wfile.write(f'data: {json.dumps(self._candidate(piece))}\r\n\r\n'.encode('utf-8'))
+                    self.wfile.flush()
+
+            @staticmethod
+            def _candidate(text: str) -> dict:
+                return {'candidates': [{'content': {'role': 'model', 'parts': [{'text': text}]}, 'finishReason': 'STOP'}]}
+
+            def _send(self, status: int, payload: dict) -> None:
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format: str, *args) -> None:
+                return
+
+        self._server = StandInHTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> 'StandInEmbeddingServer':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
@@ -1,5 +1,6 @@
 from functools import lru_cache
 from pathlib import Path
+from typing import Literal
 
 from pydantic import BaseModel, Field, field_validator, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -28,6 +29,10 @@ class PathSettings(BaseModel):
     eval_dir: Path = EVAL_DIR
     faiss_index_path: Path = INDEX_DIR / 'faiss.index'
     index_metadata_path: Path = INDEX_DIR / 'index_metadata.json'
+    embedding_cache_dir: Path = INDEX_DIR / 'embedding_cache'
+    binary_index_path: Path = INDEX_DIR / 'binary.index'
+    rescore_vectors_path: Path = INDEX_DIR / 'rescore_vectors.f32'
+    bm25_index_path: Path = INDEX_DIR / 'bm25.npz'
 
 
 class ChunkingSettings(BaseModel):
@@ -41,11 +46,27 @@ class ChunkingSettings(BaseModel):
             raise ValueError('`chunk_overlap` mut be small than `chunk_size`')
         return self
     
+class IngestSettings(BaseModel):
+    max_workers: int = Field(default=1, ge=1)
+    streaming: bool = False
+    stream_batch_size: int = Field(default=256, ge=1)
+    stream_queue_size: int = Field(default=4, ge=1)
+
+
 class RetrievalSettings(BaseModel):
     default_initial_top_k: int = Field(default=10, ge=1)
     default_final_top_k: int = Field(default=4, ge=1)
     max_top_k: int = Field(default=10, ge=1)
     min_similarity_threshold: float = Field(default=0.25, ge=0.0, le=1.0)
+    adaptive_top_k: bool = False
+    adaptive_drop_off: float = Field(default=0.1, gt=0.0, le=1.0)
+    hybrid: bool = False
+    bm25_top_k: int = Field(default=10, ge=1)
+    bm25_k1: float = Field(default=1.2, ge=0.0)
+    bm25_b: float = Field(default=0.75, ge=0.0, le=1.0)
+    rrf_k: int = Field(default=60, ge=1)
+    neighbor_window: int = Field(default=1, ge=0)
+    max_context_chars: int | None = Field(default=None, ge=1)
 
     @model_validator(mode='after')
     def validate_retrieval(self) -> 'RetrievalSettings':
@@ -54,6 +75,36 @@ class RetrievalSettings(BaseModel):
         
         return self
     
+class VectorIndexSettings(BaseModel):
+    index_type: Literal['flat', 'ivf_flat', 'ivf_pq', 'hnsw'] = 'flat'
+    nlist: int = Field(default=1024, ge=1)
+    nprobe: int = Field(default=16, ge=1)
+    pq_m: int = Field(default=64, ge=1)
+    pq_nbits: int = Field(default=8, ge=1, le=16)
+    hnsw_m: int = Field(default=32, ge=2)
+    ef_construction: int = Field(default=200, ge=1)
+    ef_search: int = Field(default=128, ge=1)
+    train_sample_size: int = Field(default=50_000, ge=1)
+    quantization: Literal['none', 'float16', 'int8'] = 'none'
+    truncate_dimension: int | None = Field(default=None, ge=1)
+    binary_first_pass: bool = False
+    rescore_multiplier: int = Field(default=16, ge=1)
+    exact_filter_max_chunks: int = Field(default=4096, ge=0)
+    num_shards: int = Field(default=1, ge=1)
+    search_threads: int | None = Field(default=None, ge=1)
+    # Opt-in: query snapshots map the index file instead of loading a private copy
+    mmap: bool = False
+
+    @model_validator(mode='after')
+    def validate_binary_first_pass(self) -> 'VectorIndexSettings':
+        # Binary first pass rescores float32 vectors and leaves the dense index empty, so
+        # its storage options would silently do nothing; `truncate_dimension` still applies
+        if self.binary_first_pass and (self.quantization != 'none' or self.index_type != 'flat'):
+            raise ValueError('`binary_first_pass` requires `quantization=none` and `index_type=flat`')
+
+        return self
+
+
 class ModelSettings(BaseModel):
     generation_model: str = 'gemini-2.5-flash'
     embedding_model: str = 'gemini-embedding-001'
@@ -61,9 +112,47 @@ class ModelSettings(BaseModel):
     api_key_env_var: str = 'GEMINI_API_KEY'
 
 
+class EmbeddingSettings(BaseModel):
+    batch_size: int = Field(default=100, ge=1, le=100)
+    max_concurrent_batches: int = Field(default=4, ge=1)
+    requests_per_minute: int | None = Field(default=None, ge=1)
+    max_retries: int = Field(default=3, ge=0)
+
+
+class EmbeddingCacheSettings(BaseModel):
+    enabled: bool = True
+    max_entries: int = Field(default=100_000, ge=1)
+    dtype: Literal['float32', 'float16'] = 'float32'
+
+
+class QueryEmbeddingCacheSettings(BaseModel):
+    enabled: bool = True
+    max_entries: int = Field(default=1024, ge=1)
+    ttl_seconds: float | None = Field(default=3600.0, gt=0)
+    disk_tier: bool = True
+    disk_flush_seconds: float = Field(default=30.0, ge=0)
+
+
+class AnswerCacheSettings(BaseModel):
+    enabled: bool = False
+    similarity_threshold: float = Field(default=0.92, ge=0.0, le=1.0)
+    max_entries: int = Field(default=1000, ge=1)
+    ttl_seconds: float | None = Field(default=None, gt=0)
+
+
+class ConcurrencySettings(BaseModel):
+    cpu_workers: int = Field(default=4, ge=1)
+
+
 class PromptSettings(BaseModel):
     prompt_version: str = 'v1'
     max_context_chunks: int = Field(default=5, ge=1)
+    # Opt-in: fit the context into `max_context_tokens` and `max_context_chunks` blocks
+    pack_context: bool = False
+    max_context_tokens: int | None = Field(default=2000, ge=1)
+    compress_context: bool = False
+    compression_max_sentences: int = Field(default=3, ge=1)
+    compression_neighbor_sentences: int = Field(default=1, ge=0)
 
 
 class Settings(BaseSettings):
@@ -77,8 +166,15 @@ class Settings(BaseSettings):
     app: AppSettings = AppSettings()
     paths: PathSettings = PathSettings()
     chunking: ChunkingSettings = ChunkingSettings()
+    ingest: IngestSettings = IngestSettings()
     retrieval: RetrievalSettings = RetrievalSettings()
+    vector_index: VectorIndexSettings = VectorIndexSettings()
     models: ModelSettings = ModelSettings()
+    embeddings: EmbeddingSettings = EmbeddingSettings()
+    embedding_cache: EmbeddingCacheSettings = EmbeddingCacheSettings()
+    query_embedding_cache: QueryEmbeddingCacheSettings = QueryEmbeddingCacheSettings()
+    answer_cache: AnswerCacheSettings = AnswerCacheSettings()
+    concurrency: ConcurrencySettings = ConcurrencySettings()
     prompts: PromptSettings = PromptSettings()
 
     @field_validator('app')
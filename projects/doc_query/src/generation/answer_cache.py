@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass
+from time import monotonic
+
+import faiss
+import numpy as np
+
+from src.schemas.query import QueryResponse
+
+# Nearest past questions checked for one with the same request parameters
+LOOKUP_CANDIDATES = 8
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    signature: str
+    response: QueryResponse
+    expires_at: float
+    last_used: float
+
+
+class SemanticAnswerCache:
+    '''
+    Past answers looked up by question embedding.
+
+    Questions live in a small exact inner-product index; a new question is served from
+    the cache when a past one with the same request parameters (`signature`) is within
+    `similarity_threshold`. Every index commit gets a new version, and answers computed
+    against another version are dropped as soon as it is seen.
+    '''
+
+    def __init__(
+        self,
+        dimension: int,
+        similarity_threshold: float,
+        max_entries: int,
+        ttl_seconds: float | None = None
+    ) -> None:
+        self.dimension = dimension
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        self._lock = threading.Lock()
+        self._version: str | None = None
+        self._next_id = 0
+        self._reset()
+
+
+    def lookup(
+        self,
+        query_vector: np.ndarray,
+        signature: str,
+        version: str | None
+    ) -> tuple[CachedAnswer, float] | None:
+        with self._lock:
+            self._check_version(version)
+
+            if self._index.ntotal == 0:
+                self.misses += 1
+                return None
+
+            similarities, ids = self._index.search(
+                np.ascontiguousarray(query_vector[np.newaxis, :], dtype=np.float32),
+                min(LOOKUP_CANDIDATES, self._index.ntotal)
+            )
+            now = monotonic()
+
+            for similarity, entry_id in zip(similarities[0], ids[0]):
+                if similarity < self.similarity_threshold:
+                    break
+
+                entry = self._entries.get(int(entry_id))
+
+                if entry is None or entry.signature != signature:
+                    continue
+
+                if entry.expires_at <= now:
+                    self._remove([int(entry_id)])
+                    continue
+
+                entry.last_used = now
+                self.hits += 1
+                return entry, float(similarity)
+
+            self.misses += 1
+            return None
+
+
+    def store(
+        self,
+        query_vector: np.ndarray,
+        question: str,
+        signature: str,
+        version: str | None,
+        response: QueryResponse
+    ) -> None:
+        with self._lock:
+            self._check_version(version)
+
+            if len(self._entries) >= self.max_entries:
+                # Least recently used first
+                victims = sorted(self._entries, key=lambda entry_id: self._entries[entry_id].last_used)
+                self._remove(victims[:len(self._entries) - self.max_entries + 1])
+
+            now = monotonic()
+            entry_id = self._next_id
+            self._next_id += 1
+
+            self._index.add_with_ids(
+                np.ascontiguousarray(query_vector[np.newaxis, :], dtype=np.float32),
+                np.array([entry_id], dtype=np.int64)
+            )
+            self._entries[entry_id] = CachedAnswer(
+                question=question,
+                signature=signature,
+                response=response,
+                expires_at=now + self.ttl_seconds if self.ttl_seconds is not None else float('inf'),
+                last_used=now
+            )
+
+
+    def stats(self) -> dict[str, float | int]:
+        with self._lock:
+            lookups = self.hits + self.misses
+
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+    def _check_version(self, version: str | None) -> None:
+        if version == self._version:
+            return
+
+        if self._entries:
+            self.invalidations += 1
+
+        self._version = version
+        self._reset()
+
+
+    def _reset(self) -> None:
+        self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(self.dimension))
+        self._entries: dict[int, CachedAnswer] = {}
+
+
+    def _remove(self, entry_ids: list[int]) -> None:
+        self._index.remove_ids(np.array(entry_ids, dtype=np.int64))
+
+        for entry_id in entry_ids:
+            del self._entries[entry_id]
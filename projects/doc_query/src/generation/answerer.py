@@ -2,18 +2,23 @@ from __future__ import annotations
 
 import os
 from time import perf_counter
+from types import SimpleNamespace
+from typing import AsyncIterator, Callable, Iterator
 
 from google import genai
 
 from src.config import get_settings
 from src.generation.guardrails import extract_json_object, validate_generation_payload
 from src.generation.prompts import build_grounded_prompt
+from src.generation.response_cache import ResponseStore, response_cache_key
+from src.generation.streaming import AnswerTextExtractor
 from src.models.query import AnswerRecord
 from src.models.retrieval import RetrievedChunk
+from src.utils.executors import run_blocking
 
 
 class Answerer:
-    def __init__(self) -> None:
+    def __init__(self, response_cache: ResponseStore | None = None) -> None:
         self.settings = get_settings()
         api_key = os.getenv(self.settings.models.api_key_env_var)
 
@@ -25,47 +30,239 @@ class Answerer:
         self.client = genai.Client(api_key=api_key)
         self.model_name = self.settings.models.generation_model
 
+        # Identical prompts (eval reruns, repeated questions) are answered from the
+        # response cache, when one is given; only replies that parse and validate are stored
+        self.response_cache = response_cache
+
     def answer(
         self,
         question: str,
         retrieved_chunks: list[RetrievedChunk]
     ) -> tuple[AnswerRecord, list[int]]:
+        if not retrieved_chunks:
+            return self.refuse(question), []
+
         start_time = perf_counter()
+        prompt, cache_key, cached = self._lookup(question, retrieved_chunks)
+
+        if cached is not None:
+            return parse_answer(question, retrieved_chunks, cached, start_time)
+
+        response = self.client.models.generate_content(
+            model=self.model_name,
+            contents=prompt
+        )
+
+        return self._complete(question, retrieved_chunks, response.text or '', start_time, cache_key)
+
 
+    async def answer_async(
+        self,
+        question: str,
+        retrieved_chunks: list[RetrievedChunk]
+    ) -> tuple[AnswerRecord, list[int]]:
+        # `answer` on the async client; the response cache is read and written on the blocking executor
         if not retrieved_chunks:
-            latency_ms = (perf_counter() - start_time) * 1000
-            answer_record = AnswerRecord(
-                question=question,
-                answer='I could not find enough support in the indexed documents to answer that confidently',
-                grounded=False,
-                citations=[],
-                reason_if_unanswered='insufficient_evidence',
-                retrieved_chunks=[],
-                latency_ms=latency_ms
-            )
+            return self.refuse(question), []
 
-            return answer_record, []
-        
-        prompt = build_grounded_prompt(question, retrieved_chunks)
+        start_time = perf_counter()
+        prompt, cache_key, cached = await run_blocking(self._lookup, question, retrieved_chunks)
 
-        response = self.client.models.generate_content(
+        if cached is not None:
+            return parse_answer(question, retrieved_chunks, cached, start_time)
+
+        response = await self.client.aio.models.generate_content(
             model=self.model_name,
             contents=prompt
         )
 
-        raw_text = response.text or ''
-        payload = validate_generation_payload(extract_json_object(raw_text))
+        return await run_blocking(self._complete, question, retrieved_chunks, response.text or '', start_time, cache_key)
+
+
+    def answer_stream(self, question: str, retrieved_chunks: list[RetrievedChunk]) -> 'AnswerStream':
+        '''
+        `answer` with the answer text streamed as it is generated. Needs retrieved chunks;
+        without them, `refuse` answers without a model call.
+        '''
+        prompt, cache_key, cached = self._lookup(question, retrieved_chunks)
+
+        if cached is not None:
+            return AnswerStream(question, retrieved_chunks, iter([SimpleNamespace(text=cached)]))
+
+        responses = self.client.models.generate_content_stream(
+            model=self.model_name,
+            contents=prompt
+        )
+
+        return self._stream(question, retrieved_chunks, responses, cache_key)
+
+
+    async def answer_stream_async(self, question: str, retrieved_chunks: list[RetrievedChunk]) -> 'AnswerStream':
+        # Iterate over the result with `async for`
+        prompt, cache_key, cached = await run_blocking(self._lookup, question, retrieved_chunks)
+
+        if cached is not None:
+            return AnswerStream(question, retrieved_chunks, _replay(cached))
+
+        responses = await self.client.aio.models.generate_content_stream(
+            model=self.model_name,
+            contents=prompt
+        )
+
+        return self._stream(question, retrieved_chunks, responses, cache_key)
+
+
+    def _lookup(self, question: str, retrieved_chunks: list[RetrievedChunk]) -> tuple[str, str | None, str | None]:
+        # The grounded prompt, its response cache key and the cached reply, if any
+        prompt = build_grounded_prompt(question, retrieved_chunks)
+        cache_key = self._cache_key(prompt)
+        cached = self.response_cache.get(cache_key) if cache_key is not None else None
+
+        return prompt, cache_key, cached
+
+
+    def _complete(
+        self,
+        question: str,
+        retrieved_chunks: list[RetrievedChunk],
+        raw_text: str,
+        start_time: float,
+        cache_key: str | None
+    ) -> tuple[AnswerRecord, list[int]]:
+        # Parsed first, so a reply that fails validation is never cached
+        result = parse_answer(question, retrieved_chunks, raw_text, start_time)
+        self._store(cache_key, raw_text)
+
+        return result
+
+
+    def _stream(
+        self,
+        question: str,
+        retrieved_chunks: list[RetrievedChunk],
+        responses: Iterator | AsyncIterator,
+        cache_key: str | None
+    ) -> 'AnswerStream':
+        return AnswerStream(question, retrieved_chunks, responses, on_complete=lambda raw: self._store(cache_key, raw))
+
+
+    def _cache_key(self, prompt: str) -> str | None:
+        if self.response_cache is None:
+            return None
+
+        return response_cache_key('gemini', self.model_name, prompt)
 
-        latency_ms = (perf_counter() - start_time) * 1000
 
-        answer_record = AnswerRecord(
+    def _store(self, cache_key: str | None, raw_text: str) -> None:
+        if cache_key is not None and raw_text:
+            self.response_cache.put(cache_key, raw_text, provider='gemini', model=self.model_name)
+
+
+    def refuse(self, question: str) -> AnswerRecord:
+        # Answer without calling the model when there is no context to ground it in
+        return AnswerRecord(
             question=question,
-            answer=payload['answer'].strip(),
-            grounded=payload['grounded'],
+            answer='I could not find enough support in the indexed documents to answer that confidently',
+            grounded=False,
             citations=[],
-            reason_if_unanswered=payload['reason_if_unanswered'],
-            retrieved_chunks=retrieved_chunks,
-            latency_ms=latency_ms
+            reason_if_unanswered='insufficient_evidence',
+            retrieved_chunks=[],
+            latency_ms=0.0
         )
 
-        return answer_record, payload['used_chunk_ranks']
\ No newline at end of file
+
+class AnswerStream:
+    '''
+    Iterates over the answer text as the model streams it, with `for` or, over the async
+    client's stream, `async for`. Once iteration ends, `record` and `used_chunk_ranks`
+    hold the validated answer, as `Answerer.answer` returns them.
+    '''
+
+    def __init__(
+        self,
+        question: str,
+        retrieved_chunks: list[RetrievedChunk],
+        responses: Iterator | AsyncIterator,
+        on_complete: Callable[[str], None] | None = None
+    ) -> None:
+        self.question = question
+        self.retrieved_chunks = retrieved_chunks
+        self.record: AnswerRecord | None = None
+        self.used_chunk_ranks: list[int] = []
+        self._responses = responses
+        self._on_complete = on_complete
+
+
+    def __iter__(self) -> Iterator[str]:
+        start_time = perf_counter()
+        extractor = AnswerTextExtractor()
+
+        for response in self._responses:
+            delta = extractor.feed(response.text or '')
+
+            if delta:
+                yield delta
+
+        remainder = self._complete(extractor, start_time)
+
+        if remainder:
+            yield remainder
+
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        start_time = perf_counter()
+        extractor = AnswerTextExtractor()
+
+        async for response in self._responses:
+            delta = extractor.feed(response.text or '')
+
+            if delta:
+                yield delta
+
+        remainder = self._complete(extractor, start_time)
+
+        if remainder:
+            yield remainder
+
+
+    def _complete(self, extractor: AnswerTextExtractor, start_time: float) -> str:
+        self.record, self.used_chunk_ranks = parse_answer(
+            self.question,
+            self.retrieved_chunks,
+            extractor.text,
+            start_time
+        )
+
+        if self._on_complete is not None:
+            self._on_complete(extractor.text)
+
+        # The answer could not be followed while streaming (unexpected layout): send it whole
+        return '' if extractor.answer else self.record.answer
+
+
+async def _replay(text: str) -> AsyncIterator[SimpleNamespace]:
+    # A cached reply in the shape of a one-chunk stream
+    yield SimpleNamespace(text=text)
+
+
+def parse_answer(
+    question: str,
+    retrieved_chunks: list[RetrievedChunk],
+    raw_text: str,
+    start_time: float
+) -> tuple[AnswerRecord, list[int]]:
+    payload = validate_generation_payload(extract_json_object(raw_text))
+
+    latency_ms = (perf_counter() - start_time) * 1000
+
+    answer_record = AnswerRecord(
+        question=question,
+        answer=payload['answer'].strip(),
+        grounded=payload['grounded'],
+        citations=[],
+        reason_if_unanswered=payload['reason_if_unanswered'],
+        retrieved_chunks=retrieved_chunks,
+        latency_ms=latency_ms
+    )
+
+    return answer_record, payload['used_chunk_ranks']
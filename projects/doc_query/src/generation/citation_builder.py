@@ -21,16 +21,28 @@ def build_citations(
         if chunk is None:
             continue
 
-        citations.append(
-            CitationRecord(
-                chunk_id=chunk.chunk_id,
-                filename=chunk.filename,
-                page_number=chunk.page_number,
-                section_title=chunk.section_title,
-                snippet=chunk.text[:snippet_length].strip(),
-                rank=chunk.rank
+        # A packed block cites every chunk merged into it, each with its own snippet
+        parts = chunk.metadata.get('merged_chunks') or [{
+            'chunk_id': chunk.chunk_id,
+            'page_number': chunk.page_number,
+            'section_title': chunk.section_title,
+            'start': 0,
+            'end': len(chunk.text)
+        }]
+
+        for part in parts:
+            end = min(part['end'], part['start'] + snippet_length)
+
+            citations.append(
+                CitationRecord(
+                    chunk_id=part['chunk_id'],
+                    filename=chunk.filename,
+                    page_number=part['page_number'],
+                    section_title=part['section_title'],
+                    snippet=chunk.text[part['start']:end].strip(),
+                    rank=chunk.rank
+                )
             )
-        )
 
     # Deduplicate while preserving order
     seen: set[str] = set()
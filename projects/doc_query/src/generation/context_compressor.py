@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Any
+
+from src.generation.context_packer import estimate_tokens
+from src.generation.prompts import format_context
+from src.models.retrieval import RetrievedChunk
+from src.retrieval.reranker import exact_match_score, tokenize
+
+# Sentence ends followed by whitespace, and line breaks
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+|\s*\n\s*')
+
+# Marks the places where sentences were left out
+GAP = ' ... '
+
+
+def split_sentences(text: str) -> list[str]:
+    return [sentence for sentence in SENTENCE_BOUNDARY.split(text) if sentence]
+
+
+@dataclass
+class ContextCompression:
+    chunks: list[RetrievedChunk]
+    sentences: int
+    kept_sentences: int
+    compressed_chunks: int
+    tokens_before: int
+    tokens_after: int
+
+    def trace(self) -> dict[str, Any]:
+        return {
+            'sentences': self.sentences,
+            'kept_sentences': self.kept_sentences,
+            'compressed_chunks': self.compressed_chunks,
+            'tokens_before': self.tokens_before,
+            'tokens_after': self.tokens_after
+        }
+
+
+def compress_context(
+    question: str,
+    chunks: list[RetrievedChunk],
+    max_sentences: int = 3,
+    neighbor_sentences: int = 1
+) -> ContextCompression:
+    '''
+    Query-focused extractive compression of the context chunks.
+
+    Each chunk keeps its `max_sentences` best sentences by query term overlap and phrase
+    match, each with `neighbor_sentences` on either side, in their original order. A chunk
+    with no sentence matching the question lexically was retrieved on meaning alone and is
+    kept whole. Chunk ids and ranks are unchanged, so citations still resolve.
+    '''
+    query_tokens = set(tokenize(question))
+    compressed: list[RetrievedChunk] = []
+    total_sentences = 0
+    kept_sentences = 0
+    compressed_chunks = 0
+
+    for chunk in chunks:
+        sentences = split_sentences(chunk.text)
+        total_sentences += len(sentences)
+
+        scores = [_sentence_score(question, query_tokens, sentence) for sentence in sentences]
+        best = [i for i in sorted(range(len(sentences)), key=lambda i: -scores[i])[:max_sentences] if scores[i] > 0]
+
+        keep = sorted({
+            j
+            for i in best
+            for j in range(max(0, i - neighbor_sentences), min(len(sentences), i + neighbor_sentences + 1))
+        })
+
+        if not best or len(keep) == len(sentences):
+            kept_sentences += len(sentences)
+            compressed.append(chunk)
+            continue
+
+        parts: list[str] = []
+
+        for position, i in enumerate(keep):
+            if position and i != keep[position - 1] + 1:
+                parts.append(GAP)
+            elif position:
+                parts.append(' ')
+
+            parts.append(sentences[i])
+
+        text = ''.join(parts)
+
+        if keep[0] > 0:
+            text = GAP.lstrip() + text
+
+        if keep[-1] < len(sentences) - 1:
+            text += GAP.rstrip()
+
+        kept_sentences += len(keep)
+        compressed_chunks += 1
+        compressed.append(chunk.model_copy(update={'text': text}))
+
+    return ContextCompression(
+        chunks=compressed,
+        sentences=total_sentences,
+        kept_sentences=kept_sentences,
+        compressed_chunks=compressed_chunks,
+        tokens_before=estimate_tokens(format_context(chunks)) if chunks else 0,
+        tokens_after=estimate_tokens(format_context(compressed)) if compressed else 0
+    )
+
+
+def _sentence_score(question: str, query_tokens: set[str], sentence: str) -> float:
+    if not query_tokens:
+        return 0.0
+
+    overlap = len(query_tokens.intersection(tokenize(sentence))) / len(query_tokens)
+    return overlap + exact_match_score(question, sentence)
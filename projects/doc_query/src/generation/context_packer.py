@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from typing import Any
+
+from src.generation.prompts import format_chunk_header, format_context
+from src.models.retrieval import RetrievedChunk
+
+# Gemini's tokenizer averages about four characters per token on English prose
+CHARS_PER_TOKEN = 4.0
+
+# Shorter matches between the end of one chunk and the start of the next are coincidence
+MIN_OVERLAP_CHARS = 8
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def overlap_length(previous: str, following: str, max_overlap: int) -> int:
+    '''
+    Length of the longest end of `previous` that `following` starts with, up to
+    `max_overlap` characters: the text `chunk_overlap` repeats in consecutive chunks.
+    '''
+    for length in range(min(max_overlap, len(previous), len(following)), MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(following[:length]):
+            return length
+
+    return 0
+
+
+@dataclass
+class ContextPack:
+    chunks: list[RetrievedChunk]
+    token_count: int
+    max_tokens: int | None
+    candidates: int
+    packed: int
+    overlap_chars_removed: int
+    truncated: bool = False
+
+    def trace(self) -> dict[str, Any]:
+        return {
+            'tokens': self.token_count,
+            'max_tokens': self.max_tokens,
+            'candidates': self.candidates,
+            'packed': self.packed,
+            'blocks': len(self.chunks),
+            'overlap_chars_removed': self.overlap_chars_removed,
+            'truncated': self.truncated
+        }
+
+
+def pack_context(
+    chunks: list[RetrievedChunk],
+    max_tokens: int | None = None,
+    max_blocks: int | None = None,
+    max_overlap: int = 0
+) -> ContextPack:
+    '''
+    Fits the context chunks into the prompt's token budget.
+
+    Chunks are taken greedily by score (earlier ones first on ties, so a selected chunk
+    goes in before the neighbors that carry its score) while the rendered context stays
+    within `max_tokens` and `max_blocks`. The packed chunks are put in document order, and
+    consecutive chunks of a document are merged into one block with the text repeated by
+    the chunking overlap removed; the block's `merged_chunks` metadata keeps each chunk's
+    id, page and span of the block text so citations can name every one of them. If not
+    even the best chunk fits, it is cut to the budget.
+    '''
+    order = sorted(range(len(chunks)), key=lambda i: -chunks[i].score)
+    document_order = {chunk.document_id: None for chunk in chunks}
+    position = {document_id: i for i, document_id in enumerate(document_order)}
+
+    def document_key(i: int) -> tuple[int, int, int]:
+        chunk_index = chunks[i].metadata.get('chunk_index')
+        return position[chunks[i].document_id], chunk_index if chunk_index is not None else -1, i
+
+    chosen: list[int] = []
+    blocks: list[RetrievedChunk] = []
+    overlap_removed = 0
+
+    for i in order:
+        candidate = sorted(chosen + [i], key=document_key)
+        candidate_blocks, candidate_overlap = _merge(chunks, candidate, max_overlap)
+
+        if max_blocks is not None and len(candidate_blocks) > max_blocks:
+            continue
+
+        if max_tokens is not None and estimate_tokens(format_context(candidate_blocks)) > max_tokens:
+            continue
+
+        chosen, blocks, overlap_removed = candidate, candidate_blocks, candidate_overlap
+
+    truncated = False
+
+    if not chosen and chunks and max_tokens is not None:
+        best = chunks[order[0]]
+        keep_chars = int(max_tokens * CHARS_PER_TOKEN) - len(format_chunk_header(best)) - 1
+
+        if keep_chars > 0:
+            blocks = [best.model_copy(update={'text': best.text[:keep_chars]})]
+            chosen = [order[0]]
+            truncated = True
+
+    blocks = [block.model_copy(update={'rank': rank}) for rank, block in enumerate(blocks, start=1)]
+
+    return ContextPack(
+        chunks=blocks,
+        token_count=estimate_tokens(format_context(blocks)) if blocks else 0,
+        max_tokens=max_tokens,
+        candidates=len(chunks),
+        packed=len(chosen),
+        overlap_chars_removed=overlap_removed,
+        truncated=truncated
+    )
+
+
+def _merge(
+    chunks: list[RetrievedChunk],
+    positions: list[int],
+    max_overlap: int
+) -> tuple[list[RetrievedChunk], int]:
+    # `positions` is in document order; a run of consecutive chunk indices becomes one block
+    blocks: list[RetrievedChunk] = []
+    overlap_removed = 0
+    previous: RetrievedChunk | None = None
+
+    for i in positions:
+        chunk = chunks[i]
+
+        if previous is not None and _follows(previous, chunk):
+            overlap = overlap_length(previous.text, chunk.text, max_overlap)
+            block = blocks[-1]
+            start = len(block.text) - overlap if overlap else len(block.text) + 1
+            blocks[-1] = block.model_copy(
+                update={
+                    'text': block.text + (chunk.text[overlap:] if overlap else f'\n{chunk.text}'),
+                    'score': max(block.score, chunk.score),
+                    'metadata': {
+                        **block.metadata,
+                        'merged_chunks': block.metadata.get('merged_chunks', [_merged_part(block, 0)])
+                        + [_merged_part(chunk, start)]
+                    }
+                }
+            )
+            overlap_removed += overlap
+        else:
+            blocks.append(chunk)
+
+        previous = chunk
+
+    return blocks, overlap_removed
+
+
+def _merged_part(chunk: RetrievedChunk, start: int) -> dict[str, Any]:
+    return {
+        'chunk_id': chunk.chunk_id,
+        'page_number': chunk.page_number,
+        'section_title': chunk.section_title,
+        'start': start,
+        'end': start + len(chunk.text)
+    }
+
+
+def _follows(previous: RetrievedChunk, chunk: RetrievedChunk) -> bool:
+    previous_index = previous.metadata.get('chunk_index')
+    chunk_index = chunk.metadata.get('chunk_index')
+
+    return (
+        previous.document_id == chunk.document_id
+        and previous_index is not None
+        and chunk_index == previous_index + 1
+    )
@@ -7,17 +7,15 @@ def format_context(chunks: list[RetrievedChunk]) -> str:
     if not chunks:
         return 'No supporting context was retrieved'
     
-    parts: list[str] = []
+    return '\n\n'.join(f'{format_chunk_header(chunk)}\n{chunk.text}' for chunk in chunks)
 
-    for chunk in chunks:
-        header = (
-            f'[Chunk {chunk.chunk_id}] '
-            f'Source={chunk.filename}'
-            f', Page={chunk.page_number if chunk.page_number is not None else "N/A"}'
-        )
-        parts.append(f'{header}\n{chunk.text}')
 
-    return '\n\n'.join(parts)
+def format_chunk_header(chunk: RetrievedChunk) -> str:
+    return (
+        f'[Chunk {chunk.chunk_id}] '
+        f'Source={chunk.filename}'
+        f', Page={chunk.page_number if chunk.page_number is not None else "N/A"}'
+    )
 
 
 def build_grounded_prompt(question: str, chunks: list[RetrievedChunk]) -> str:
@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Protocol
+
+from src.observability.logging import get_logger
+
+
+class ResponseStore(Protocol):
+    '''
+    What `Answerer` needs from an LLM response cache. The repo-wide
+    `shared.llm_client.ResponseCache` is one; DocQuery never imports it directly.
+    '''
+
+    def get(self, key: str) -> str | None: ...
+
+    def put(self, key: str, text: str, provider: str, model: str) -> None: ...
+
+
+def response_cache_key(provider: str, model: str, prompt: str) -> str:
+    # Generation runs with the model's default temperature and output limit
+    return hashlib.sha256(json.dumps([provider, model, prompt], ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def load_shared_response_cache() -> ResponseStore | None:
+    '''
+    The repo-wide response cache (`LLM_CACHE_*` environment variables) when `shared` is
+    importable, i.e. the repo root is on PYTHONPATH, or None.
+    '''
+    try:
+        from shared.llm_client import get_response_cache
+    except ImportError:
+        get_logger('docquery.generation').info('shared.llm_client is not importable; LLM responses are not cached')
+        return None
+
+    return get_response_cache()
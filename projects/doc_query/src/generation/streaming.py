@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import json
+import re
+
+# `"answer"` key up to the opening quote of its string value
+ANSWER_VALUE_START = re.compile(r'"answer"\s*:\s*"')
+
+
+class AnswerTextExtractor:
+    '''
+    Pulls the `answer` string out of the model's JSON reply while it is still streaming.
+
+    `feed` takes each raw text chunk and returns the newly decoded part of the answer, so
+    tokens can be shown before the closing brace arrives. The full reply (`text`) is
+    still parsed and validated once the stream ends.
+    '''
+
+    def __init__(self) -> None:
+        self.text = ''
+        self.answer = ''
+        self.complete = False
+        self._position: int | None = None
+
+
+    def feed(self, chunk: str) -> str:
+        self.text += chunk
+
+        if self.complete:
+            return ''
+
+        if self._position is None:
+            match = ANSWER_VALUE_START.search(self.text)
+
+            if match is None:
+                return ''
+
+            self._position = match.end()
+
+        end, self.complete = self._scan(self.text, self._position)
+        delta = json.loads(f'"{self.text[self._position:end]}"')
+        self._position = end
+        self.answer += delta
+
+        return delta
+
+
+    @staticmethod
+    def _scan(text: str, position: int) -> tuple[int, bool]:
+        '''
+        End of the decodable string contents from `position`, and whether the closing
+        quote was reached. An escape sequence cut off by the chunk boundary, or a high
+        surrogate still waiting for its pair, is left for the next chunk.
+        '''
+        i = position
+
+        while i < len(text):
+            if text[i] == '"':
+                return i, True
+
+            if text[i] != '\\':
+                i += 1
+                continue
+
+            if i + 1 >= len(text):
+                break
+
+            if text[i + 1] != 'u':
+                i += 2
+                continue
+
+            if i + 6 > len(text):
+                break
+
+            length = 12 if 0xD800 <= int(text[i + 2:i + 6], 16) < 0xDC00 else 6
+
+            if i + length > len(text):
+                break
+
+            i += length
+
+        return i, False
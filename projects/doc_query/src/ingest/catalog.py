@@ -31,31 +31,38 @@ def save_catalog(catalog: dict) -> None:
 
 
 def upsert_document_record(document: DocumentRecord, processed_path: str) -> None:
-    catalog = load_catalog()
-    documents = catalog.get('documents', [])
+    upsert_document_records([(document, processed_path)])
 
-    new_entry = {
-        'document_id': document.document_id,
-        'filename': document.filename,
-        'file_path': document.file_path,
-        'file_type': document.file_type,
-        'title': document.title,
-        'ingested_at': document.ingested_at.isoformat(),
-        'num_pages': document.num_pages,
-        'num_chunks': document.num_chunks,
-        'processed_path': processed_path,
-        'metadata': document.metadata
-    }
-
-    existing_index = next(
-        (i for i, d in enumerate(documents) if d['document_id'] == document.document_id),
-        None
-    )
 
-    if existing_index is None:
-        documents.append(new_entry)
-    else:
-        documents[existing_index] = new_entry
+def upsert_document_records(records: list[tuple[DocumentRecord, str]]) -> None:
+    if not records:
+        return
+
+    catalog = load_catalog()
+    documents = catalog.get('documents', [])
+    position_by_id = {d['document_id']: i for i, d in enumerate(documents)}
+
+    for document, processed_path in records:
+        new_entry = {
+            'document_id': document.document_id,
+            'filename': document.filename,
+            'file_path': document.file_path,
+            'file_type': document.file_type,
+            'title': document.title,
+            'ingested_at': document.ingested_at.isoformat(),
+            'num_pages': document.num_pages,
+            'num_chunks': document.num_chunks,
+            'processed_path': processed_path,
+            'metadata': document.metadata
+        }
+
+        existing_index = position_by_id.get(document.document_id)
+
+        if existing_index is None:
+            position_by_id[document.document_id] = len(documents)
+            documents.append(new_entry)
+        else:
+            documents[existing_index] = new_entry
 
     catalog['documents'] = documents
     save_catalog(catalog)
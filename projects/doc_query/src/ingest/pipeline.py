@@ -1,16 +1,30 @@
 import json
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
+from time import perf_counter
 
 from src.config import Settings
-from src.ingest.catalog import upsert_document_record
+from src.ingest.catalog import upsert_document_record, upsert_document_records
 from src.ingest.chunking import build_chunk_records
 from src.ingest.cleaning import clean_pages
 from src.ingest.loaders import load_document
+from src.models.chunk import ChunkRecord
 from src.models.document import DocumentRecord
+from src.schemas.ingest import FileIngestResult
+from src.utils.files import compute_file_hash
 from src.utils.ids import make_document_id
 
 
-def ingest_file(file_path: str, settings: Settings) -> tuple[DocumentRecord, list]:
+def ingest_file(file_path: str, settings: Settings, update_catalog: bool = True) -> tuple[DocumentRecord, list]:
+    document, chunks, processed_path = process_file(file_path, settings)
+
+    if update_catalog:
+        upsert_document_record(document, processed_path)
+
+    return document, chunks
+
+
+def process_file(file_path: str, settings: Settings) -> tuple[DocumentRecord, list[ChunkRecord], str]:
     loaded = load_document(file_path)
     cleaned_pages = clean_pages(loaded['pages'])
 
@@ -33,31 +47,115 @@ def ingest_file(file_path: str, settings: Settings) -> tuple[DocumentRecord, lis
         title=loaded['title'],
         num_pages=len(cleaned_pages) if loaded['file_type'] == '.pdf' else None,
         num_chunks=len(chunks),
-        metadata={}
+        metadata={'content_hash': compute_file_hash(file_path)}
     )
 
     processed_path = _save_processed_document(document, chunks, settings)
-    upsert_document_record(document, processed_path)
 
-    return document, chunks
+    return document, chunks, processed_path
 
 
-def ingest_paths(file_paths: list[str], settings: Settings) -> tuple[list[DocumentRecord], list]:
+def ingest_paths(
+    file_paths: list[str],
+    settings: Settings,
+    update_catalog: bool = True
+) -> tuple[list[DocumentRecord], list]:
+    '''
+    Processes the files in order. With `update_catalog=False` the caller records the
+    documents in the catalog itself, once their chunks are indexed, so a failed
+    embedding run leaves the previous content hashes in place.
+    '''
     documents = []
     all_chunks = []
 
     for file_path in file_paths:
-        document, chunks = ingest_file(file_path, settings)
+        document, chunks = ingest_file(file_path, settings, update_catalog)
         documents.append(document)
         all_chunks.extend(chunks)
 
     return documents, all_chunks
 
 
+def ingest_paths_parallel(
+    file_paths: list[str],
+    settings: Settings,
+    max_workers: int | None = None,
+    update_catalog: bool = True
+) -> tuple[list[DocumentRecord], list[ChunkRecord], list[FileIngestResult]]:
+    max_workers = max_workers or settings.ingest.max_workers
+    outcomes: dict[str, tuple] = {}
+
+    if max_workers <= 1 or len(file_paths) <= 1:
+        for file_path in file_paths:
+            outcomes[file_path] = process_file_timed(file_path, settings)
+    else:
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(file_paths))) as executor:
+            futures = {
+                executor.submit(process_file_timed, file_path, settings): file_path
+                for file_path in file_paths
+            }
+
+            for future in as_completed(futures):
+                file_path = futures[future]
+
+                try:
+                    outcomes[file_path] = future.result()
+                except Exception as exc:
+                    # The worker process itself died (e.g. BrokenProcessPool)
+                    outcomes[file_path] = (None, [], None, 0.0, f'{type(exc).__name__}: {exc}')
+
+    documents: list[DocumentRecord] = []
+    all_chunks: list[ChunkRecord] = []
+    results: list[FileIngestResult] = []
+    catalog_records: list[tuple[DocumentRecord, str]] = []
+
+    # Results are merged in input order and the catalog is written once, by this process only
+    for file_path in file_paths:
+        document, chunks, processed_path, elapsed_ms, error = outcomes[file_path]
+
+        results.append(
+            FileIngestResult(
+                file_path=file_path,
+                success=error is None,
+                document_id=document.document_id if document else None,
+                num_chunks=len(chunks),
+                elapsed_ms=elapsed_ms,
+                error=error
+            )
+        )
+
+        if document is None:
+            continue
+
+        documents.append(document)
+        all_chunks.extend(chunks)
+        catalog_records.append((document, processed_path))
+
+    if update_catalog:
+        upsert_document_records(catalog_records)
+
+    return documents, all_chunks, results
+
+
+def process_file_timed(file_path: str, settings: Settings) -> tuple:
+    '''
+    `process_file` that reports a failure instead of raising it, as
+    (document, chunks, processed_path, elapsed_ms, error).
+    '''
+    start_time = perf_counter()
+
+    try:
+        document, chunks, processed_path = process_file(file_path, settings)
+    except Exception as exc:
+        return None, [], None, (perf_counter() - start_time) * 1000, f'{type(exc).__name__}: {exc}'
+
+    return document, chunks, processed_path, (perf_counter() - start_time) * 1000, None
+
+
 def _save_processed_document(document: DocumentRecord, chunks: list, settings: Settings) -> str:
     settings.paths.processed_data_dir.mkdir(parents=True, exist_ok=True)
 
-    output_path = settings.paths.processed_data_dir / f'{document.document_id}.json'
+    output_path = processed_document_path(document.document_id, settings)
 
     payload = {
         'document': document.model_dump(mode='json'),
@@ -69,4 +167,8 @@ def _save_processed_document(document: DocumentRecord, chunks: list, settings: S
         encoding='utf-8'
     )
 
-    return str(output_path)
\ No newline at end of file
+    return str(output_path)
+
+
+def processed_document_path(document_id: str, settings: Settings) -> Path:
+    return settings.paths.processed_data_dir / f'{document_id}.json'
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import queue
+import threading
+from typing import Callable, Iterable, Iterator, TypeVar
+
+import numpy as np
+
+from src.config import Settings
+from src.ingest.pipeline import process_file_timed
+from src.models.chunk import ChunkRecord
+from src.retrieval.sharded_store import ShardedIndexWriter
+from src.retrieval.vector_store import IndexWriter
+
+T = TypeVar('T')
+
+_END = object()
+
+
+def bounded_stage(items: Iterable[T], maxsize: int) -> Iterator[T]:
+    '''
+    Runs `items` on a background thread, handing results over through a bounded queue.
+
+    The producer blocks once `maxsize` results are waiting, so a slow downstream stage
+    caps how much upstream work is held in memory.
+    '''
+    buffer: queue.Queue = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item: object) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+
+        return False
+
+    def produce() -> None:
+        try:
+            for item in items:
+                if not put(item):
+                    return
+
+            put(_END)
+
+        except BaseException as exc:
+            put(exc)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            item = buffer.get()
+
+            if item is _END:
+                return
+
+            if isinstance(item, BaseException):
+                raise item
+
+            yield item
+
+    finally:
+        stop.set()
+
+
+def iter_processed_files(file_paths: Iterable[str], settings: Settings) -> Iterator[tuple[str, tuple]]:
+    '''
+    Yields each path with its `process_file_timed` outcome; as in the batch path, a
+    file that fails is reported with its error instead of ending the stream.
+    '''
+    for file_path in file_paths:
+        yield file_path, process_file_timed(file_path, settings)
+
+
+def iter_chunk_batches(chunks: Iterable[ChunkRecord], batch_size: int) -> Iterator[list[ChunkRecord]]:
+    batch: list[ChunkRecord] = []
+
+    for chunk in chunks:
+        batch.append(chunk)
+
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+def iter_embedded_batches(
+    batches: Iterable[list[ChunkRecord]],
+    embed_texts: Callable[[list[str]], np.ndarray]
+) -> Iterator[tuple[list[ChunkRecord], np.ndarray]]:
+    for batch in batches:
+        yield batch, embed_texts([chunk.text for chunk in batch])
+
+
+def index_chunk_stream(
+    chunks: Iterable[ChunkRecord],
+    embed_texts: Callable[[list[str]], np.ndarray],
+    writer: IndexWriter | ShardedIndexWriter,
+    batch_size: int,
+    queue_size: int
+) -> int:
+    '''
+    chunk → embed → index, with each stage connected by a bounded queue.
+
+    At most `queue_size` batches wait between stages, so the pipeline's own memory
+    depends on `batch_size` and `queue_size`, not on how many chunks flow through.
+    What the writer builds (vectors, BM25 postings) still grows with the corpus.
+    '''
+    batches = bounded_stage(iter_chunk_batches(chunks, batch_size), queue_size)
+    embedded = bounded_stage(iter_embedded_batches(batches, embed_texts), queue_size)
+
+    added = 0
+
+    for batch, embeddings in embedded:
+        writer.add(batch, embeddings)
+        added += len(batch)
+
+    return added
@@ -1,5 +1,6 @@
+from datetime import datetime, timezone
 from typing import Any
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator, model_validator
 
 class RetrievedChunk(BaseModel):
     chunk_id: str
@@ -10,4 +11,51 @@ class RetrievedChunk(BaseModel):
     rank: int = Field(ge=0)
     page_number: int | None = None
     section_title: str | None = None
-    metadata: dict[str, Any] = Field(default_factory=dict)
\ No newline at end of file
+    metadata: dict[str, Any] = Field(default_factory=dict)
+
+
+class RetrievalFilters(BaseModel):
+    document_ids: list[str] | None = None
+    file_types: list[str] | None = None
+    ingested_after: datetime | None = None
+    ingested_before: datetime | None = None
+
+    @field_validator('file_types')
+    @classmethod
+    def normalize_file_types(cls, value: list[str] | None) -> list[str] | None:
+        # Catalog file types are lower-case suffixes such as '.pdf'
+        if value is None:
+            return None
+
+        return [f'.{file_type.strip().lower().lstrip(".")}' for file_type in value]
+
+
+    @field_validator('ingested_after', 'ingested_before')
+    @classmethod
+    def normalize_timestamp(cls, value: datetime | None) -> datetime | None:
+        # Catalog timestamps are naive UTC
+        if value is None or value.tzinfo is None:
+            return value
+
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+    @model_validator(mode='after')
+    def validate_date_range(self) -> 'RetrievalFilters':
+        if self.ingested_after and self.ingested_before and self.ingested_after > self.ingested_before:
+            raise ValueError('ingested_after must not be later than ingested_before')
+
+        return self
+
+
+    @property
+    def is_empty(self) -> bool:
+        return all(
+            value is None
+            for value in (self.document_ids, self.file_types, self.ingested_after, self.ingested_before)
+        )
+
+
+    @property
+    def uses_catalog(self) -> bool:
+        return self.file_types is not None or self.ingested_after is not None or self.ingested_before is not None
@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+# Rows copied per step when carrying vectors over from the previous index
+COPY_BATCH_ROWS = 8192
+
+
+def binarize(vectors: np.ndarray) -> np.ndarray:
+    # One bit per dimension: the sign of each component, packed 8 dimensions per byte
+    return np.packbits(vectors > 0, axis=-1)
+
+
+def binary_dimension(dimension: int) -> int:
+    return (dimension + 7) // 8 * 8
+
+
+@lru_cache(maxsize=1)
+def supports_binary_selector() -> bool:
+    # IndexBinaryFlat only accepts SearchParameters (and so an IDSelector) in newer FAISS
+    # releases; older ones reject them, or the keyword, at search time
+    index = faiss.IndexBinaryFlat(8)
+    index.add(np.zeros((1, 1), dtype=np.uint8))
+
+    try:
+        index.search(np.zeros((1, 1), dtype=np.uint8), 1, params=faiss.SearchParameters(sel=faiss.IDSelectorAll()))
+    except (RuntimeError, TypeError):
+        return False
+
+    return True
+
+
+@dataclass(frozen=True)
+class BinaryRescoreIndex:
+    '''
+    Two-stage search: Hamming distance over sign bits picks `top_k * rescore_multiplier`
+    candidates, which are then rescored by exact inner product against the float vectors.
+
+    Labels of the binary index are row numbers into `vectors` (memory-mapped from disk),
+    and `row_ids` maps rows back to stable chunk ids.
+    '''
+    index: faiss.IndexBinary
+    vectors: np.ndarray
+    row_ids: np.ndarray
+    rescore_multiplier: int
+
+    @classmethod
+    def load(
+        cls,
+        index_path: Path,
+        vectors_path: Path,
+        row_ids: np.ndarray,
+        rescore_multiplier: int
+    ) -> 'BinaryRescoreIndex | None':
+        if not index_path.exists() or not vectors_path.exists():
+            return None
+
+        index = faiss.read_index_binary(str(index_path))
+
+        if index.ntotal != len(row_ids):
+            return None
+
+        dimension = vectors_path.stat().st_size // (4 * index.ntotal) if index.ntotal else 0
+        vectors = (
+            np.memmap(vectors_path, dtype=np.float32, mode='r', shape=(index.ntotal, dimension))
+            if index.ntotal else np.empty((0, 0), dtype=np.float32)
+        )
+
+        return cls(index, vectors, row_ids, rescore_multiplier)
+
+
+    def search(
+        self,
+        query_vector: np.ndarray,
+        top_k: int,
+        row_mask: np.ndarray | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        return self.search_many(query_vector[np.newaxis, :], top_k, row_mask)
+
+
+    def search_many(
+        self,
+        query_matrix: np.ndarray,
+        top_k: int,
+        row_mask: np.ndarray | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        num_candidates = min(
+            self.index.ntotal if row_mask is None else int(row_mask.sum()),
+            top_k * self.rescore_multiplier
+        )
+        top_k = min(top_k, num_candidates)
+
+        scores = np.full((len(query_matrix), top_k), -np.inf, dtype=np.float32)
+        ids = np.full((len(query_matrix), top_k), -1, dtype=np.int64)
+
+        if num_candidates == 0:
+            return scores, ids
+
+        # One Hamming search for all queries; only the rescoring is per query
+        candidate_rows = self._candidate_rows(binarize(query_matrix), num_candidates, row_mask)
+
+        for i, (query_vector, rows) in enumerate(zip(query_matrix, candidate_rows)):
+            # Sorted rows turn the gather from the memory map into a forward scan
+            rows = np.sort(rows[rows >= 0])
+            row_scores = np.asarray(self.vectors[rows]) @ query_vector.astype(np.float32)
+            best = np.argsort(-row_scores)[:top_k]
+
+            scores[i, :len(best)] = row_scores[best]
+            ids[i, :len(best)] = self.row_ids[rows[best]]
+
+        return scores, ids
+
+
+    def _candidate_rows(self, codes: np.ndarray, num_candidates: int, row_mask: np.ndarray | None) -> np.ndarray:
+        if row_mask is None:
+            return self.index.search(codes, num_candidates)[1]
+
+        if supports_binary_selector():
+            # IDSelectorBitmap reads bit `i & 7` of byte `i >> 3`
+            selector = faiss.IDSelectorBitmap(np.packbits(row_mask, bitorder='little'))
+            return self.index.search(codes, num_candidates, params=faiss.SearchParameters(sel=selector))[1]
+
+        # Older FAISS: search a temporary index over the selected rows' codes
+        rows = np.flatnonzero(row_mask)
+        subset = faiss.IndexBinaryFlat(self.index.d)
+        subset.add(self.index.reconstruct_n(0, self.index.ntotal)[rows])
+        labels = subset.search(codes, num_candidates)[1]
+
+        return np.where(labels >= 0, rows[np.maximum(labels, 0)], -1)
+
+
+class BinaryRescoreWriter:
+    '''
+    Builds the binary index and the raw vector file next to the main index.
+
+    Rows must be added in the same order as the metadata entries, which is what
+    lets the reader map binary labels back to chunk ids.
+    '''
+
+    def __init__(self, index_path: Path, vectors_path: Path, dimension: int) -> None:
+        self.index_path = index_path
+        self.vectors_path = vectors_path
+        self.dimension = dimension
+        self.index = faiss.IndexBinaryFlat(binary_dimension(dimension))
+
+        self._tmp_index_path = index_path.with_suffix('.index.tmp')
+        self._tmp_vectors_path = vectors_path.with_suffix('.f32.tmp')
+        self._file = self._tmp_vectors_path.open('wb')
+
+
+    def add(self, vectors: np.ndarray) -> None:
+        if len(vectors) == 0:
+            return
+
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.index.add(binarize(vectors))
+        self._file.write(vectors.tobytes())
+
+
+    def copy_rows(self, rows: list[int], previous_count: int) -> None:
+        if not rows:
+            return
+
+        if not self.vectors_path.exists() or self.vectors_path.stat().st_size != previous_count * self.dimension * 4:
+            raise ValueError('Binary first-pass index is missing or stale; rebuild the index')
+
+        previous = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(previous_count, self.dimension))
+
+        for start in range(0, len(rows), COPY_BATCH_ROWS):
+            self.add(previous[rows[start:start + COPY_BATCH_ROWS]])
+
+
+    def commit(self) -> None:
+        self.prepare()
+        self.publish()
+
+
+    def prepare(self) -> None:
+        self._file.close()
+        faiss.write_index_binary(self.index, str(self._tmp_index_path))
+
+
+    def publish(self) -> None:
+        os.replace(self._tmp_vectors_path, self.vectors_path)
+        os.replace(self._tmp_index_path, self.index_path)
+
+
+    def abort(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+
+        self._tmp_vectors_path.unlink(missing_ok=True)
+        self._tmp_index_path.unlink(missing_ok=True)
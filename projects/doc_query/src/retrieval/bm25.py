@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import os
+from array import array
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from src.retrieval.reranker import encode_tokens, gather_segments, tokenize
+
+
+class BM25Index:
+    '''
+    Okapi BM25 over the indexed chunks, stored as CSR postings.
+
+    Postings of term `t` are `rows[offsets[t]:offsets[t + 1]]` with matching term
+    frequencies in `tfs`. Rows follow metadata entry order and `row_ids` maps them to
+    stable chunk ids.
+
+    The same vocabulary also encodes each chunk's token sequence
+    (`chunk_tokens[chunk_offsets[r]:chunk_offsets[r + 1]]`), which the reranker
+    scores without re-tokenizing chunk text.
+    '''
+
+    def __init__(
+        self,
+        vocabulary: list[str],
+        offsets: np.ndarray,
+        rows: np.ndarray,
+        tfs: np.ndarray,
+        doc_lengths: np.ndarray,
+        row_ids: np.ndarray,
+        chunk_tokens: np.ndarray | None = None,
+        chunk_offsets: np.ndarray | None = None,
+        k1: float = 1.2,
+        b: float = 0.75
+    ) -> None:
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.rows = rows
+        self.tfs = tfs
+        self.doc_lengths = doc_lengths
+        self.row_ids = row_ids
+        self.chunk_tokens = chunk_tokens
+        self.chunk_offsets = chunk_offsets
+
+        self.term_index = {term: i for i, term in enumerate(vocabulary)}
+        self._id_order = np.argsort(row_ids)
+
+        num_docs = len(doc_lengths)
+        document_frequency = np.diff(offsets)
+        average_length = float(doc_lengths.mean()) if num_docs else 0.0
+
+        self.idf = np.log1p((num_docs - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+        self.length_norm = (
+            k1 * (1 - b + b * doc_lengths / average_length) if average_length else np.full(num_docs, k1)
+        ).astype(np.float32)
+        self.k1 = k1
+
+
+    @classmethod
+    def load(cls, path: Path, k1: float = 1.2, b: float = 0.75) -> 'BM25Index':
+        with np.load(path) as data:
+            vocabulary = data['vocabulary'].tobytes().decode('utf-8').split('\n') if len(data['offsets']) > 1 else []
+
+            # Token sequences were added after the first BM25 files were written
+            has_tokens = 'chunk_tokens' in data.files
+
+            return cls(
+                vocabulary,
+                data['offsets'],
+                data['rows'],
+                data['tfs'],
+                data['doc_lengths'],
+                data['row_ids'],
+                chunk_tokens=data['chunk_tokens'] if has_tokens else None,
+                chunk_offsets=data['chunk_offsets'] if has_tokens else None,
+                k1=k1,
+                b=b
+            )
+
+
+    @property
+    def has_chunk_tokens(self) -> bool:
+        return self.chunk_tokens is not None
+
+
+    def save(self, path: Path) -> None:
+        os.replace(self.stage(path), path)
+
+
+    def stage(self, path: Path) -> Path:
+        '''Writes the index to a temp file next to `path` and returns it, for callers that swap it in later.'''
+        # np.savez appends `.npz` to names without it, so the temp name keeps the suffix
+        tmp_path = self.staged_path(path)
+
+        np.savez(
+            tmp_path,
+            vocabulary=np.frombuffer('\n'.join(self.vocabulary).encode('utf-8'), dtype=np.uint8),
+            offsets=self.offsets,
+            rows=self.rows,
+            tfs=self.tfs,
+            doc_lengths=self.doc_lengths,
+            row_ids=self.row_ids,
+            chunk_tokens=self.chunk_tokens,
+            chunk_offsets=self.chunk_offsets
+        )
+
+        return tmp_path
+
+
+    @staticmethod
+    def staged_path(path: Path) -> Path:
+        return path.with_name(f'{path.stem}.tmp.npz')
+
+
+    def search(
+        self,
+        query: str,
+        top_k: int,
+        row_mask: np.ndarray | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        term_ids = [self.term_index[term] for term in set(tokenize(query)) if term in self.term_index]
+
+        if not term_ids or top_k <= 0:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+
+        scores = np.zeros(len(self.row_ids), dtype=np.float32)
+
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            rows = self.rows[start:end]
+            tfs = self.tfs[start:end]
+
+            # Rows are unique within a posting list, so fancy-indexed += is safe
+            scores[rows] += self.idf[term_id] * tfs * (self.k1 + 1) / (tfs + self.length_norm[rows])
+
+        if row_mask is not None:
+            scores[~row_mask] = 0
+
+        matched = np.flatnonzero(scores)
+        best = matched[np.argsort(-scores[matched], kind='stable')[:top_k]]
+
+        return scores[best], self.row_ids[best]
+
+
+    def encode_query(self, query: str) -> np.ndarray:
+        return encode_tokens(tokenize(query), self.term_index)
+
+
+    def rows_for(self, faiss_ids: np.ndarray) -> np.ndarray:
+        positions = np.searchsorted(self.row_ids, faiss_ids, sorter=self._id_order)
+        return self._id_order[np.minimum(positions, len(self.row_ids) - 1)]
+
+
+    def tokens_for(self, faiss_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # Token sequences of the given chunks, concatenated, with their offsets
+        return gather_segments(self.chunk_tokens, self.chunk_offsets, self.rows_for(faiss_ids))
+
+
+class BM25Builder:
+    '''
+    Accumulates postings while the index writer streams chunks.
+
+    Chunks must be added in metadata entry order. Postings and token sequences of kept
+    chunks can be carried over from the previous index without re-tokenizing their text.
+    '''
+
+    def __init__(self) -> None:
+        self._terms: dict[str, int] = {}
+        self._term_ids = array('i')
+        self._rows = array('i')
+        self._tfs = array('f')
+        self._doc_lengths = array('i')
+        self._row_ids = array('q')
+        self._chunk_tokens = array('i')
+
+
+    def add(self, row_ids: list[int], texts: list[str]) -> None:
+        for row_id, text in zip(row_ids, texts):
+            tokens = tokenize(text)
+            row = len(self._doc_lengths)
+
+            for term, tf in Counter(tokens).items():
+                self._term_ids.append(self._terms.setdefault(term, len(self._terms)))
+                self._rows.append(row)
+                self._tfs.append(tf)
+
+            self._chunk_tokens.extend(self._terms[token] for token in tokens)
+            self._doc_lengths.append(len(tokens))
+            self._row_ids.append(row_id)
+
+
+    def carry_over(self, previous: BM25Index, kept_rows: list[int], kept_ids: list[int]) -> None:
+        new_rows = np.full(len(previous.row_ids), -1, dtype=np.int64)
+        new_rows[kept_rows] = len(self._doc_lengths) + np.arange(len(kept_rows))
+
+        local_term_ids = np.array(
+            [self._terms.setdefault(term, len(self._terms)) for term in previous.vocabulary],
+            dtype=np.int32
+        )
+        posting_terms = np.repeat(local_term_ids, np.diff(previous.offsets))
+        posting_rows = new_rows[previous.rows]
+        keep = posting_rows >= 0
+
+        kept_tokens, _ = gather_segments(previous.chunk_tokens, previous.chunk_offsets, np.asarray(kept_rows, dtype=np.int64))
+
+        self._term_ids.frombytes(posting_terms[keep].astype(np.int32).tobytes())
+        self._rows.frombytes(posting_rows[keep].astype(np.int32).tobytes())
+        self._tfs.frombytes(previous.tfs[keep].astype(np.float32).tobytes())
+        self._chunk_tokens.frombytes(local_term_ids[kept_tokens].astype(np.int32).tobytes())
+        self._doc_lengths.frombytes(previous.doc_lengths[kept_rows].astype(np.int32).tobytes())
+        self._row_ids.frombytes(np.asarray(kept_ids, dtype=np.int64).tobytes())
+
+
+    @property
+    def row_ids(self) -> np.ndarray:
+        return np.frombuffer(self._row_ids, dtype=np.int64)
+
+
+    def build(self) -> BM25Index:
+        term_ids = np.frombuffer(self._term_ids, dtype=np.int32)
+        rows = np.frombuffer(self._rows, dtype=np.int32)
+        tfs = np.frombuffer(self._tfs, dtype=np.float32)
+        doc_lengths = np.frombuffer(self._doc_lengths, dtype=np.int32).copy()
+
+        order = np.lexsort((rows, term_ids))
+        counts = np.bincount(term_ids, minlength=len(self._terms))
+
+        # Terms whose chunks were all replaced drop out of the vocabulary
+        used = np.flatnonzero(counts)
+        remap = np.full(len(self._terms), -1, dtype=np.int32)
+        remap[used] = np.arange(len(used))
+        terms = list(self._terms)
+
+        return BM25Index(
+            vocabulary=[terms[i] for i in used],
+            offsets=np.concatenate([[0], np.cumsum(counts[used])]).astype(np.int64),
+            rows=rows[order],
+            tfs=tfs[order],
+            doc_lengths=doc_lengths,
+            row_ids=np.frombuffer(self._row_ids, dtype=np.int64).copy(),
+            chunk_tokens=remap[np.frombuffer(self._chunk_tokens, dtype=np.int32)],
+            chunk_offsets=np.concatenate([[0], np.cumsum(doc_lengths)]).astype(np.int64)
+        )
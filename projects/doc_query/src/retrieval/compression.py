@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass
+from typing import Any
+
+import numpy as np
+
+from src.config import ModelSettings, VectorIndexSettings
+
+
+@dataclass(frozen=True)
+class VectorEncoding:
+    '''
+    How embeddings are turned into stored vectors.
+
+    Gemini embeddings are Matryoshka-trained, so a leading slice of the vector is itself
+    a usable (lower-resolution) embedding once re-normalized. Scalar quantization happens
+    inside the FAISS index; only the truncation has to be applied to queries as well.
+    '''
+    source_dimension: int
+    dimension: int
+    quantization: str = 'none'
+
+    @classmethod
+    def from_settings(cls, models: ModelSettings, vector_index: VectorIndexSettings) -> 'VectorEncoding':
+        dimension = vector_index.truncate_dimension or models.embedding_dimension
+
+        if dimension > models.embedding_dimension:
+            raise ValueError(
+                f'truncate_dimension={dimension} exceeds the embedding dimension {models.embedding_dimension}'
+            )
+
+        return cls(models.embedding_dimension, dimension, vector_index.quantization)
+
+
+    @classmethod
+    def from_metadata(cls, metadata: dict[str, Any]) -> 'VectorEncoding':
+        # Indexes written before compression support stored full float32 vectors
+        encoding = metadata.get('encoding')
+
+        if encoding is None:
+            return cls(metadata['dimension'], metadata['dimension'])
+
+        return cls(**encoding)
+
+
+    def to_metadata(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        if vectors.shape[-1] != self.source_dimension:
+            raise ValueError(
+                f'Embedding dimension mismatch: expected {self.source_dimension}, got {vectors.shape[-1]}'
+            )
+
+        if self.dimension == self.source_dimension:
+            return np.ascontiguousarray(vectors, dtype=np.float32)
+
+        truncated = np.array(vectors[..., :self.dimension], dtype=np.float32)
+        norms = np.linalg.norm(truncated, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+
+        return truncated / norms
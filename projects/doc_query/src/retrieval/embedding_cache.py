@@ -0,0 +1,451 @@
+from __future__ import annotations
+
+import atexit
+import hashlib
+import json
+import re
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Sequence
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+KEY_BYTES = 32
+
+# The vector file starts this many rows long and doubles as it fills, up to max_entries
+INITIAL_ROWS = 256
+
+# Buffered puts are written through once this many are waiting, even without a flush
+MAX_PENDING_ROWS = 4096
+
+
+def normalize_cache_text(text: str) -> str:
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+class EmbeddingCache:
+    '''
+    Disk-backed, content-addressed embedding cache, shared by every process that opens
+    the same directory.
+
+    Vectors live in a memory-mapped array that grows on demand up to `max_entries`
+    rows; a compact index (`keys.npz`) maps the sha256 of (model, dimension, normalized
+    text) to a row. When the cache is full the least recently used rows are overwritten.
+
+    Puts are buffered in memory and written on `flush`, which callers run once per
+    batch of work, not per put. Rows are only claimed during a flush, under an exclusive
+    file lock and after re-reading the index other processes may have written, so two
+    processes never claim the same row or drop each other's keys. Reads take the shared
+    lock and pick up a changed index first, remapping (never resizing) a grown file.
+
+    Entries have no time-to-live: an embedding of the same text under the same model
+    never changes, so only the LRU bound removes them.
+
+    `close()` (or leaving a `with` block) flushes and releases the lock file; caches
+    still open when the process exits are flushed then.
+    '''
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        model_name: str,
+        dimension: int,
+        max_entries: int,
+        dtype: str = 'float32'
+    ) -> None:
+        self.model_name = model_name
+        self.dimension = dimension
+        self.max_entries = max_entries
+        self.dtype = np.dtype(dtype)
+
+        namespace = re.sub(r'[^A-Za-z0-9_.-]+', '_', f'{model_name}-{dimension}')
+        self.cache_dir = Path(cache_dir) / namespace
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        self.vectors_path = self.cache_dir / 'vectors.bin'
+        self.keys_path = self.cache_dir / 'keys.npz'
+        self.meta_path = self.cache_dir / 'cache_meta.json'
+        self.lock_path = self.cache_dir / 'cache.lock'
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._lock_file = open(self.lock_path, 'a')
+        self._rows: dict[bytes, int] = {}
+        self._row_keys = np.zeros((0, KEY_BYTES), dtype=np.uint8)
+        self._last_used = np.zeros(0, dtype=np.int64)
+        self._tick = 0
+        self._keys_signature: tuple[int, int, int] | None = None
+
+        # Written on the next flush: new vectors, and recency of rows read since the last one
+        self._pending: dict[bytes, np.ndarray] = {}
+        self._touched: dict[bytes, int] = {}
+        self._last_flush = time.monotonic()
+
+        with self._file_lock(exclusive=True):
+            self._vectors = self._open_vectors()
+
+        _open_caches.add(self)
+
+
+    def make_key(self, text: str) -> bytes:
+        payload = f'{self.model_name}\x00{self.dimension}\x00{normalize_cache_text(text)}'
+        return hashlib.sha256(payload.encode('utf-8')).digest()
+
+
+    def get_many(self, texts: Sequence[str]) -> tuple[np.ndarray, list[int]]:
+        '''
+        Returns a float32 matrix with cached rows filled in and the positions of misses.
+        '''
+        result = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        missing: list[int] = []
+
+        with self._lock, self._file_lock(exclusive=False):
+            self._sync(exclusive=False)
+
+            for i, text in enumerate(texts):
+                key = self.make_key(text)
+                vector = self._pending.get(key)
+
+                if vector is not None:
+                    result[i] = vector
+                    continue
+
+                row = self._rows.get(key)
+
+                if row is None:
+                    missing.append(i)
+                    continue
+
+                result[i] = self._vectors[row]
+                self._touched[key] = self._touch(row)
+
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+
+        return result, missing
+
+
+    def get(self, text: str) -> np.ndarray | None:
+        vectors, missing = self.get_many([text])
+        return None if missing else vectors[0]
+
+
+    def put_many(self, texts: Sequence[str], vectors: np.ndarray) -> None:
+        if len(texts) != len(vectors):
+            raise ValueError('texts and vectors must have the same length')
+
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = self.make_key(text)
+
+                # Re-inserting moves the key to the end, so the newest puts survive truncation
+                self._pending.pop(key, None)
+                self._pending[key] = np.asarray(vector, dtype=self.dtype)
+
+            if len(self._pending) >= MAX_PENDING_ROWS:
+                self._flush_locked()
+
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+
+    def flush_if_due(self, interval_seconds: float) -> None:
+        '''
+        Flushes when there is something to write and the last flush is at least
+        `interval_seconds` old; for paths that add one vector at a time.
+        '''
+        with self._lock:
+            if time.monotonic() - self._last_flush >= interval_seconds:
+                self._flush_locked()
+
+
+    def stats(self) -> dict[str, float | int]:
+        lookups = self.hits + self.misses
+
+        return {
+            'entries': len(self._rows) + sum(key not in self._rows for key in self._pending),
+            'pending': len(self._pending),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+
+    def close(self) -> None:
+        with self._lock:
+            if self._lock_file.closed:
+                return
+
+            self._flush_locked()
+            self._vectors.flush()
+            self._lock_file.close()
+
+        _open_caches.discard(self)
+
+
+    def __enter__(self) -> 'EmbeddingCache':
+        return self
+
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+    def _flush_locked(self) -> None:
+        if not self._pending and not self._touched:
+            return
+
+        with self._file_lock(exclusive=True):
+            self._sync(exclusive=True)
+
+            # Only the most recent `max_entries` keys can be held at once
+            items = list(self._pending.items())[-self.max_entries:]
+            new_keys = [key for key, _ in items if key not in self._rows]
+
+            # Refresh rows being overwritten so eviction below cannot pick them
+            for key, _ in items:
+                if key in self._rows:
+                    self._touch(self._rows[key])
+
+            free_rows = self._allocate_rows(len(new_keys))
+
+            for key, row in zip(new_keys, free_rows):
+                self._rows[key] = row
+                self._row_keys[row] = np.frombuffer(key, dtype=np.uint8)
+
+            for key, vector in items:
+                row = self._rows[key]
+                self._vectors[row] = vector
+                self._touch(row)
+
+            self._vectors.flush()
+
+            rows = np.fromiter(self._rows.values(), dtype=np.int32, count=len(self._rows))
+            tmp_path = self.keys_path.with_suffix('.tmp.npz')
+
+            np.savez(
+                tmp_path,
+                keys=self._row_keys[rows],
+                rows=rows,
+                last_used=self._last_used[rows]
+            )
+            tmp_path.replace(self.keys_path)
+
+            self._keys_signature = self._read_signature()
+            self._pending.clear()
+            self._touched.clear()
+            self._last_flush = time.monotonic()
+
+
+    def _sync(self, exclusive: bool) -> None:
+        # Called with both locks held: reload the index if another process rewrote it
+        signature = self._read_signature()
+
+        if signature is None or signature == self._keys_signature:
+            return
+
+        rows, keys, last_used = self._load_keys()
+        capacity = len(self._vectors)
+        file_rows = self.vectors_path.stat().st_size // self._row_bytes
+
+        # Writers size the file for every row before saving the keys, so readers under
+        # the shared lock only remap it; never extending the file is what makes that safe
+        needed = min(max(file_rows, int(rows.max(initial=-1)) + 1) if exclusive else file_rows, self.max_entries)
+        rows, keys, last_used = _clamp_rows(rows, keys, last_used, max(capacity, needed))
+        self._row_keys = np.zeros((0, KEY_BYTES), dtype=np.uint8)
+        self._last_used = np.zeros(0, dtype=np.int64)
+
+        if needed <= capacity:
+            self._grow_index(capacity)
+        elif exclusive:
+            self._vectors.flush()
+            self._vectors = self._resize(needed)
+        else:
+            # Rows are only written under the exclusive lock, so there is nothing to flush
+            self._vectors = self._map(needed)
+
+        self._row_keys[rows] = keys
+        self._last_used[rows] = last_used
+        self._rows = {self._row_keys[row].tobytes(): int(row) for row in rows}
+
+        # Reads since our last flush still count towards recency
+        for key, tick in self._touched.items():
+            row = self._rows.get(key)
+
+            if row is not None:
+                self._last_used[row] = max(self._last_used[row], tick)
+
+        self._tick = max(self._tick, int(self._last_used.max(initial=0)))
+        self._keys_signature = signature
+
+
+    def _read_signature(self) -> tuple[int, int, int] | None:
+        try:
+            stat = self.keys_path.stat()
+        except FileNotFoundError:
+            return None
+
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool) -> Iterator[None]:
+        if fcntl is None:
+            yield
+            return
+
+        fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+
+    def _open_vectors(self) -> np.memmap:
+        # Capacity is not part of the layout: processes with different `max_entries`
+        # share the files, and a smaller one only uses (and keeps) the leading rows
+        expected_meta = {
+            'model_name': self.model_name,
+            'dimension': self.dimension,
+            'dtype': self.dtype.name
+        }
+
+        reuse = (
+            self.vectors_path.exists() and
+            self.meta_path.exists() and
+            _layout(json.loads(self.meta_path.read_text(encoding='utf-8'))) == expected_meta
+        )
+
+        if reuse:
+            capacity = min(self.vectors_path.stat().st_size // self._row_bytes, self.max_entries)
+            rows, keys, last_used = _clamp_rows(*self._load_keys(), capacity)
+            reuse = capacity > 0
+
+        if not reuse:
+            # Layout changed (or first run): start from an empty cache
+            self.keys_path.unlink(missing_ok=True)
+            self.vectors_path.unlink(missing_ok=True)
+            self.meta_path.write_text(json.dumps(expected_meta, indent=2), encoding='utf-8')
+
+            return self._resize(min(INITIAL_ROWS, self.max_entries))
+
+        vectors = self._resize(capacity)
+        self._row_keys[rows] = keys
+        self._last_used[rows] = last_used
+        self._rows = {self._row_keys[row].tobytes(): int(row) for row in rows}
+        self._tick = int(self._last_used.max(initial=0))
+        self._keys_signature = self._read_signature()
+
+        return vectors
+
+
+    def _load_keys(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Another process may have created the cache without flushing anything yet
+        if not self.keys_path.exists():
+            return np.zeros(0, dtype=np.int32), np.zeros((0, KEY_BYTES), dtype=np.uint8), np.zeros(0, dtype=np.int64)
+
+        with np.load(self.keys_path) as saved:
+            return saved['rows'], saved['keys'], saved['last_used']
+
+
+    @property
+    def _row_bytes(self) -> int:
+        return self.dimension * self.dtype.itemsize
+
+
+    def _resize(self, capacity: int) -> np.memmap:
+        # Extending the file leaves the new rows sparse until they are written
+        with open(self.vectors_path, 'ab') as handle:
+            if handle.tell() < capacity * self._row_bytes:
+                handle.truncate(capacity * self._row_bytes)
+
+        return self._map(capacity)
+
+
+    def _map(self, capacity: int) -> np.memmap:
+        self._grow_index(capacity)
+        return np.memmap(self.vectors_path, dtype=self.dtype, mode='r+', shape=(capacity, self.dimension))
+
+
+    def _grow_index(self, capacity: int) -> None:
+        extra = capacity - len(self._last_used)
+        self._row_keys = np.concatenate([self._row_keys, np.zeros((extra, KEY_BYTES), dtype=np.uint8)])
+        self._last_used = np.concatenate([self._last_used, np.zeros(extra, dtype=np.int64)])
+
+
+    def _reserve(self, rows: int) -> None:
+        capacity = len(self._vectors)
+
+        if rows <= capacity:
+            return
+
+        self._vectors.flush()
+        self._vectors = self._resize(min(self.max_entries, max(rows, capacity * 2)))
+
+
+    def _allocate_rows(self, count: int) -> list[int]:
+        # Rows fill up contiguously from 0, so the free rows are always the tail
+        used = len(self._rows)
+        self._reserve(min(used + count, self.max_entries))
+        free = list(range(used, min(used + count, self.max_entries)))
+        needed = count - len(free)
+
+        if needed <= 0:
+            return free
+
+        # Evict the least recently used rows in one pass
+        victims = np.argpartition(self._last_used[:used], needed - 1)[:needed]
+
+        for row in victims:
+            del self._rows[self._row_keys[row].tobytes()]
+
+        self.evictions += needed
+        return free + [int(row) for row in victims]
+
+
+    def _touch(self, row: int) -> int:
+        # Wall-clock ticks, so recency recorded by different processes can be compared
+        self._tick = max(self._tick + 1, time.time_ns())
+        self._last_used[row] = self._tick
+        return self._tick
+
+
+def _layout(meta: dict) -> dict:
+    # Caches written before capacity left the layout also recorded `max_entries`
+    return {key: value for key, value in meta.items() if key != 'max_entries'}
+
+
+def _clamp_rows(
+    rows: np.ndarray,
+    keys: np.ndarray,
+    last_used: np.ndarray,
+    capacity: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Rows fill from 0, so a cache opened with fewer rows keeps a contiguous prefix
+    keep = rows < capacity
+    return rows[keep], keys[keep], last_used[keep]
+
+
+_open_caches: weakref.WeakSet[EmbeddingCache] = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_open_caches() -> None:
+    for cache in list(_open_caches):
+        cache.close()
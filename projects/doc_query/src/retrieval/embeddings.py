@@ -1,12 +1,19 @@
 from __future__ import annotations
 
 import os
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
 from typing import Sequence
 
 import numpy as np
 import google.genai as genai
+from tenacity import Retrying, stop_after_attempt, wait_exponential_jitter
 
 from src.config import get_settings
+from src.retrieval.embedding_cache import EmbeddingCache, normalize_cache_text
+from src.retrieval.query_cache import QueryEmbedding, QueryEmbeddingCache
+from src.utils.executors import run_blocking
+from src.utils.rate_limit import RateLimiter
 
 
 class EmbeddingClient:
@@ -22,6 +29,9 @@ class EmbeddingClient:
         self.client = genai.Client(api_key=api_key)
         self.model_name = self.settings.models.embedding_model
         self.embedding_dimension = self.settings.models.embedding_dimension
+        self.rate_limiter = RateLimiter(self.settings.embeddings.requests_per_minute)
+        self.cache = self._create_cache()
+        self.query_cache = self._create_query_cache()
 
     def embed_text(self, text: str) -> np.ndarray:
         if not text or not text.strip():
@@ -37,31 +47,279 @@ class EmbeddingClient:
     
 
     def embed_query(self, query: str) -> np.ndarray:
+        return self.embed_query_cached(query).vector
+
+
+    def embed_query_cached(self, query: str) -> QueryEmbedding:
+        '''
+        Embeds a question through the in-process query cache, then the on-disk embedding
+        cache, then the API; reports where the vector came from and what that saved.
+        '''
         if not query or not query.strip():
             raise ValueError('Cannot embed empty query')
-        
-        response = self.client.models.embed_content(
-            model=self.model_name,
-            contents=query
-        )
 
-        vector = np.array(response.embeddings[0].values, dtype=np.float32)
-        return normalize_vector(vector)
-    
+        start_time = perf_counter()
+        vector = self.query_cache.get(query) if self.query_cache is not None else None
+        source = 'memory'
+
+        if vector is None and self._query_disk_tier is not None:
+            vector = self._query_disk_tier.get(query)
+            source = 'disk'
+
+        if vector is None:
+            response = self.client.models.embed_content(
+                model=self.model_name,
+                contents=query
+            )
+
+            vector, source = normalize_vector(np.array(response.embeddings[0].values, dtype=np.float32)), 'api'
+
+        return self._finish_query_embedding(query, vector, source, start_time)
+
+
+    async def embed_query_cached_async(self, query: str) -> QueryEmbedding:
+        '''
+        `embed_query_cached` on the async client; the on-disk cache is read and written on
+        the blocking executor.
+        '''
+        if not query or not query.strip():
+            raise ValueError('Cannot embed empty query')
+
+        start_time = perf_counter()
+        vector = self.query_cache.get(query) if self.query_cache is not None else None
+        source = 'memory'
+
+        if vector is None and self._query_disk_tier is not None:
+            vector = await run_blocking(self._query_disk_tier.get, query)
+            source = 'disk'
+
+        if vector is None:
+            response = await self.client.aio.models.embed_content(
+                model=self.model_name,
+                contents=query
+            )
+
+            vector, source = normalize_vector(np.array(response.embeddings[0].values, dtype=np.float32)), 'api'
+
+        if source == 'api' and self._query_disk_tier is not None:
+            return await run_blocking(self._finish_query_embedding, query, vector, source, start_time)
+
+        return self._finish_query_embedding(query, vector, source, start_time)
 
-    def embed_texts(self, texts: Sequence[str]) -> np.ndarray:
-        vectors = [self.embed_text(text) for text in texts]
 
-        if not vectors:
+    def embed_queries_cached(self, queries: Sequence[str]) -> list[QueryEmbedding]:
+        '''
+        `embed_query_cached` for many questions: both cache tiers are read for all of
+        them, and the rest are embedded in batched API requests.
+        '''
+        if any(not query or not query.strip() for query in queries):
+            raise ValueError('Cannot embed empty query')
+
+        start_time = perf_counter()
+        vectors = [self.query_cache.get(query) if self.query_cache is not None else None for query in queries]
+        sources = ['memory'] * len(queries)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        disk_tier = self._query_disk_tier
+
+        if missing and disk_tier is not None:
+            found, still_missing = disk_tier.get_many([queries[i] for i in missing])
+
+            for j in set(range(len(missing))).difference(still_missing):
+                vectors[missing[j]], sources[missing[j]] = found[j], 'disk'
+
+            missing = [missing[j] for j in still_missing]
+
+        lookup_ms = (perf_counter() - start_time) * 1000
+        api_ms = 0.0
+
+        if missing:
+            # Repeated questions in the batch are embedded once, keyed like the caches
+            first_by_key: dict[str, int] = {}
+
+            for i in missing:
+                first_by_key.setdefault(normalize_cache_text(queries[i]), i)
+
+            unique_queries = [queries[i] for i in first_by_key.values()]
+            api_start = perf_counter()
+            fresh = self._embed_uncached(unique_queries)
+            api_ms = (perf_counter() - api_start) * 1000
+            row_by_key = {key: row for row, key in enumerate(first_by_key)}
+
+            for i in missing:
+                vectors[i], sources[i] = fresh[row_by_key[normalize_cache_text(queries[i])]], 'api'
+
+            if disk_tier is not None:
+                disk_tier.put_many(unique_queries, fresh)
+                disk_tier.flush_if_due(self.settings.query_embedding_cache.disk_flush_seconds)
+
+        # Cache hits share the lookup time; misses waited for the API round-trip
+        hit_ms = lookup_ms / len(queries) if queries else 0.0
+
+        return [
+            self._record_query_embedding(query, vector, source, api_ms if source == 'api' else hit_ms)
+            for query, vector, source in zip(queries, vectors, sources)
+        ]
+
+
+    def embed_texts(self, texts: Sequence[str]) -> np.ndarray:
+        if not texts:
             return np.empty((0, self.embedding_dimension), dtype=np.float32)
-        
-        return np.vstack(vectors)
-    
+
+        if any(not text or not text.strip() for text in texts):
+            raise ValueError('Cannot embed empty text')
+
+        if self.cache is None:
+            return self._embed_uncached(texts)
+
+        embeddings, missing = self.cache.get_many(texts)
+
+        if missing:
+            # Repeated texts within the batch (boilerplate clauses) are embedded once
+            unique_texts = list(dict.fromkeys(texts[i] for i in missing))
+            fresh = self._embed_uncached(unique_texts)
+            row_by_text = {text: row for row, text in enumerate(unique_texts)}
+
+            for i in missing:
+                embeddings[i] = fresh[row_by_text[texts[i]]]
+
+            self.cache.put_many(unique_texts, fresh)
+
+        return embeddings
+
+
+    def flush_cache(self) -> None:
+        '''
+        Writes new on-disk cache entries through; `embed_texts` leaves this to its
+        callers so a whole ingest run pays for one flush.
+        '''
+        if self.cache is not None:
+            self.cache.flush()
+
+
+    def _embed_uncached(self, texts: Sequence[str]) -> np.ndarray:
+        batch_size = self.settings.embeddings.batch_size
+        embeddings = np.empty((len(texts), self.embedding_dimension), dtype=np.float32)
+        starts = range(0, len(texts), batch_size)
+
+        max_workers = min(self.settings.embeddings.max_concurrent_batches, len(starts))
+
+        if max_workers <= 1:
+            for start in starts:
+                self._embed_batch_into(embeddings, start, texts[start:start + batch_size])
+
+            return embeddings
+
+        # The pool size bounds how many batch requests are in flight at once
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(self._embed_batch_into, embeddings, start, texts[start:start + batch_size])
+                for start in starts
+            ]
+
+            for future in futures:
+                future.result()
+
+        return embeddings
+
 
     def get_embedding_dimension(self) -> int:
         test_vector = self.embed_text('test')
         return test_vector.shape[0]
-    
+
+
+    def _create_cache(self) -> EmbeddingCache | None:
+        cache_settings = self.settings.embedding_cache
+
+        if not cache_settings.enabled:
+            return None
+
+        return EmbeddingCache(
+            cache_dir=self.settings.paths.embedding_cache_dir,
+            model_name=self.model_name,
+            dimension=self.embedding_dimension,
+            max_entries=cache_settings.max_entries,
+            dtype=cache_settings.dtype
+        )
+
+
+    def _create_query_cache(self) -> QueryEmbeddingCache | None:
+        query_cache_settings = self.settings.query_embedding_cache
+
+        if not query_cache_settings.enabled:
+            return None
+
+        return QueryEmbeddingCache(
+            model_name=self.model_name,
+            dimension=self.embedding_dimension,
+            max_entries=query_cache_settings.max_entries,
+            ttl_seconds=query_cache_settings.ttl_seconds
+        )
+
+
+    def _finish_query_embedding(
+        self,
+        query: str,
+        vector: np.ndarray,
+        source: str,
+        start_time: float
+    ) -> QueryEmbedding:
+        if source == 'api' and self._query_disk_tier is not None:
+            # Questions arrive one at a time; their disk writes are batched on a timer
+            self._query_disk_tier.put_many([query], vector[np.newaxis, :])
+            self._query_disk_tier.flush_if_due(self.settings.query_embedding_cache.disk_flush_seconds)
+
+        return self._record_query_embedding(query, vector, source, (perf_counter() - start_time) * 1000)
+
+
+    def _record_query_embedding(self, query: str, vector: np.ndarray, source: str, latency_ms: float) -> QueryEmbedding:
+        if self.query_cache is None:
+            return QueryEmbedding(vector, source, latency_ms, 0.0)
+
+        if source != 'memory':
+            self.query_cache.put(query, vector)
+
+        return QueryEmbedding(vector, source, latency_ms, self.query_cache.record(source, latency_ms))
+
+
+    @property
+    def _query_disk_tier(self) -> EmbeddingCache | None:
+        # The shared on-disk embedding cache backs the query cache unless it is disabled
+        if self.query_cache is not None and not self.settings.query_embedding_cache.disk_tier:
+            return None
+
+        return self.cache
+
+
+    def _embed_batch_into(self, out: np.ndarray, start: int, batch: Sequence[str]) -> None:
+        retrying = Retrying(
+            stop=stop_after_attempt(self.settings.embeddings.max_retries + 1),
+            wait=wait_exponential_jitter(initial=1, max=10),
+            reraise=True
+        )
+
+        # Only this batch is retried; batches already written to `out` are kept
+        vectors = retrying(self._embed_batch, batch)
+        out[start:start + len(batch)] = vectors
+
+
+    def _embed_batch(self, batch: Sequence[str]) -> np.ndarray:
+        self.rate_limiter.acquire()
+
+        response = self.client.models.embed_content(
+            model=self.model_name,
+            contents=list(batch)
+        )
+
+        vectors = np.array([embedding.values for embedding in response.embeddings], dtype=np.float32)
+
+        if vectors.shape != (len(batch), self.embedding_dimension):
+            raise ValueError(
+                f'Unexpected embedding batch shape: expected {(len(batch), self.embedding_dimension)}, '
+                f'got {vectors.shape}'
+            )
+
+        return normalize_rows(vectors)
+
 
 def normalize_vector(vector: np.array) -> np.ndarray:
     norm = np.linalg.norm(vector)
@@ -69,4 +327,10 @@ def normalize_vector(vector: np.array) -> np.ndarray:
     if norm == 0:
         return vector
     
-    return vector / norm
\ No newline at end of file
+    return vector / norm
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
\ No newline at end of file
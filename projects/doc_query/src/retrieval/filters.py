@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+
+import faiss
+import numpy as np
+
+from src.models.retrieval import RetrievalFilters
+from src.utils.ids import document_id_range
+
+
+def resolve_document_ids(filters: RetrievalFilters, catalog_entries: list[dict]) -> set[str] | None:
+    '''
+    Ids of the documents that satisfy every given criterion, or None when nothing
+    restricts the search. File type and ingest date criteria are read from the catalog.
+    '''
+    if filters.is_empty:
+        return None
+
+    document_ids = set(filters.document_ids) if filters.document_ids is not None else None
+
+    if not filters.uses_catalog:
+        return document_ids
+
+    matching_ids = {
+        entry['document_id']
+        for entry in catalog_entries
+        if _matches_catalog_entry(entry, filters)
+    }
+
+    return matching_ids if document_ids is None else document_ids & matching_ids
+
+
+def _matches_catalog_entry(entry: dict, filters: RetrievalFilters) -> bool:
+    if filters.file_types is not None and entry.get('file_type') not in filters.file_types:
+        return False
+
+    if filters.ingested_after is None and filters.ingested_before is None:
+        return True
+
+    ingested_at = datetime.fromisoformat(entry['ingested_at'])
+
+    if filters.ingested_after is not None and ingested_at < filters.ingested_after:
+        return False
+
+    return filters.ingested_before is None or ingested_at <= filters.ingested_before
+
+
+@dataclass(frozen=True)
+class DocumentFilter:
+    '''
+    Restricts a search to the chunks of a set of documents.
+
+    Every document owns one contiguous FAISS id range, so the filter resolves to snapshot
+    rows with a binary search per document. The search then skips non-members inside
+    FAISS: an id range or id set for the main index, a row bitmap for sidecars whose
+    labels are row numbers.
+    '''
+    ranges: tuple[tuple[int, int], ...]
+    ids: np.ndarray
+    row_mask: np.ndarray
+
+    @classmethod
+    def build(
+        cls,
+        document_ids: set[str],
+        sorted_ids: np.ndarray,
+        id_order: np.ndarray
+    ) -> 'DocumentFilter':
+        ranges = tuple(sorted(document_id_range(document_id) for document_id in document_ids))
+        row_mask = np.zeros(len(sorted_ids), dtype=bool)
+
+        for start, end in ranges:
+            low, high = np.searchsorted(sorted_ids, [start, end])
+            row_mask[id_order[low:high]] = True
+
+        ids = sorted_ids[row_mask[id_order]]
+
+        return cls(ranges, ids, row_mask)
+
+
+    @property
+    def size(self) -> int:
+        return len(self.ids)
+
+
+    def id_selector(self) -> faiss.IDSelector:
+        if len(self.ranges) == 1:
+            return faiss.IDSelectorRange(*self.ranges[0])
+
+        return faiss.IDSelectorBatch(self.ids)
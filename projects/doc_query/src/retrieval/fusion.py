@@ -0,0 +1,19 @@
+from __future__ import annotations
+
+from typing import Iterable
+
+
+def reciprocal_rank_fusion(ranked_lists: Iterable[Iterable[int]], k: int = 60) -> list[tuple[int, float]]:
+    '''
+    Fuses ranked id lists by summing `1 / (k + rank)` per id, best first.
+
+    Only ranks are used, so lists scored on different scales (cosine, BM25) combine
+    without calibration.
+    '''
+    fused: dict[int, float] = {}
+
+    for ranked in ranked_lists:
+        for rank, item_id in enumerate(ranked, start=1):
+            fused[item_id] = fused.get(item_id, 0.0) + 1.0 / (k + rank)
+
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import math
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+from src.config import VectorIndexSettings
+
+# k-means wants roughly this many training points per centroid
+MIN_POINTS_PER_CENTROID = 39
+
+SCALAR_QUANTIZER_CODES = {'float16': 'SQfp16', 'int8': 'SQ8'}
+
+# Filtered HNSW searches widen efSearch with the filter's selectivity up to this bound
+MAX_FILTERED_EF_SEARCH = 1024
+
+# IO_FLAG_MMAP_IFC (FAISS 1.9+) maps flat and HNSW codes too; older releases only map
+# IVF inverted lists and load the rest into memory
+MMAP_FLAG = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP)
+
+
+def build_index_description(
+    dimension: int,
+    settings: VectorIndexSettings,
+    num_train: int | None = None
+) -> str:
+    '''
+    FAISS `index_factory` string for the configured index type.
+
+    When the training sample is known, IVF list counts are clamped to what the sample
+    can support and PQ falls back to IVF-Flat if there are too few points for its codebooks.
+    Scalar quantization replaces the float32 storage of flat, IVF-Flat and HNSW indexes;
+    IVF-PQ already stores compressed codes and ignores it.
+    '''
+    storage = SCALAR_QUANTIZER_CODES.get(settings.quantization, 'Flat')
+
+    if settings.index_type == 'flat':
+        return storage
+
+    if settings.index_type == 'hnsw':
+        return f'HNSW{settings.hnsw_m}' if storage == 'Flat' else f'HNSW{settings.hnsw_m}_{storage}'
+
+    nlist = settings.nlist
+
+    if num_train is not None:
+        nlist = max(1, min(nlist, num_train // MIN_POINTS_PER_CENTROID))
+
+    if settings.index_type == 'ivf_flat':
+        return f'IVF{nlist},{storage}'
+
+    if dimension % settings.pq_m != 0:
+        raise ValueError(f'pq_m={settings.pq_m} must divide the embedding dimension {dimension}')
+
+    if num_train is not None and num_train < (1 << settings.pq_nbits):
+        return f'IVF{nlist},{storage}'
+
+    return f'IVF{nlist},PQ{settings.pq_m}x{settings.pq_nbits}'
+
+
+def create_index(
+    dimension: int,
+    settings: VectorIndexSettings,
+    num_train: int | None = None
+) -> faiss.Index:
+    description = build_index_description(dimension, settings, num_train)
+    index = faiss.index_factory(dimension, description, faiss.METRIC_INNER_PRODUCT)
+
+    if settings.index_type == 'hnsw':
+        faiss.downcast_index(index).hnsw.efConstruction = settings.ef_construction
+
+    configure_search(index, settings)
+
+    # Vectors are addressed by stable chunk ids rather than insertion order. IVF indexes
+    # store ids natively (and cannot delete through an id map); the others get wrapped.
+    if faiss.try_extract_index_ivf(index) is not None:
+        return index
+
+    return faiss.IndexIDMap2(index)
+
+
+def read_index(path: Path, mmap: bool = False) -> faiss.Index:
+    # Memory-mapped indexes reference the file's pages instead of copying the codes, so
+    # processes serving the same file share one copy in the page cache. They are
+    # read-only: writers must load a private copy.
+    return faiss.read_index(str(path), MMAP_FLAG if mmap else 0)
+
+
+def configure_search(index: faiss.Index, settings: VectorIndexSettings) -> None:
+    parameters = faiss.ParameterSpace()
+    ivf = faiss.try_extract_index_ivf(index)
+
+    if ivf is not None:
+        ivf.nprobe = min(settings.nprobe, ivf.nlist)
+        return
+
+    try:
+        parameters.set_index_parameter(index, 'efSearch', settings.ef_search)
+    except RuntimeError:
+        # Flat indexes have no query-time knobs
+        pass
+
+
+def has_stable_ids(index: faiss.Index) -> bool:
+    return isinstance(index, faiss.IndexIDMap2) or faiss.try_extract_index_ivf(index) is not None
+
+
+def supports_remove(index: faiss.Index) -> bool:
+    base = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    return not isinstance(base, faiss.IndexHNSW)
+
+
+def search_parameters(
+    index: faiss.Index,
+    selector: faiss.IDSelector,
+    selectivity: float = 1.0
+) -> faiss.SearchParameters:
+    '''
+    Per-call search parameters restricted to `selector`.
+
+    They replace the index's own, so the tuned nprobe / efSearch are carried along, scaled
+    up by the share of vectors the selector lets through: with a selective filter, the
+    lists or graph neighbourhood that normally hold the top-k contain few allowed vectors.
+    Non-members are skipped before any distance is computed, so the extra IVF lists cost
+    little more than the allowed vectors in them; HNSW still walks the graph through
+    non-members, hence the bound.
+    '''
+    boost = 1.0 / max(selectivity, 1e-6)
+    ivf = faiss.try_extract_index_ivf(index)
+
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=min(ivf.nlist, math.ceil(ivf.nprobe * boost)))
+
+    base = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+
+    if isinstance(base, faiss.IndexHNSW):
+        ef_search = min(math.ceil(base.hnsw.efSearch * boost), MAX_FILTERED_EF_SEARCH)
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=max(ef_search, base.hnsw.efSearch))
+
+    return faiss.SearchParameters(sel=selector)
+
+
+def search_subset(
+    index: faiss.Index,
+    query_matrix: np.ndarray,
+    top_k: int,
+    ids: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    # Exact inner product over the stored (decoded) vectors of `ids`; the cost follows the
+    # subset, not the index. Needs an id map, which IVF indexes do not keep.
+    vectors = index.reconstruct_batch(ids)
+    scores = query_matrix @ vectors.T
+    top_k = min(top_k, len(ids))
+    best = np.argsort(-scores, axis=1, kind='stable')[:, :top_k]
+
+    return np.take_along_axis(scores, best, axis=1).astype(np.float32), ids[best]
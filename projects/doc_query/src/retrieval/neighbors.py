@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+from typing import Any
+
+from src.utils.ids import neighbor_faiss_id
+
+
+def expand_neighbors(
+    selected_ids: list[int],
+    chunk_table: dict[int, dict[str, Any]],
+    window: int = 1,
+    max_chars: int | None = None
+) -> dict[int, int]:
+    '''
+    Adjacent chunks of the selected ones, looked up in the full chunk table.
+
+    Stable ids place a document's chunks at consecutive ids, so each neighbor is one id
+    away per step and one dict lookup. Nearer neighbors of every selected chunk are taken
+    before farther ones, and none is added once the selection plus neighbors would exceed
+    `max_chars`. Returns neighbor id -> position of the selected chunk it was reached from.
+    '''
+    chosen = set(selected_ids)
+    used_chars = sum(len(chunk_table[faiss_id]['text']) for faiss_id in selected_ids)
+    neighbors: dict[int, int] = {}
+
+    for distance in range(1, window + 1):
+        for position, faiss_id in enumerate(selected_ids):
+            for offset in (-distance, distance):
+                neighbor_id = neighbor_faiss_id(faiss_id, offset)
+                chunk_data = chunk_table.get(neighbor_id) if neighbor_id is not None else None
+
+                if chunk_data is None or neighbor_id in chosen:
+                    continue
+
+                if max_chars is not None and used_chars + len(chunk_data['text']) > max_chars:
+                    continue
+
+                chosen.add(neighbor_id)
+                neighbors[neighbor_id] = position
+                used_chars += len(chunk_data['text'])
+
+    return neighbors
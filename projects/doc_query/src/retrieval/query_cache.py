@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from time import monotonic
+
+import numpy as np
+
+from src.retrieval.embedding_cache import normalize_cache_text
+
+# Weight of the newest API call in the running estimate of a query embedding round-trip
+API_LATENCY_SMOOTHING = 0.2
+
+
+@dataclass(frozen=True)
+class QueryEmbedding:
+    vector: np.ndarray
+    source: str
+    latency_ms: float
+    saved_ms: float
+
+    def trace(self) -> dict[str, float | str]:
+        return {
+            'source': self.source,
+            'latency_ms': round(self.latency_ms, 3),
+            'saved_ms': round(self.saved_ms, 3)
+        }
+
+
+class QueryEmbeddingCache:
+    '''
+    In-process LRU of query embeddings with a time-to-live.
+
+    Keys are (model, dimension, whitespace-normalized question), matching the on-disk
+    embedding cache that serves as the shared second tier. The time-to-live applies to
+    this tier only; the disk tier has none and is bounded by LRU alone. Saved latency is
+    estimated from a running average of the API round-trips this cache has observed.
+    '''
+
+    def __init__(
+        self,
+        model_name: str,
+        dimension: int,
+        max_entries: int,
+        ttl_seconds: float | None = None
+    ) -> None:
+        self.model_name = model_name
+        self.dimension = dimension
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.saved_ms = 0.0
+        self.api_latency_ms: float | None = None
+
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple[str, int, str], tuple[np.ndarray, float]] = OrderedDict()
+
+
+    def make_key(self, query: str) -> tuple[str, int, str]:
+        return self.model_name, self.dimension, normalize_cache_text(query)
+
+
+    def get(self, query: str) -> np.ndarray | None:
+        key = self.make_key(query)
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                return None
+
+            vector, expires_at = entry
+
+            if expires_at <= monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                return None
+
+            self._entries.move_to_end(key)
+            return vector
+
+
+    def put(self, query: str, vector: np.ndarray) -> None:
+        expires_at = monotonic() + self.ttl_seconds if self.ttl_seconds is not None else float('inf')
+        key = self.make_key(query)
+
+        # Cached vectors are shared between callers
+        vector = vector.copy()
+        vector.flags.writeable = False
+
+        with self._lock:
+            self._entries[key] = (vector, expires_at)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+    def record(self, source: str, latency_ms: float) -> float:
+        '''
+        Counts a lookup served from `source` ('memory', 'disk' or 'api') and returns the
+        latency it saved against the estimated API round-trip.
+        '''
+        with self._lock:
+            if source == 'api':
+                self.misses += 1
+                self.api_latency_ms = (
+                    latency_ms if self.api_latency_ms is None else
+                    (1 - API_LATENCY_SMOOTHING) * self.api_latency_ms + API_LATENCY_SMOOTHING * latency_ms
+                )
+                return 0.0
+
+            if source == 'memory':
+                self.memory_hits += 1
+            else:
+                self.disk_hits += 1
+
+            saved_ms = max(0.0, (self.api_latency_ms or 0.0) - latency_ms)
+            self.saved_ms += saved_ms
+            return saved_ms
+
+
+    def stats(self) -> dict[str, float | int]:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'expirations': self.expirations,
+                'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                'saved_ms': round(self.saved_ms, 3)
+            }
@@ -5,6 +5,8 @@ import re
 from dataclasses import dataclass
 from typing import Any, Dict, List
 
+import numpy as np
+
 from src.models.retrieval import RetrievedChunk
 
 
@@ -34,13 +36,13 @@ class RerankerChunk:
 
 def normalize_text(text: str) -> str:
     text = text.lower()
-    text = re.sub(r'\s+', '', text)
+    text = re.sub(r'\s+', ' ', text)
     return text.strip()
 
 
 def tokenize(text: str) -> List[str]:
     text = normalize_text(text)
-    tokens = re.findall(f'\b[a-z0-9]+\b', text)
+    tokens = re.findall(r'\b[a-z0-9]+\b', text)
     return [t for t in tokens if t not in STOP_WORDS and len(t) > 1]
 
 
@@ -56,21 +58,22 @@ def keyword_overlap_score(query: str, chunk_text: str) -> float:
 
 
 def exact_match_score(query: str, chunk_text: str) -> float:
-    query_norm = normalize_text(query)
-    chunk_norm = normalize_text(chunk_text)
+    return _exact_match(normalize_text(query), query_phrases(query), normalize_text(chunk_text))
+
+
+def query_phrases(query: str) -> List[str]:
+    # Consecutive pairs of query terms, matched against the normalized chunk text
+    query_tokens = tokenize(query)
+    return [' '.join(query_tokens[i:i + 2]) for i in range(len(query_tokens) - 1)]
+
 
+def _exact_match(query_norm: str, phrases: List[str], chunk_norm: str) -> float:
     if query_norm in chunk_norm:
         return 1.0
-    
-    query_tokens = tokenize(query)
 
-    if len(query_tokens) >= 2:
-        for i in range(len(query_tokens) - 1):
-            phrase = ' '.join(query_tokens[i:i + 2])
+    if any(phrase in chunk_norm for phrase in phrases):
+        return 0.6
 
-            if phrase in chunk_norm:
-                return 0.6
-            
     return 0.0
 
 
@@ -96,76 +99,160 @@ def min_max_normalize(values: List[float]) -> List[float]:
     return [(v - min_v) / (max_v - min_v) for v in values]
 
 
-def rerank_chunks(query: str, chunks: List[RetrievedChunk]) -> List[RerankerChunk]:
-    if not chunks:
-        return []
-    
-    semantic_scores = [chunk.score for chunk in chunks]
-    semantic_scores = min_max_normalize(semantic_scores)
+def encode_tokens(tokens: List[str], term_index: Dict[str, int]) -> np.ndarray:
+    '''
+    Maps tokens to vocabulary ids. Tokens outside the vocabulary get distinct negative ids,
+    so they still count as query terms but never match a chunk.
+    '''
+    unknown: Dict[str, int] = {}
 
-    reranked: List[RetrievedChunk] = []
+    return np.array(
+        [term_index[t] if t in term_index else -1 - unknown.setdefault(t, len(unknown)) for t in tokens],
+        dtype=np.int64
+    )
 
-    for chunk, semantic_score in zip(chunks, semantic_scores):
-        kw_score = keyword_overlap_score(query, chunk.text)
-        ex_score = exact_match_score(query, chunk.text)
-        p_bonus = position_bonus(chunk.metadata)
 
-        final_score = (
-            0.65 * semantic_score +
-            0.25 * kw_score +
-            0.05 * ex_score +
-            0.05 * p_bonus
-        )
+def gather_segments(values: np.ndarray, offsets: np.ndarray, rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # Concatenates `values[offsets[r]:offsets[r + 1]]` for each row, with the new offsets
+    starts = offsets[rows]
+    lengths = offsets[rows + 1] - starts
+    new_offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    positions = np.repeat(starts - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+
+    return values[positions], new_offsets
 
-        reranked.append(
-            RerankerChunk(
-                chunk_id=chunk.chunk_id,
-                document_id=chunk.document_id,
-                text=chunk.text,
-                source=chunk.filename,
-                page_number=chunk.page_number,
-                section_title=chunk.section_title,
-                semantic_score=semantic_score,
-                keyword_score=kw_score,
-                exact_match_score=ex_score,
-                position_bonus=p_bonus,
-                final_score=final_score,
-                metadata=chunk.metadata
-            )
-        )
 
-    reranked.sort(key=lambda c: c.final_score, reverse=True)
-    return reranked
+def tokenize_chunks(texts: List[str], term_index: Dict[str, int]) -> tuple[np.ndarray, np.ndarray]:
+    # Fallback for chunks without precomputed tokens; grows `term_index` in place
+    sequences = [[term_index.setdefault(t, len(term_index)) for t in tokenize(text)] for text in texts]
+    offsets = np.concatenate([[0], np.cumsum([len(seq) for seq in sequences])]).astype(np.int64)
+    tokens = np.fromiter((t for seq in sequences for t in seq), dtype=np.int64, count=int(offsets[-1]))
 
+    return tokens, offsets
+
+
+@dataclass
+class RerankResult:
+    '''
+    Reranking signals as arrays aligned with `chunks`, with `order` ranking them best first.
+
+    `RerankerChunk` objects are only built for the candidates that are actually used.
+    '''
+    chunks: List[RetrievedChunk]
+    semantic_scores: np.ndarray
+    keyword_scores: np.ndarray
+    exact_match_scores: np.ndarray
+    position_bonuses: np.ndarray
+    final_scores: np.ndarray
+    order: np.ndarray
+
+    def chunk_at(self, i: int) -> RerankerChunk:
+        chunk = self.chunks[i]
+
+        return RerankerChunk(
+            chunk_id=chunk.chunk_id,
+            document_id=chunk.document_id,
+            text=chunk.text,
+            source=chunk.filename,
+            page_number=chunk.page_number,
+            section_title=chunk.section_title,
+            semantic_score=float(self.semantic_scores[i]),
+            keyword_score=float(self.keyword_scores[i]),
+            exact_match_score=float(self.exact_match_scores[i]),
+            position_bonus=float(self.position_bonuses[i]),
+            final_score=float(self.final_scores[i]),
+            metadata=chunk.metadata
+        )
 
-def expand_with_neighbors(
-    selected_chunks: list[RerankerChunk], 
-    all_chunks: list[RerankerChunk], 
-    window=1
-) -> list[RerankerChunk]:
-    expanded = {}
 
-    # Build lookup by chunk index
-    by_doc = {}
+    def ranked(self, limit: int | None = None) -> List[RerankerChunk]:
+        return [self.chunk_at(i) for i in self.order[:limit]]
+
+
+def rerank_tokens(
+    query: str,
+    query_ids: np.ndarray,
+    chunks: List[RetrievedChunk],
+    chunk_tokens: np.ndarray,
+    chunk_offsets: np.ndarray
+) -> RerankResult:
+    '''
+    Scores every candidate at once from token ids.
+
+    Keyword overlap is the share of distinct query terms found in the chunk. Exact match
+    is `exact_match_score` on the chunk text: it depends on stop words and punctuation,
+    which the token ids leave out.
+    '''
+    n = len(chunks)
+    segments = np.repeat(np.arange(n), np.diff(chunk_offsets))
+    chunk_tokens = chunk_tokens.astype(np.int64)
+    base = int(max(chunk_tokens.max(initial=0), query_ids.max(initial=0))) + 1
+
+    semantic = np.array([chunk.score for chunk in chunks], dtype=np.float64)
+    low, span = (semantic.min(), np.ptp(semantic)) if n else (0.0, 0.0)
+    semantic = np.ones(n) if math.isclose(span, 0.0) else (semantic - low) / span
+
+    query_terms = np.unique(query_ids)
+    present = np.isin(chunk_tokens, query_terms[query_terms >= 0])
+    matched = np.unique(segments[present] * base + chunk_tokens[present])
+    keyword = (
+        np.bincount(matched // base, minlength=n) / len(query_terms)
+        if len(query_terms) else np.zeros(n)
+    )
 
-    for chunk in all_chunks:
-        doc_id = chunk.metadata.get('doc_id')
-        by_doc.setdefault(doc_id, {})[chunk.metadata.get('chunk_index')] = chunk
+    query_norm = normalize_text(query)
+    phrases = query_phrases(query)
+    exact_match = np.array(
+        [_exact_match(query_norm, phrases, normalize_text(chunk.text)) for chunk in chunks],
+        dtype=np.float64
+    )
+
+    chunk_indices = np.array(
+        [chunk.metadata.get('chunk_index', np.nan) for chunk in chunks],
+        dtype=np.float64
+    )
+    position = np.where(np.isnan(chunk_indices), 0.0, np.maximum(0.0, 1.0 - chunk_indices / 2.0))
+
+    final = (
+        0.65 * semantic +
+        0.25 * keyword +
+        0.05 * exact_match +
+        0.05 * position
+    )
+
+    return RerankResult(
+        chunks=chunks,
+        semantic_scores=semantic,
+        keyword_scores=keyword,
+        exact_match_scores=exact_match,
+        position_bonuses=position,
+        final_scores=final,
+        order=np.argsort(-final, kind='stable')
+    )
 
-    for chunk in selected_chunks:
-        doc_id = chunk.metadata.get('doc_id')
-        idx = chunk.metadata.get('chunk_index')
 
-        for offset in range(-window, window + 1):
-            neighbor_idx = idx + offset
-            neighbor = by_doc.get(doc_id, {}).get(neighbor_idx)
+def rerank_chunks(query: str, chunks: List[RetrievedChunk]) -> List[RerankerChunk]:
+    if not chunks:
+        return []
 
-            if neighbor:
-                expanded[(doc_id, neighbor_idx)] = neighbor
+    return rerank_many([query], [chunks])[0].ranked()
 
-    result: list[RerankerChunk] = []
 
-    for chunk in expanded.values():
-        result.append(chunk)
+def rerank_many(queries: List[str], chunk_lists: List[List[RetrievedChunk]]) -> List[RerankResult]:
+    '''
+    Reranks chunks that have no precomputed tokens; each distinct chunk is tokenized once.
+    '''
+    term_index: Dict[str, int] = {}
+    unique_chunks = list({chunk.chunk_id: chunk for chunks in chunk_lists for chunk in chunks}.values())
+    row_by_id = {chunk.chunk_id: row for row, chunk in enumerate(unique_chunks)}
+    tokens, offsets = tokenize_chunks([chunk.text for chunk in unique_chunks], term_index)
 
-    return result
\ No newline at end of file
+    return [
+        rerank_tokens(
+            query,
+            encode_tokens(tokenize(query), term_index),
+            chunks,
+            *gather_segments(tokens, offsets, np.array([row_by_id[c.chunk_id] for c in chunks], dtype=np.int64))
+        )
+        for query, chunks in zip(queries, chunk_lists)
+    ]
\ No newline at end of file
@@ -1,50 +1,294 @@
 from __future__ import annotations
 
+from typing import Any
+
+import numpy as np
+
 from src.config import get_settings
-from src.models.retrieval import RetrievedChunk
+from src.ingest.catalog import list_document_entries
+from src.models.retrieval import RetrievalFilters, RetrievedChunk
 from src.retrieval.embeddings import EmbeddingClient
-from src.retrieval.vector_store import FaissVectorStore
-from src.retrieval.reranker import RerankerChunk, rerank_chunks, expand_with_neighbors
+from src.retrieval.filters import DocumentFilter, resolve_document_ids
+from src.retrieval.fusion import reciprocal_rank_fusion
+from src.retrieval.neighbors import expand_neighbors
+from src.retrieval.query_cache import QueryEmbedding
+from src.retrieval.sharded_store import ShardedDocumentFilter, ShardedSnapshot, create_vector_store
+from src.retrieval.vector_store import IndexSnapshot
+from src.retrieval.reranker import RerankerChunk, RerankResult, rerank_many, rerank_tokens
+from src.utils.executors import run_blocking
 
 
 class Retriever:
     def __init__(self) -> None:
         self.settings = get_settings()
         self.embedding_client = EmbeddingClient()
-        self.vector_store = FaissVectorStore()
+        self.vector_store = create_vector_store()
 
 
     def retrieve(
         self,
         question: str,
-        top_k: int | None = None
+        top_k: int | None = None,
+        filters: RetrievalFilters | None = None,
+        trace: dict[str, Any] | None = None,
+        query_embedding: QueryEmbedding | None = None,
+        min_score: float | None = None
     ) -> list[RetrievedChunk]:
+        '''
+        Retrieves the context chunks for one question. When `trace` is given, retrieval
+        details for the query trace are added to it. A caller that already embedded the
+        question passes `query_embedding`. An empty result means no chunk cleared the
+        similarity threshold (`min_score`, else the configured one).
+        '''
         if not question or not question.strip():
             raise ValueError('Question must not be empty')
         
-        effective_top_k = top_k or self.settings.retrieval.default_top_k
+        effective_top_k = top_k or self.settings.retrieval.default_final_top_k
+        effective_top_k = min(effective_top_k, self.settings.retrieval.max_top_k)
+
+        initial_top_k = self.settings.retrieval.default_initial_top_k
+        initial_top_k = min(initial_top_k, self.settings.retrieval.max_top_k)
+
+        # Step 1: Embed query, through the query embedding cache
+        query_embedding = query_embedding or self.embedding_client.embed_query_cached(question)
+        query_vector = query_embedding.vector
+
+        if trace is not None:
+            trace['query_embedding'] = query_embedding.trace()
+
+            if self.embedding_client.query_cache is not None:
+                trace['query_embedding_cache'] = self.embedding_client.query_cache.stats()
+
+        # Step 2: Initial retrieval (recall stage) against the resident index snapshot
+        snapshot = self.vector_store.get_snapshot()
+        document_filter = self._document_filter(filters, snapshot)
+        scores, indices = snapshot.search(query_vector, initial_top_k, document_filter)
+
+        return self._rank(
+            [question],
+            scores,
+            indices,
+            snapshot,
+            effective_top_k,
+            min_score,
+            document_filter,
+            traces=[trace] if trace is not None else None
+        )[0]
+
+
+    async def retrieve_async(
+        self,
+        question: str,
+        top_k: int | None = None,
+        filters: RetrievalFilters | None = None,
+        trace: dict[str, Any] | None = None,
+        query_embedding: QueryEmbedding | None = None,
+        min_score: float | None = None
+    ) -> list[RetrievedChunk]:
+        '''
+        `retrieve` for the async path: the question is embedded on the async client, then
+        the index search and rerank run on the bounded blocking executor.
+        '''
+        if not question or not question.strip():
+            raise ValueError('Question must not be empty')
+
+        query_embedding = query_embedding or await self.embedding_client.embed_query_cached_async(question)
+
+        return await run_blocking(self.retrieve, question, top_k, filters, trace, query_embedding, min_score)
+
+
+    def retrieve_many(
+        self,
+        questions: list[str],
+        top_k: int | None = None,
+        filters: RetrievalFilters | None = None,
+        min_score: float | None = None
+    ) -> list[list[RetrievedChunk]]:
+        '''
+        `retrieve` for many questions, in order, with one embedding pass, one matrix search
+        against the snapshot and one rerank pass. `filters` apply to every question.
+        '''
+        if any(not question or not question.strip() for question in questions):
+            raise ValueError('Questions must not be empty')
+
+        if not questions:
+            return []
+
+        effective_top_k = top_k or self.settings.retrieval.default_final_top_k
         effective_top_k = min(effective_top_k, self.settings.retrieval.max_top_k)
 
         initial_top_k = self.settings.retrieval.default_initial_top_k
         initial_top_k = min(initial_top_k, self.settings.retrieval.max_top_k)
 
-        # Step 1: Embed query
-        query_vector = self.embedding_client.embed_query(question)
+        # Step 1: Embed all queries through the query cache, the misses in batched requests
+        query_embeddings = self.embedding_client.embed_queries_cached(questions)
+        query_matrix = np.stack([query_embedding.vector for query_embedding in query_embeddings])
+
+        # Step 2: One search over the query matrix against a single snapshot
+        snapshot = self.vector_store.get_snapshot()
+        document_filter = self._document_filter(filters, snapshot)
+        scores, indices = snapshot.search_many(query_matrix, initial_top_k, document_filter)
+
+        return self._rank(questions, scores, indices, snapshot, effective_top_k, min_score, document_filter)
+
+
+    def _document_filter(
+        self,
+        filters: RetrievalFilters | None,
+        snapshot: IndexSnapshot | ShardedSnapshot
+    ) -> DocumentFilter | ShardedDocumentFilter | None:
+        if filters is None or filters.is_empty:
+            return None
+
+        document_ids = resolve_document_ids(
+            filters,
+            list_document_entries() if filters.uses_catalog else []
+        )
+
+        return snapshot.document_filter(document_ids)
+
+
+    def _rank(
+        self,
+        questions: list[str],
+        scores: np.ndarray,
+        indices: np.ndarray,
+        snapshot: IndexSnapshot | ShardedSnapshot,
+        top_k: int,
+        min_score: float | None = None,
+        document_filter: DocumentFilter | ShardedDocumentFilter | None = None,
+        traces: list[dict[str, Any]] | None = None
+    ) -> list[list[RetrievedChunk]]:
+        # Step 3: Drop weak dense matches, fuse in the BM25 matches (hybrid mode), and build
+        # `RetrievedChunk` objects per query; a query left with no candidate is refused
+        # here, before reranking or generation
+        threshold = min_score if min_score is not None else self.settings.retrieval.min_similarity_threshold
+        gated = [self._gate(row_scores, row_indices, top_k, threshold) for row_scores, row_indices in zip(scores, indices)]
+        candidates: list[tuple[list[RetrievedChunk], np.ndarray]] = []
+
+        for question, (row_scores, row_indices, _, _) in zip(questions, gated):
+            fused_scores, fused_indices = self._fuse_lexical(question, row_scores, row_indices, snapshot, document_filter)
+            candidates.append(
+                self._build_candidates(fused_scores, fused_indices, snapshot.chunk_table)
+                if len(fused_indices) else ([], np.empty(0, dtype=np.int64))
+            )
+
+        if traces is not None:
+            for trace, (_, _, _, gate_trace), (chunks, _) in zip(traces, gated, candidates):
+                trace['score_gate'] = {**gate_trace, 'passed': len(chunks) > 0}
+
+        answerable = [i for i, (chunks, _) in enumerate(candidates) if chunks]
+
+        # Step 4: Rerank, using the token sequences precomputed at ingest when available
+        lexical = snapshot.bm25
+
+        if lexical is not None and lexical.has_chunk_tokens:
+            results = [
+                rerank_tokens(
+                    questions[i],
+                    lexical.encode_query(questions[i]),
+                    candidates[i][0],
+                    *lexical.tokens_for(candidates[i][1])
+                )
+                for i in answerable
+            ]
+        else:
+            results = rerank_many([questions[i] for i in answerable], [candidates[i][0] for i in answerable])
+
+        ranked: list[list[RetrievedChunk]] = [[] for _ in questions]
 
-        # Step 2: Initial retrieval (recall stage)
-        scores, indices = self.vector_store.search(query_vector, initial_top_k)
+        for i, result in zip(answerable, results):
+            ranked[i] = self._select(result, candidates[i][1], snapshot.chunk_table, gated[i][2])
 
-        # Step 3: Build `RetrievedChunk` objects`
-        metadata = self.vector_store.load_metadata()
-        chunks = metadata.get('chunks', [])
+        return ranked
 
+
+    def _gate(
+        self,
+        scores: np.ndarray,
+        indices: np.ndarray,
+        top_k: int,
+        min_score: float
+    ) -> tuple[np.ndarray, np.ndarray, int, dict[str, Any]]:
+        '''
+        Keeps the dense candidates whose similarity reaches `min_score`. In adaptive mode
+        `top_k` is also cut at the first drop of `adaptive_drop_off` or more between
+        consecutive similarities, so a few strong matches are not padded with weak ones.
+        Scores are the raw dense similarities, also in hybrid mode, where fused scores
+        are ranks rather than similarities. The gate applies to dense candidates only:
+        BM25 matches are fused in after it, so keyword-only matches (codes, names, exact
+        clause titles) are still answered when no dense similarity clears the threshold.
+        '''
+        valid = indices >= 0
+        top_score = float(scores[valid][0]) if valid.any() else None
+        keep = valid & (scores >= min_score)
+        scores, indices = scores[keep], indices[keep]
+        final_top_k = top_k
+
+        if self.settings.retrieval.adaptive_top_k and len(scores) > 1:
+            drops = np.flatnonzero(scores[:-1] - scores[1:] >= self.settings.retrieval.adaptive_drop_off)
+
+            if len(drops):
+                final_top_k = min(top_k, int(drops[0]) + 1)
+
+        gate_trace = {
+            'min_score': min_score,
+            'top_score': round(top_score, 4) if top_score is not None else None,
+            'passed': len(indices) > 0,
+            'candidates_kept': len(indices),
+            'top_k': top_k,
+            'final_top_k': final_top_k
+        }
+
+        return scores, indices, final_top_k, gate_trace
+
+
+    def _fuse_lexical(
+        self,
+        question: str,
+        scores: np.ndarray,
+        indices: np.ndarray,
+        snapshot: IndexSnapshot | ShardedSnapshot,
+        document_filter: DocumentFilter | ShardedDocumentFilter | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        '''
+        In hybrid mode, merges the BM25 candidates into the dense ones with reciprocal
+        rank fusion; the fused score then stands in for the semantic score.
+        '''
+        if not self.settings.retrieval.hybrid or snapshot.bm25 is None:
+            return scores, indices
+
+        _, lexical_ids = snapshot.lexical_search(
+            question,
+            self.settings.retrieval.bm25_top_k,
+            document_filter
+        )
+        fused = reciprocal_rank_fusion(
+            [indices[indices >= 0].tolist(), lexical_ids.tolist()],
+            k=self.settings.retrieval.rrf_k
+        )
+
+        return (
+            np.array([score for _, score in fused], dtype=np.float32),
+            np.array([faiss_id for faiss_id, _ in fused], dtype=np.int64)
+        )
+
+
+    def _build_candidates(
+        self,
+        scores: np.ndarray,
+        indices: np.ndarray,
+        chunk_table: dict[int, dict]
+    ) -> tuple[list[RetrievedChunk], np.ndarray]:
         retrieved_chunks: list[RetrievedChunk] = []
+        retrieved_ids: list[int] = []
 
-        if len(indices) == 0 or len(indices[0]) == 0:
-            return retrieved_chunks
-        
-        for score, idx in zip(scores[0], indices[0]):
-            chunk_data = chunks[idx]['chunk']
+        for score, idx in zip(scores, indices):
+            chunk_data = chunk_table.get(int(idx))
+
+            # FAISS pads missing results with -1 when fewer than `top_k` vectors exist
+            if chunk_data is None:
+                continue
 
             retrieved_chunks.append(
                 RetrievedChunk(
@@ -59,16 +303,62 @@ class Retriever:
                     metadata=chunk_data.get('metadata', {})
                 )
             )
+            retrieved_ids.append(int(idx))
 
-        # Step 4: Rerank
-        reranked: list[RerankerChunk] = rerank_chunks(question, retrieved_chunks)
+        return retrieved_chunks, np.array(retrieved_ids, dtype=np.int64)
 
+
+    def _select(
+        self,
+        reranked: RerankResult,
+        ids: np.ndarray,
+        chunk_table: dict[int, dict],
+        final_top_k: int
+    ) -> list[RetrievedChunk]:
         # Step 5: Select final chunks for LLM
-        final_top_k = self.settings.retrieval.default_final_top_k
-        selected: list[RerankerChunk] = reranked[:final_top_k]
+        selected: list[RerankerChunk] = reranked.ranked(final_top_k)
+        selected_ids = [int(ids[i]) for i in reranked.order[:final_top_k]]
+
+        expanded_selection: list[RetrievedChunk] = [
+            RetrievedChunk(
+                chunk_id=chunk.chunk_id,
+                document_id=chunk.document_id,
+                filename=chunk.source,
+                text=chunk.text,
+                score=chunk.final_score,
+                rank=0,
+                page_number=chunk.page_number,
+                section_title=chunk.section_title,
+                metadata=chunk.metadata
+            )
+            for chunk in selected
+        ]
 
-        # Expand the selection to include neighbors
-        expanded_selection: list[RerankerChunk] = expand_with_neighbors(selected, reranked)
+        # Expand the selection with adjacent chunks from the full chunk store, within the
+        # context budget; a neighbor carries the score of the chunk it was reached from
+        neighbors = expand_neighbors(
+            selected_ids,
+            chunk_table,
+            window=self.settings.retrieval.neighbor_window,
+            max_chars=self.settings.retrieval.max_context_chars
+        )
+
+        for neighbor_id, position in neighbors.items():
+            chunk_data = chunk_table[neighbor_id]
+
+            expanded_selection.append(
+                RetrievedChunk(
+                    chunk_id=chunk_data['chunk_id'],
+                    document_id=chunk_data['document_id'],
+                    filename=chunk_data.get('filename', 'unknown'),
+                    text=chunk_data['text'],
+                    score=selected[position].final_score,
+                    rank=0,
+                    page_number=chunk_data['page_number'],
+                    section_title=chunk_data.get('section_title', 'N/A'),
+                    metadata=chunk_data.get('metadata', {})
+                )
+            )
 
         # Step 6: Reorder by document order
         expanded_selection = sorted(
@@ -79,21 +369,4 @@ class Retriever:
             )
         )
 
-        top_chunks: list[RetrievedChunk] = []
-
-        for i, chunk in enumerate(expanded_selection, start=1):
-            top_chunks.append(
-                RetrievedChunk(
-                    chunk_id=chunk.chunk_id,
-                    document_id=chunk.document_id,
-                    filename=chunk.source,
-                    text=chunk.text,
-                    score=chunk.final_score,
-                    rank=i,
-                    page_number=chunk.page_number,
-                    section_title=chunk.section_title,
-                    metadata=chunk.metadata
-                )
-            )
-
-        return top_chunks
\ No newline at end of file
+        return [chunk.model_copy(update={'rank': i}) for i, chunk in enumerate(expanded_selection, start=1)]
\ No newline at end of file
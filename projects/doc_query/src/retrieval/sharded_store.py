@@ -0,0 +1,522 @@
+from __future__ import annotations
+
+import hashlib
+import heapq
+import json
+import os
+import threading
+from collections import defaultdict
+from collections.abc import Iterator, Mapping
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import cached_property
+from itertools import chain, islice
+from typing import Any
+
+import numpy as np
+
+from src.config import get_settings
+from src.models.chunk import ChunkRecord
+from src.retrieval.compression import VectorEncoding
+from src.retrieval.filters import DocumentFilter
+from src.retrieval.reranker import encode_tokens, tokenize
+from src.retrieval.vector_store import FaissVectorStore, IndexSnapshot, IndexWriter
+from src.utils.ids import shard_for_document, shard_for_faiss_id
+
+MANIFEST_FILENAME = 'shards.json'
+
+
+def create_vector_store() -> FaissVectorStore | ShardedVectorStore:
+    # One shard keeps the original single-file layout
+    if get_settings().vector_index.num_shards == 1:
+        return FaissVectorStore()
+
+    return ShardedVectorStore()
+
+
+def merge_top_k(
+    results: list[tuple[np.ndarray, np.ndarray]],
+    top_k: int
+) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Merges per-shard `(scores, ids)` rows, each sorted by descending score, into the
+    global top-k per row. Padding ids (-1) are dropped and the result is re-padded.
+    '''
+    num_rows = len(results[0][0]) if results else 0
+    scores = np.full((num_rows, top_k), -np.inf, dtype=np.float32)
+    ids = np.full((num_rows, top_k), -1, dtype=np.int64)
+
+    for row in range(num_rows):
+        merged = heapq.merge(
+            *(zip(shard_scores[row].tolist(), shard_ids[row].tolist()) for shard_scores, shard_ids in results),
+            key=lambda pair: -pair[0]
+        )
+        best = list(islice((pair for pair in merged if pair[1] >= 0), top_k))
+
+        if best:
+            scores[row, :len(best)], ids[row, :len(best)] = zip(*best)
+
+    return scores, ids
+
+
+class ShardedChunkTable(Mapping):
+    # Chunk tables of all shards behind one mapping; lookups go straight to the owning shard
+    def __init__(self, tables: tuple[dict[int, dict[str, Any]], ...]) -> None:
+        self.tables = tables
+
+
+    def __getitem__(self, faiss_id: int) -> dict[str, Any]:
+        return self.tables[shard_for_faiss_id(faiss_id, len(self.tables))][faiss_id]
+
+
+    def __iter__(self) -> Iterator[int]:
+        return chain.from_iterable(self.tables)
+
+
+    def __len__(self) -> int:
+        return sum(len(table) for table in self.tables)
+
+
+class ShardedLexicalIndex:
+    '''
+    Chunk token sequences of all shards in one vocabulary, for the reranker.
+
+    Each shard's BM25 index numbers its own terms; the shard vocabularies are merged once
+    per snapshot and shard token ids are remapped as they are gathered.
+    '''
+
+    def __init__(self, shards: tuple[IndexSnapshot, ...]) -> None:
+        self.shards = shards
+        self.term_index: dict[str, int] = {}
+        self._remaps = [
+            np.array(
+                [self.term_index.setdefault(term, len(self.term_index)) for term in shard.bm25.vocabulary],
+                dtype=np.int64
+            ) if shard.bm25 is not None else None
+            for shard in shards
+        ]
+
+
+    @property
+    def has_chunk_tokens(self) -> bool:
+        return all(shard.bm25 is None or shard.bm25.has_chunk_tokens for shard in self.shards)
+
+
+    def encode_query(self, query: str) -> np.ndarray:
+        return encode_tokens(tokenize(query), self.term_index)
+
+
+    def tokens_for(self, faiss_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        segments: list[np.ndarray] = [np.empty(0, dtype=np.int64)] * len(faiss_ids)
+        owners = shard_for_faiss_id(faiss_ids, len(self.shards))
+
+        for shard_index in np.unique(owners):
+            positions = np.flatnonzero(owners == shard_index)
+            tokens, offsets = self.shards[shard_index].bm25.tokens_for(faiss_ids[positions])
+            tokens = self._remaps[shard_index][tokens]
+
+            for j, position in enumerate(positions):
+                segments[position] = tokens[offsets[j]:offsets[j + 1]]
+
+        offsets = np.concatenate([[0], np.cumsum([len(segment) for segment in segments])]).astype(np.int64)
+        tokens = np.concatenate(segments) if segments else np.empty(0, dtype=np.int64)
+
+        return tokens, offsets
+
+
+@dataclass(frozen=True)
+class ShardedDocumentFilter:
+    # One filter per shard; None where the shard holds none of the allowed documents
+    shards: tuple[DocumentFilter | None, ...]
+
+    @property
+    def size(self) -> int:
+        return sum(shard.size for shard in self.shards if shard is not None)
+
+
+@dataclass(frozen=True)
+class ShardedSnapshot:
+    '''
+    Immutable view over one snapshot per shard.
+
+    Searches fan out over a thread pool (FAISS releases the GIL while it searches) and
+    the per-shard results are merged with a heap. BM25 scores use per-shard statistics,
+    which is close to global BM25 while documents spread evenly over shards.
+    '''
+    shards: tuple[IndexSnapshot, ...]
+    executor: ThreadPoolExecutor
+
+    @cached_property
+    def chunk_table(self) -> ShardedChunkTable:
+        return ShardedChunkTable(tuple(shard.chunk_table for shard in self.shards))
+
+
+    @cached_property
+    def bm25(self) -> ShardedLexicalIndex | None:
+        # Shards without chunks may never have been written; the others all need BM25
+        if any(shard.bm25 is None and shard.chunk_table for shard in self.shards):
+            return None
+
+        return ShardedLexicalIndex(self.shards)
+
+
+    @cached_property
+    def version(self) -> str | None:
+        versions = [shard.version for shard in self.shards]
+
+        if all(version is None for version in versions):
+            return None
+
+        digest = hashlib.sha1('|'.join(str(version) for version in versions).encode('utf-8')).hexdigest()
+        return f'shards_{digest[:12]}'
+
+
+    @property
+    def encoding(self) -> VectorEncoding:
+        return self.shards[0].encoding
+
+
+    def document_filter(self, document_ids: set[str]) -> ShardedDocumentFilter:
+        by_shard: dict[int, set[str]] = defaultdict(set)
+
+        for document_id in document_ids:
+            by_shard[shard_for_document(document_id, len(self.shards))].add(document_id)
+
+        return ShardedDocumentFilter(tuple(
+            shard.document_filter(by_shard[i]) if i in by_shard else None
+            for i, shard in enumerate(self.shards)
+        ))
+
+
+    def search(
+        self,
+        query_vector: np.ndarray,
+        top_k: int,
+        document_filter: ShardedDocumentFilter | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        return self.search_many(np.expand_dims(query_vector, axis=0), top_k, document_filter)
+
+
+    def search_many(
+        self,
+        query_matrix: np.ndarray,
+        top_k: int,
+        document_filter: ShardedDocumentFilter | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        results = self._fan_out(
+            lambda shard, shard_filter: shard.search_many(query_matrix, top_k, shard_filter),
+            document_filter
+        )
+
+        if not results:
+            return (
+                np.empty((len(query_matrix), 0), dtype=np.float32),
+                np.empty((len(query_matrix), 0), dtype=np.int64)
+            )
+
+        return merge_top_k(results, top_k)
+
+
+    def lexical_search(
+        self,
+        query: str,
+        top_k: int,
+        document_filter: ShardedDocumentFilter | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        results = self._fan_out(
+            lambda shard, shard_filter: tuple(
+                values[np.newaxis, :] for values in shard.lexical_search(query, top_k, shard_filter)
+            ),
+            document_filter
+        )
+
+        if not results:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+
+        scores, ids = merge_top_k(results, top_k)
+        found = ids[0] >= 0
+
+        return scores[0][found], ids[0][found]
+
+
+    def _fan_out(self, search, document_filter: ShardedDocumentFilter | None) -> list:
+        if document_filter is None:
+            targets = [(shard, None) for shard in self.shards if shard.size > 0]
+        else:
+            targets = [
+                (shard, shard_filter)
+                for shard, shard_filter in zip(self.shards, document_filter.shards)
+                if shard_filter is not None and shard_filter.size > 0
+            ]
+
+        if len(targets) <= 1:
+            return [search(shard, shard_filter) for shard, shard_filter in targets]
+
+        return list(self.executor.map(lambda target: search(*target), targets))
+
+
+# Process-wide cache of sharded snapshots, keyed by the shards directory
+_sharded_snapshots: dict[str, ShardedSnapshot] = {}
+_sharded_snapshot_lock = threading.Lock()
+_search_executors: dict[int, ThreadPoolExecutor] = {}
+
+
+class ShardedVectorStore:
+    '''
+    `num_shards` independent `FaissVectorStore`s, partitioned by document.
+
+    A document's chunks all live in shard `document_key % num_shards`, so any chunk id
+    names its shard. Each shard has its own index, metadata and sidecar files under
+    `index_dir/shards/shard_NNN`; writes only rewrite the shards they touch.
+    '''
+
+    def __init__(self) -> None:
+        self.settings = get_settings()
+        self.num_shards = self.settings.vector_index.num_shards
+        self.index_path = self.settings.paths.index_dir / 'shards'
+        self.manifest_path = self.index_path / MANIFEST_FILENAME
+        self.shards = [
+            FaissVectorStore(self.index_path / f'shard_{i:03d}')
+            for i in range(self.num_shards)
+        ]
+        self.encoding = self.shards[0].encoding
+        self.dimension = self.encoding.dimension
+
+        for shard in self.shards:
+            shard.index_path.parent.mkdir(parents=True, exist_ok=True)
+
+
+    def rebuild(
+        self,
+        chunks: list[ChunkRecord],
+        embeddings: np.ndarray
+    ) -> None:
+        with self.open_writer(rebuild=True) as writer:
+            writer.add(chunks, embeddings)
+            writer.commit()
+
+
+    def add(
+        self,
+        chunks: list[ChunkRecord],
+        embeddings: np.ndarray,
+        replace_document_ids: set[str] | None = None
+    ) -> int:
+        with self.open_writer(replace_document_ids=replace_document_ids) as writer:
+            writer.add(chunks, embeddings)
+            return writer.commit()
+
+
+    def upsert_document(
+        self,
+        document_id: str,
+        chunks: list[ChunkRecord],
+        embeddings: np.ndarray
+    ) -> int:
+        if any(chunk.document_id != document_id for chunk in chunks):
+            raise ValueError(f'All chunks must belong to document {document_id}')
+
+        return self.add(chunks, embeddings, replace_document_ids={document_id})
+
+
+    def delete_document(self, document_id: str) -> int:
+        with self.open_writer(replace_document_ids={document_id}) as writer:
+            return writer.commit()
+
+
+    def open_writer(
+        self,
+        replace_document_ids: set[str] | None = None,
+        rebuild: bool = False
+    ) -> 'ShardedIndexWriter':
+        return ShardedIndexWriter(self, replace_document_ids=replace_document_ids, rebuild=rebuild)
+
+
+    def load_chunk_table(self) -> ShardedChunkTable:
+        return self.get_snapshot().chunk_table
+
+
+    def get_snapshot(self) -> ShardedSnapshot:
+        shard_snapshots = tuple(shard.get_snapshot() for shard in self.shards)
+        key = str(self.index_path)
+        snapshot = _sharded_snapshots.get(key)
+
+        if snapshot is not None and self._is_current(snapshot, shard_snapshots):
+            return snapshot
+
+        with _sharded_snapshot_lock:
+            snapshot = _sharded_snapshots.get(key)
+
+            if snapshot is not None and self._is_current(snapshot, shard_snapshots):
+                return snapshot
+
+            snapshot = ShardedSnapshot(shard_snapshots, self._search_executor())
+            _sharded_snapshots[key] = snapshot
+            return snapshot
+
+
+    def indexed_document_ids(self) -> set[str]:
+        return set().union(*(shard.indexed_document_ids() for shard in self.shards))
+
+
+    def is_consistent(self) -> bool:
+        # A changed shard count re-partitions every document, which takes a rebuild
+        if self.load_manifest().get('num_shards') != self.num_shards:
+            return False
+
+        return all(shard.is_consistent() for shard in self.shards)
+
+
+    def search(self, query_vector: np.ndarray, top_k: int) -> tuple[np.ndarray, np.ndarray]:
+        return self.get_snapshot().search(query_vector, top_k)
+
+
+    def search_many(self, query_matrix: np.ndarray, top_k: int) -> tuple[np.ndarray, np.ndarray]:
+        return self.get_snapshot().search_many(query_matrix, top_k)
+
+
+    def load_manifest(self) -> dict[str, Any]:
+        if not self.manifest_path.exists():
+            return {}
+
+        return json.loads(self.manifest_path.read_text(encoding='utf-8'))
+
+
+    def save_manifest(self, counts: list[int]) -> None:
+        tmp_path = self.manifest_path.with_suffix('.json.tmp')
+        tmp_path.write_text(
+            json.dumps({'num_shards': self.num_shards, 'counts': counts}, indent=2),
+            encoding='utf-8'
+        )
+        os.replace(tmp_path, self.manifest_path)
+
+
+    def _search_executor(self) -> ThreadPoolExecutor:
+        max_workers = self.settings.vector_index.search_threads or self.num_shards
+        executor = _search_executors.get(max_workers)
+
+        if executor is None:
+            executor = _search_executors.setdefault(
+                max_workers,
+                ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='shard-search')
+            )
+
+        return executor
+
+
+    @staticmethod
+    def _is_current(snapshot: ShardedSnapshot, shard_snapshots: tuple[IndexSnapshot, ...]) -> bool:
+        return len(snapshot.shards) == len(shard_snapshots) and all(
+            cached is current for cached, current in zip(snapshot.shards, shard_snapshots)
+        )
+
+
+class ShardedIndexWriter:
+    '''
+    Routes chunks to one `IndexWriter` per shard.
+
+    A shard's writer is opened up front when documents in it are replaced (or on rebuild),
+    otherwise on the first chunk routed to it; shards without a writer are not rewritten.
+    `commit()` stages every shard before swapping any in, then saves the manifest.
+    '''
+
+    def __init__(
+        self,
+        store: ShardedVectorStore,
+        replace_document_ids: set[str] | None = None,
+        rebuild: bool = False
+    ) -> None:
+        self.store = store
+        self.rebuild = rebuild
+        self._writers: dict[int, IndexWriter] = {}
+        self._replace: dict[int, set[str]] = defaultdict(set)
+        self._committed = False
+
+        for document_id in replace_document_ids or set():
+            self._replace[shard_for_document(document_id, store.num_shards)].add(document_id)
+
+        try:
+            for shard_index in (range(store.num_shards) if rebuild else sorted(self._replace)):
+                self._writer(shard_index)
+        except BaseException:
+            self.abort()
+            raise
+
+
+    @property
+    def count(self) -> int:
+        return sum(writer.count for writer in self._writers.values())
+
+
+    def add(self, chunks: list[ChunkRecord], embeddings: np.ndarray) -> None:
+        if len(chunks) != len(embeddings):
+            raise ValueError('chunks and embeddings must have the same length')
+
+        positions_by_shard: dict[int, list[int]] = defaultdict(list)
+
+        for position, chunk in enumerate(chunks):
+            positions_by_shard[shard_for_document(chunk.document_id, self.store.num_shards)].append(position)
+
+        for shard_index, positions in positions_by_shard.items():
+            self._writer(shard_index).add([chunks[i] for i in positions], embeddings[positions])
+
+
+    def commit(self) -> int:
+        manifest = self.store.load_manifest()
+        counts = manifest.get('counts') if manifest.get('num_shards') == self.store.num_shards else None
+        counts = list(counts) if counts is not None else [0] * self.store.num_shards
+        writers = sorted(self._writers.items())
+
+        try:
+            for _, writer in writers:
+                writer.prepare()
+        except BaseException:
+            # Nothing was swapped in yet; the shards and manifest on disk are untouched
+            self.abort()
+            raise
+
+        try:
+            for shard_index, writer in writers:
+                writer.publish()
+                counts[shard_index] = writer.count
+        except BaseException:
+            self.abort()
+
+            # Record the shards that were swapped in. A re-partition (changed shard count)
+            # keeps the old manifest, so the store still reports it needs a rebuild.
+            if manifest.get('num_shards') == self.store.num_shards:
+                self.store.save_manifest(counts)
+
+            raise
+
+        self.store.save_manifest(counts)
+        self._committed = True
+
+        return sum(counts)
+
+
+    def abort(self) -> None:
+        for writer in self._writers.values():
+            writer.abort()
+
+
+    def _writer(self, shard_index: int) -> IndexWriter:
+        writer = self._writers.get(shard_index)
+
+        if writer is None:
+            writer = self.store.shards[shard_index].open_writer(
+                replace_document_ids=self._replace.get(shard_index, set()),
+                rebuild=self.rebuild
+            )
+            self._writers[shard_index] = writer
+
+        return writer
+
+
+    def __enter__(self) -> 'ShardedIndexWriter':
+        return self
+
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None or not self._committed:
+            self.abort()
@@ -1,6 +1,10 @@
 from __future__ import annotations
 
 import json
+import os
+import threading
+from dataclasses import dataclass
+from functools import cached_property
 from pathlib import Path
 from typing import Any
 
@@ -9,19 +13,146 @@ import numpy as np
 
 from src.config import get_settings
 from src.models.chunk import ChunkRecord
+from src.retrieval.binary_index import BinaryRescoreIndex, BinaryRescoreWriter
+from src.retrieval.bm25 import BM25Builder, BM25Index
+from src.retrieval.compression import VectorEncoding
+from src.retrieval.filters import DocumentFilter
+from src.retrieval.index_factory import (
+    configure_search,
+    create_index,
+    has_stable_ids,
+    read_index,
+    search_parameters,
+    search_subset,
+    supports_remove
+)
+from src.utils.ids import make_faiss_id, make_index_version
+
+# Fields of a chunk that the query path needs; the rest stay on disk only
+SNAPSHOT_CHUNK_FIELDS = (
+    'chunk_id', 'document_id', 'filename', 'text', 'chunk_index',
+    'page_number', 'section_title', 'metadata'
+)
+
+
+@dataclass(frozen=True)
+class IndexSnapshot:
+    index: faiss.Index
+    chunk_table: dict[int, dict[str, Any]]
+    version: str | None
+    file_stamp: tuple | None
+    encoding: VectorEncoding
+    binary: BinaryRescoreIndex | None = None
+    bm25: BM25Index | None = None
+    exact_filter_max_chunks: int = 0
+
+    @property
+    def size(self) -> int:
+        # In binary first-pass mode the dense index is left empty and the sidecar holds the vectors
+        return self.binary.index.ntotal if self.binary is not None else self.index.ntotal
+
+
+    @cached_property
+    def row_ids(self) -> np.ndarray:
+        # Stable chunk ids in metadata entry order, the row order of every sidecar
+        return np.fromiter(self.chunk_table.keys(), dtype=np.int64, count=len(self.chunk_table))
+
+
+    @cached_property
+    def _id_order(self) -> np.ndarray:
+        return np.argsort(self.row_ids)
+
+
+    def document_filter(self, document_ids: set[str]) -> DocumentFilter:
+        return DocumentFilter.build(document_ids, self.row_ids[self._id_order], self._id_order)
+
+
+    def search(
+        self,
+        query_vector: np.ndarray,
+        top_k: int,
+        document_filter: DocumentFilter | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        return self.search_many(np.expand_dims(query_vector, axis=0), top_k, document_filter)
+
+
+    def search_many(
+        self,
+        query_matrix: np.ndarray,
+        top_k: int,
+        document_filter: DocumentFilter | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        if self.size == 0 or (document_filter is not None and document_filter.size == 0):
+            return (
+                np.empty((len(query_matrix), 0), dtype=np.float32),
+                np.empty((len(query_matrix), 0), dtype=np.int64)
+            )
+
+        # Queries are encoded the way the index was built, not the way settings say now
+        query_matrix = self.encoding.encode(query_matrix)
+
+        if self.binary is not None:
+            return self.binary.search_many(
+                query_matrix,
+                top_k,
+                document_filter.row_mask if document_filter is not None else None
+            )
+
+        if document_filter is None or document_filter.size == self.index.ntotal:
+            return self.index.search(query_matrix, top_k)
+
+        # A small subset is cheapest to score exactly; otherwise filtered out vectors are
+        # skipped inside the index scan rather than over-fetched and dropped
+        if document_filter.size <= self.exact_filter_max_chunks and isinstance(self.index, faiss.IndexIDMap2):
+            return search_subset(self.index, query_matrix, top_k, document_filter.ids)
+
+        return self.index.search(
+            query_matrix,
+            top_k,
+            params=search_parameters(
+                self.index,
+                document_filter.id_selector(),
+                selectivity=document_filter.size / self.index.ntotal
+            )
+        )
+
+
+    def lexical_search(
+        self,
+        query: str,
+        top_k: int,
+        document_filter: DocumentFilter | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        if self.bm25 is None or (document_filter is not None and document_filter.size == 0):
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+
+        return self.bm25.search(query, top_k, document_filter.row_mask if document_filter is not None else None)
+
+
+# Process-wide cache of loaded indexes, keyed by (index path, metadata path).
+# Snapshots are immutable and swapped whole, so readers never need the lock.
+_snapshots: dict[tuple[str, str], IndexSnapshot] = {}
+_snapshot_lock = threading.Lock()
 
 
 class FaissVectorStore:
-    def __init__(self) -> None:
+    def __init__(self, directory: Path | None = None) -> None:
         self.settings = get_settings()
-        self.index_path = self.settings.paths.faiss_index_path
-        self.metadata_path = self.settings.paths.index_metadata_path
-        self.dimension = self.settings.models.embedding_dimension
+        paths = self.settings.paths
+
+        # A shard keeps the configured file names inside its own directory
+        self.index_path = self._locate(paths.faiss_index_path, directory)
+        self.metadata_path = self._locate(paths.index_metadata_path, directory)
+        self.binary_index_path = self._locate(paths.binary_index_path, directory)
+        self.rescore_vectors_path = self._locate(paths.rescore_vectors_path, directory)
+        self.bm25_index_path = self._locate(paths.bm25_index_path, directory)
+        self.encoding = VectorEncoding.from_settings(self.settings.models, self.settings.vector_index)
+        self.dimension = self.encoding.dimension
 
         self.index_path.parent.mkdir(parents=True, exist_ok=True)
 
-    def create_index(self) -> faiss.Index:
-        return faiss.IndexFlatIP(self.dimension)
+    def create_index(self, num_train: int | None = None) -> faiss.Index:
+        return create_index(self.dimension, self.settings.vector_index, num_train)
     
 
     def load_or_create_index(self) -> faiss.Index:
@@ -32,13 +163,17 @@ class FaissVectorStore:
     
 
     def save_index(self, index: faiss.Index) -> None:
-        faiss.write_index(index, str(self.index_path))
+        # Write then rename so concurrent readers never see a partial file
+        tmp_path = self.index_path.with_suffix('.index.tmp')
+        faiss.write_index(index, str(tmp_path))
+        os.replace(tmp_path, self.index_path)
 
     
     def load_metadata(self) -> dict[str, Any]:
         if not self.metadata_path.exists():
             return {
                 'dimension': self.dimension,
+                'encoding': self.encoding.to_metadata(),
                 'count': 0,
                 'chunks': []
             }
@@ -58,44 +193,454 @@ class FaissVectorStore:
         chunks: list[ChunkRecord],
         embeddings: np.ndarray
     ) -> None:
-        if len(chunks) != len(embeddings):
-            raise ValueError('chunks and embeddings must have tje same length')
-        
-        if embeddings.shape[1] != self.dimension:
-            raise ValueError(
-                f'Embedding dimension mismatch: expected {self.dimension}, got {embeddings.shape[1]}'
-            )
-        
-        index = self.create_index()
-
-        if len(embeddings) > 0:
-            index.add(embeddings.astype(np.float32))
-
-        metadata = {
-            'dimension': self.dimension,
-            'count': len(chunks),
-            'chunks': [
-                {
-                    'faiss_id': i,
-                    'chunk': chunk.model_dump(mode='json')
-                }
-                for i, chunk in enumerate(chunks)
-            ]
-        }
+        with self.open_writer(rebuild=True) as writer:
+            writer.add(chunks, embeddings)
+            writer.commit()
+
+
+    def add(
+        self,
+        chunks: list[ChunkRecord],
+        embeddings: np.ndarray,
+        replace_document_ids: set[str] | None = None
+    ) -> int:
+        with self.open_writer(replace_document_ids=replace_document_ids) as writer:
+            writer.add(chunks, embeddings)
+            return writer.commit()
+
+
+    def upsert_document(
+        self,
+        document_id: str,
+        chunks: list[ChunkRecord],
+        embeddings: np.ndarray
+    ) -> int:
+        if any(chunk.document_id != document_id for chunk in chunks):
+            raise ValueError(f'All chunks must belong to document {document_id}')
+
+        return self.add(chunks, embeddings, replace_document_ids={document_id})
+
+
+    def delete_document(self, document_id: str) -> int:
+        with self.open_writer(replace_document_ids={document_id}) as writer:
+            return writer.commit()
+
+
+    def load_chunk_table(self) -> dict[int, dict[str, Any]]:
+        return self.get_snapshot().chunk_table
+
+
+    def get_snapshot(self) -> IndexSnapshot:
+        key = (str(self.index_path), str(self.metadata_path))
+        stamp = self._file_stamp()
+        snapshot = _snapshots.get(key)
+
+        if snapshot is not None and snapshot.file_stamp == stamp:
+            return snapshot
+
+        with _snapshot_lock:
+            snapshot = _snapshots.get(key)
+
+            if snapshot is not None and snapshot.file_stamp == stamp:
+                return snapshot
+
+            loaded = self._load_snapshot(stamp)
+
+            # Mid-swap (new index, old metadata): keep serving the previous snapshot
+            if loaded is None:
+                return snapshot or IndexSnapshot(self.create_index(), {}, None, None, self.encoding)
+
+            _snapshots[key] = loaded
+            return loaded
+
+
+    def open_writer(
+        self,
+        replace_document_ids: set[str] | None = None,
+        rebuild: bool = False
+    ) -> 'IndexWriter':
+        return IndexWriter(self, replace_document_ids=replace_document_ids, rebuild=rebuild)
+
+
+    def indexed_document_ids(self) -> set[str]:
+        metadata = self.load_metadata()
+        return {entry['chunk']['document_id'] for entry in metadata.get('chunks', [])}
+
 
-        self.save_index(index)
-        self.save_metadata(metadata)
+    def is_consistent(self) -> bool:
+        if not self.index_path.exists() or not self.metadata_path.exists():
+            return False
+
+        index = read_index(self.index_path, mmap=self.settings.vector_index.mmap)
+        metadata = self.load_metadata()
+        count = len(metadata.get('chunks', []))
+
+        dense_count = count
+
+        if self.settings.vector_index.binary_first_pass:
+            if not self.binary_index_path.exists() or not self.rescore_vectors_path.exists():
+                return False
+
+            if faiss.read_index_binary(str(self.binary_index_path)).ntotal != count:
+                return False
+
+            dense_count = 0
+
+        return (
+            index.d == self.dimension and
+            metadata.get('dimension') == self.dimension and
+            VectorEncoding.from_metadata(metadata) == self.encoding and
+            index.ntotal == dense_count
+        )
 
 
     def search(self, query_vector: np.ndarray, top_k: int) -> tuple[np.ndarray, np.ndarray]:
-        index = self.load_or_create_index()
+        return self.get_snapshot().search(query_vector, top_k)
 
-        if index.ntotal == 0:
-            return (
-                np.ndarray([[]], dtype=np.float32),
-                np.ndarray([[]], dtype=np.int64)
+
+    def search_many(self, query_matrix: np.ndarray, top_k: int) -> tuple[np.ndarray, np.ndarray]:
+        return self.get_snapshot().search_many(query_matrix, top_k)
+
+
+    @staticmethod
+    def _locate(path: Path, directory: Path | None) -> Path:
+        return path if directory is None else directory / path.name
+
+
+    def _file_stamp(self) -> tuple | None:
+        try:
+            index_stat = self.index_path.stat()
+            metadata_stat = self.metadata_path.stat()
+        except FileNotFoundError:
+            return None
+
+        return (
+            index_stat.st_ino, index_stat.st_mtime_ns, index_stat.st_size,
+            metadata_stat.st_ino, metadata_stat.st_mtime_ns, metadata_stat.st_size
+        )
+
+
+    def _load_snapshot(self, stamp: tuple | None) -> IndexSnapshot | None:
+        if stamp is None:
+            return IndexSnapshot(self.create_index(), {}, None, None, self.encoding)
+
+        index = read_index(self.index_path, mmap=self.settings.vector_index.mmap)
+        configure_search(index, self.settings.vector_index)
+        metadata = self.load_metadata()
+        chunk_table = {
+            entry['faiss_id']: {field: entry['chunk'].get(field) for field in SNAPSHOT_CHUNK_FIELDS}
+            for entry in metadata.get('chunks', [])
+        }
+
+        # Sidecar indexes that were never built fall back to plain dense search;
+        # one that disagrees with the metadata is mid-swap, like the main index
+        binary = None
+        bm25 = None
+
+        if self.settings.vector_index.binary_first_pass and self.binary_index_path.exists():
+            binary = BinaryRescoreIndex.load(
+                self.binary_index_path,
+                self.rescore_vectors_path,
+                row_ids=np.fromiter(chunk_table.keys(), dtype=np.int64, count=len(chunk_table)),
+                rescore_multiplier=self.settings.vector_index.rescore_multiplier
             )
-        
-        query_matrix = np.expand_dims(query_vector.astype(np.float32), axis=0)
-        scores, indices = index.search(query_matrix, top_k)
-        return scores, indices
\ No newline at end of file
+
+            if binary is None:
+                return None
+        elif metadata.get('count', len(metadata.get('chunks', []))) != index.ntotal:
+            return None
+
+        # Loaded in dense mode too: the reranker scores candidates from its token sequences
+        if self.bm25_index_path.exists():
+            bm25 = BM25Index.load(
+                self.bm25_index_path,
+                k1=self.settings.retrieval.bm25_k1,
+                b=self.settings.retrieval.bm25_b
+            )
+
+            if len(bm25.row_ids) != len(chunk_table):
+                return None
+
+        return IndexSnapshot(
+            index,
+            chunk_table,
+            metadata.get('version'),
+            stamp,
+            VectorEncoding.from_metadata(metadata),
+            binary,
+            bm25,
+            exact_filter_max_chunks=self.settings.vector_index.exact_filter_max_chunks
+        )
+
+
+class IndexWriter:
+    '''
+    Appends chunk batches to the index without holding chunk text in memory.
+
+    Metadata entries are streamed to a temporary file as batches arrive; the index
+    and metadata only replace the on-disk copies on `commit()`. The vectors, chunk ids
+    and BM25 postings (a few bytes per token) are held until then, as each of those
+    files is written whole.
+    '''
+
+    def __init__(
+        self,
+        store: FaissVectorStore,
+        replace_document_ids: set[str] | None = None,
+        rebuild: bool = False
+    ) -> None:
+        self.store = store
+        self.count = 0
+        self._tmp_metadata_path = store.metadata_path.with_suffix('.json.tmp')
+        self._tmp_index_path = store.index_path.with_suffix('.index.tmp')
+        self._file = self._tmp_metadata_path.open('w', encoding='utf-8')
+        self.version = make_index_version()
+        self._file.write(
+            f'{{\n  "dimension": {store.dimension},\n  "version": "{self.version}",\n'
+            f'  "encoding": {json.dumps(store.encoding.to_metadata())},\n  "chunks": ['
+        )
+
+        # Binary first-pass rows follow metadata entry order
+        self._binary = (
+            BinaryRescoreWriter(store.binary_index_path, store.rescore_vectors_path, store.dimension)
+            if store.settings.vector_index.binary_first_pass else None
+        )
+        self._bm25 = BM25Builder()
+
+        self.index: faiss.Index | None = None
+        self._pending_vectors: list[np.ndarray] = []
+        self._pending_ids: list[np.ndarray] = []
+        self._pending_count = 0
+
+        try:
+            if rebuild:
+                self._start_new_index()
+            else:
+                self._carry_over(replace_document_ids or set())
+        except BaseException:
+            self.abort()
+            raise
+
+
+    def _carry_over(self, replace_document_ids: set[str]) -> None:
+        store = self.store
+
+        # In binary first-pass mode the kept vectors are copied from the sidecar file instead
+        dense = self._binary is None
+        existing = store.load_or_create_index() if dense and store.index_path.exists() else None
+        metadata = store.load_metadata()
+        entries = metadata.get('chunks', [])
+
+        if entries and VectorEncoding.from_metadata(metadata) != store.encoding:
+            raise ValueError('Index was built with a different vector encoding; rebuild it')
+
+        if existing is not None and not has_stable_ids(existing):
+            existing, entries = self._rekey_positional_index(existing, entries)
+
+        kept_rows = [i for i, e in enumerate(entries) if e['chunk']['document_id'] not in replace_document_ids]
+        kept = [entries[i] for i in kept_rows]
+        kept_ids = np.array([e['faiss_id'] for e in kept], dtype=np.int64)
+        stale_ids = np.array(
+            [e['faiss_id'] for e in entries if e['chunk']['document_id'] in replace_document_ids],
+            dtype=np.int64
+        )
+
+        if not dense:
+            self._binary.copy_rows(kept_rows, previous_count=len(entries))
+        elif existing is None or existing.ntotal == 0:
+            self._start_new_index()
+        elif len(stale_ids) == 0 or supports_remove(existing):
+            # Only the vectors of the replaced documents are touched
+            self.index = existing
+
+            if len(stale_ids) > 0:
+                self.index.remove_ids(stale_ids)
+        else:
+            # Graph indexes (HNSW) cannot delete; rebuild them from the kept vectors
+            kept_vectors = existing.reconstruct_batch(kept_ids)
+
+            self._start_new_index()
+            self._add_vectors(kept_vectors, kept_ids)
+
+        previous_bm25 = BM25Index.load(store.bm25_index_path) if store.bm25_index_path.exists() else None
+
+        reusable_bm25 = (
+            previous_bm25 is not None and previous_bm25.has_chunk_tokens
+            and len(previous_bm25.row_ids) == len(entries)
+        )
+
+        if reusable_bm25:
+            self._bm25.carry_over(previous_bm25, kept_rows, kept_ids)
+        else:
+            # No usable lexical index yet (older index); tokenize the kept chunks once
+            self._bm25.add(kept_ids, [e['chunk']['text'] for e in kept])
+
+        for entry in kept:
+            self._write_entry(entry['faiss_id'], entry['chunk'])
+
+
+    def add(self, chunks: list[ChunkRecord], embeddings: np.ndarray) -> None:
+        if len(chunks) != len(embeddings):
+            raise ValueError('chunks and embeddings must have the same length')
+
+        if len(embeddings) == 0:
+            return
+
+        ids = np.array(
+            [make_faiss_id(chunk.document_id, chunk.chunk_index) for chunk in chunks],
+            dtype=np.int64
+        )
+
+        if len(np.unique(ids)) != len(ids):
+            raise ValueError('Chunk ids are already indexed; replace their documents instead')
+
+        vectors = self.store.encoding.encode(embeddings)
+
+        if self._binary is not None:
+            self._binary.add(vectors)
+        else:
+            self._add_vectors(vectors, ids)
+
+        self._bm25.add(ids.tolist(), [chunk.text for chunk in chunks])
+
+        for faiss_id, chunk in zip(ids.tolist(), chunks):
+            self._write_entry(faiss_id, chunk.model_dump(mode='json'))
+
+
+    def commit(self) -> int:
+        self.prepare()
+        self.publish()
+
+        return self.count
+
+
+    def prepare(self) -> None:
+        '''Writes every index file next to its live copy; readers see nothing until `publish()`.'''
+        # Ids repeated across batches are caught here, from the ids BM25 keeps anyway,
+        # rather than by holding a second set of every id
+        row_ids = self._bm25.row_ids
+
+        if len(np.unique(row_ids)) != len(row_ids):
+            raise ValueError('Chunk ids are already indexed; replace their documents instead')
+
+        self._flush_pending()
+
+        if self.index is None and self._binary is not None:
+            # Binary first pass: an empty dense index keeps the file layout, at no memory cost
+            self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(self.store.dimension))
+        elif self.index is None:
+            self.index = self.store.create_index()
+
+        self._file.write(f'\n  ],\n  "count": {self.count}\n}}\n')
+        self._file.close()
+
+        if self._binary is not None:
+            self._binary.prepare()
+
+        self._bm25.build().stage(self.store.bm25_index_path)
+        faiss.write_index(self.index, str(self._tmp_index_path))
+
+
+    def publish(self) -> None:
+        '''Swaps the prepared files in; the metadata goes last, as it is what readers load first.'''
+        store = self.store
+
+        if self._binary is not None:
+            self._binary.publish()
+        else:
+            store.binary_index_path.unlink(missing_ok=True)
+            store.rescore_vectors_path.unlink(missing_ok=True)
+
+        os.replace(BM25Index.staged_path(store.bm25_index_path), store.bm25_index_path)
+        os.replace(self._tmp_index_path, store.index_path)
+        self._tmp_metadata_path.replace(store.metadata_path)
+
+
+    def abort(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+
+        self._tmp_metadata_path.unlink(missing_ok=True)
+        self._tmp_index_path.unlink(missing_ok=True)
+        BM25Index.staged_path(self.store.bm25_index_path).unlink(missing_ok=True)
+
+        if self._binary is not None:
+            self._binary.abort()
+
+
+    def _write_entry(self, faiss_id: int, chunk_data: dict[str, Any]) -> None:
+        entry = json.dumps({'faiss_id': faiss_id, 'chunk': chunk_data}, ensure_ascii=False)
+        self._file.write(('\n    ' if self.count == 0 else ',\n    ') + entry)
+        self.count += 1
+
+
+    def _start_new_index(self) -> None:
+        if self._binary is not None:
+            return
+
+        candidate = self.store.create_index()
+
+        # Indexes that need training (IVF, PQ) are created once a training sample is buffered
+        self.index = candidate if candidate.is_trained else None
+
+
+    def _rekey_positional_index(
+        self,
+        index: faiss.Index,
+        entries: list[dict[str, Any]]
+    ) -> tuple[faiss.Index, list[dict[str, Any]]]:
+        # Indexes written before stable ids used positional ids; move their vectors
+        # into a flat id-mapped index keyed by stable chunk ids
+        rekeyed = faiss.IndexIDMap2(faiss.IndexFlatIP(index.d))
+
+        if not entries:
+            return rekeyed, entries
+
+        vectors = index.reconstruct_n(0, index.ntotal)[[e['faiss_id'] for e in entries]]
+        entries = [
+            {'faiss_id': make_faiss_id(e['chunk']['document_id'], e['chunk']['chunk_index']), 'chunk': e['chunk']}
+            for e in entries
+        ]
+        rekeyed.add_with_ids(vectors, np.array([e['faiss_id'] for e in entries], dtype=np.int64))
+
+        return rekeyed, entries
+
+
+    def _add_vectors(self, vectors: np.ndarray, ids: np.ndarray) -> None:
+        if self.index is not None:
+            self.index.add_with_ids(vectors, ids)
+            return
+
+        self._pending_vectors.append(vectors)
+        self._pending_ids.append(ids)
+        self._pending_count += len(vectors)
+
+        if self._pending_count >= self.store.settings.vector_index.train_sample_size:
+            self._flush_pending()
+
+
+    def _flush_pending(self) -> None:
+        if not self._pending_vectors:
+            return
+
+        vectors = np.vstack(self._pending_vectors)
+        ids = np.concatenate(self._pending_ids)
+        self._pending_vectors, self._pending_ids, self._pending_count = [], [], 0
+
+        if self.index is None:
+            sample_size = min(len(vectors), self.store.settings.vector_index.train_sample_size)
+            sample = vectors[np.random.default_rng(0).choice(len(vectors), sample_size, replace=False)]
+
+            self.index = self.store.create_index(num_train=sample_size)
+            self.index.train(sample)
+
+        self.index.add_with_ids(vectors, ids)
+
+
+    def __enter__(self) -> 'IndexWriter':
+        return self
+
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None or not self._file.closed:
+            self.abort()
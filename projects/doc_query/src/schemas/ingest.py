@@ -3,6 +3,7 @@ from pydantic import BaseModel, Field, field_validator
 class IngestRequest(BaseModel):
     paths: list[str] = Field(min_length=1)
     rebuild_index: bool = False
+    max_workers: int | None = Field(default=None, ge=1)
 
     @field_validator('paths')
     @classmethod
@@ -15,9 +16,19 @@ class IngestRequest(BaseModel):
         return cleaned
     
 
+class FileIngestResult(BaseModel):
+    file_path: str
+    success: bool
+    document_id: str | None = None
+    num_chunks: int = Field(default=0, ge=0)
+    elapsed_ms: float = Field(default=0.0, ge=0.0)
+    error: str | None = None
+
+
 class IngestResponse(BaseModel):
     success: bool
     documents_ingested: int = Field(ge=0)
     chunks_created: int = Field(ge=0)
     index_path: str | None = None
-    message: str
\ No newline at end of file
+    message: str
+    files: list[FileIngestResult] = Field(default_factory=list)
\ No newline at end of file
@@ -1,13 +1,14 @@
 from pydantic import BaseModel, Field, field_validator
 
 from src.models.citation import CitationRecord
-from src.models.retrieval import RetrievedChunk
+from src.models.retrieval import RetrievalFilters, RetrievedChunk
 
 class QueryRequest(BaseModel):
     question: str = Field(min_length=1)
     top_k: int = Field(default=5, ge=1, le=10)
     min_score: float | None = Field(default=None, ge=0.0, le=1.0)
     return_snippets: bool = True
+    filters: RetrievalFilters | None = None
 
     @field_validator('question')
     @classmethod
@@ -27,4 +28,30 @@ class QueryResponse(BaseModel):
     citations: list[CitationRecord] = Field(default_factory=list)
     reason_if_unanswered: str | None = None
     retrieved_chunks: list[RetrievedChunk] = Field(default_factory=list)
+    latency_ms: float = Field(default=0.0, ge=0.0)
+
+
+class RetrieveBatchRequest(BaseModel):
+    questions: list[str] = Field(min_length=1, max_length=1000)
+    top_k: int = Field(default=5, ge=1, le=10)
+    filters: RetrievalFilters | None = None
+
+    @field_validator('questions')
+    @classmethod
+    def validate_questions(cls, value: list[str]) -> list[str]:
+        cleaned = [question.strip() for question in value]
+
+        if any(not question for question in cleaned):
+            raise ValueError('questions must not be empty')
+
+        return cleaned
+
+
+class RetrieveBatchResult(BaseModel):
+    question: str
+    retrieved_chunks: list[RetrievedChunk] = Field(default_factory=list)
+
+
+class RetrieveBatchResponse(BaseModel):
+    results: list[RetrieveBatchResult] = Field(default_factory=list)
     latency_ms: float = Field(default=0.0, ge=0.0)
\ No newline at end of file
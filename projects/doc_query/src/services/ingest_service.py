@@ -1,12 +1,19 @@
 from pathlib import Path
+from typing import Iterable
 
 from src.config import get_settings
-from src.ingest.pipeline import ingest_paths
+from src.ingest.catalog import list_document_entries, upsert_document_records
+from src.ingest.pipeline import ingest_paths, ingest_paths_parallel, processed_document_path
+from src.ingest.streaming import bounded_stage, index_chunk_stream, iter_processed_files
+from src.models.chunk import ChunkRecord
+from src.models.document import DocumentRecord
 from src.observability.logging import get_logger
-from src.schemas.ingest import IngestRequest, IngestResponse
-from src.retrieval.vector_store import FaissVectorStore
+from src.schemas.ingest import FileIngestResult, IngestRequest, IngestResponse
+from src.retrieval.sharded_store import ShardedIndexWriter, create_vector_store
+from src.retrieval.vector_store import IndexWriter
 from src.retrieval.embeddings import EmbeddingClient
-from src.utils.files import load_all_processed_chunks
+from src.utils.files import compute_file_hash, iter_processed_chunks, load_processed_chunks
+from src.utils.ids import make_document_id
 
 
 class IngestService:
@@ -14,34 +21,248 @@ class IngestService:
     def __init__(self) -> None:
         self.settings = get_settings()
         self.embedding_client = EmbeddingClient()
-        self.vector_store = FaissVectorStore()
+        self.vector_store = create_vector_store()
         self.logger = get_logger('docquery.ingest')
 
     def ingest(self, request: IngestRequest) -> IngestResponse:
         valid_paths = [str(Path(path)) for path in request.paths]
         self.logger.info('Starting ingestion for %d path(s)', len(valid_paths))
 
-        documents, chunks = ingest_paths(valid_paths, self.settings)
+        previous_hashes = {
+            entry['document_id']: entry.get('metadata', {}).get('content_hash')
+            for entry in list_document_entries()
+        }
 
-        all_chunks = load_all_processed_chunks()
-        all_texts = [chunk.text for chunk in all_chunks]
-        embeddings = self.embedding_client.embed_texts(all_texts)
-        self.vector_store.rebuild(all_chunks, embeddings)
+        try:
+            if self.settings.ingest.streaming:
+                return self._ingest_streaming(valid_paths, request.rebuild_index, previous_hashes)
+
+            return self._ingest_batch(request, valid_paths, previous_hashes)
+        finally:
+            # Vectors already paid for are kept even when the run fails part way
+            self.embedding_client.flush_cache()
+
+
+    def _ingest_batch(
+        self,
+        request: IngestRequest,
+        valid_paths: list[str],
+        previous_hashes: dict[str, str | None]
+    ) -> IngestResponse:
+        max_workers = request.max_workers or self.settings.ingest.max_workers
+        files = []
+
+        if max_workers > 1:
+            documents, chunks, files = ingest_paths_parallel(
+                valid_paths,
+                self.settings,
+                max_workers,
+                update_catalog=False
+            )
+            failed = [result for result in files if not result.success]
+
+            for result in failed:
+                self.logger.warning('Failed to ingest path=%s error=%s', result.file_path, result.error)
+        else:
+            documents, chunks = ingest_paths(valid_paths, self.settings, update_catalog=False)
+            failed = []
+
+        if request.rebuild_index or not self.vector_store.is_consistent():
+            response = self._rebuild(documents, chunks)
+        else:
+            response = self._ingest_incremental(documents, chunks, previous_hashes)
+
+        # New content hashes are only recorded once the index holds their chunks; if
+        # embedding failed above, the next run still sees these documents as changed
+        upsert_document_records(
+            [(document, str(processed_document_path(document.document_id, self.settings))) for document in documents]
+        )
+
+        if failed:
+            response.success = False
+            response.message += f'; {len(failed)} file(s) failed'
+
+        response.files = files
+        return response
+
+
+    def _rebuild(self, documents: list[DocumentRecord], chunks: list) -> IngestResponse:
+        # Stream the processed store through embedding into the index in fixed-size batches
+        with self.vector_store.open_writer(rebuild=True) as writer:
+            self._index_chunks(iter_processed_chunks(), writer)
+            total_chunks = writer.commit()
 
         self.logger.info(
             'Completed ingestion documents=%d new_chunks=%d total_indexed_chunks=%d',
             len(documents),
             len(chunks),
-            len(all_chunks)
+            total_chunks
         )
 
         return IngestResponse(
             success=True,
             documents_ingested=len(documents),
             chunks_created=len(chunks),
-            index_path=str(self.settings.paths.faiss_index_path),
+            index_path=str(self.vector_store.index_path),
             message=(
                 f'Ingested {len(documents)} document(s) and created {len(chunks)} chunk(s), '
-                f'and rebuilt vector index with {len(all_chunks)} total chunks'
+                f'and rebuilt vector index with {total_chunks} total chunks'
             )
-        )
\ No newline at end of file
+        )
+
+
+    def _ingest_incremental(
+        self,
+        documents: list[DocumentRecord],
+        chunks: list,
+        previous_hashes: dict[str, str | None]
+    ) -> IngestResponse:
+        indexed_document_ids = self.vector_store.indexed_document_ids()
+
+        changed_document_ids = {
+            document.document_id
+            for document in documents
+            if document.document_id not in indexed_document_ids
+            or previous_hashes.get(document.document_id) != document.metadata.get('content_hash')
+        }
+
+        changed_chunks = [chunk for chunk in chunks if chunk.document_id in changed_document_ids]
+        embeddings = self.embedding_client.embed_texts([chunk.text for chunk in changed_chunks])
+
+        total_chunks = self.vector_store.add(
+            changed_chunks,
+            embeddings,
+            replace_document_ids=changed_document_ids
+        )
+
+        self.logger.info(
+            'Completed incremental ingestion documents=%d changed_documents=%d '
+            'embedded_chunks=%d total_indexed_chunks=%d',
+            len(documents),
+            len(changed_document_ids),
+            len(changed_chunks),
+            total_chunks
+        )
+
+        return IngestResponse(
+            success=True,
+            documents_ingested=len(documents),
+            chunks_created=len(chunks),
+            index_path=str(self.vector_store.index_path),
+            message=(
+                f'Ingested {len(documents)} document(s) and created {len(chunks)} chunk(s), '
+                f'embedded {len(changed_chunks)} chunk(s) from {len(changed_document_ids)} new or '
+                f'changed document(s); vector index now holds {total_chunks} total chunks'
+            )
+        )
+
+
+    def _ingest_streaming(
+        self,
+        valid_paths: list[str],
+        rebuild: bool,
+        previous_hashes: dict[str, str | None]
+    ) -> IngestResponse:
+        rebuild = rebuild or not self.vector_store.is_consistent()
+        indexed_document_ids = set() if rebuild else self.vector_store.indexed_document_ids()
+
+        # File hashes are compared up front so unchanged files are never loaded
+        changed_paths = [
+            path for path in valid_paths
+            if rebuild
+            or make_document_id(path) not in indexed_document_ids
+            or previous_hashes.get(make_document_id(path)) != compute_file_hash(path)
+        ]
+        changed_document_ids = {make_document_id(path) for path in changed_paths}
+
+        catalog_records: list[tuple[DocumentRecord, str]] = []
+        files: list[FileIngestResult] = []
+        queue_size = self.settings.ingest.stream_queue_size
+
+        def iter_new_chunks():
+            for file_path, (document, chunks, processed_path, elapsed_ms, error) in bounded_stage(
+                iter_processed_files(changed_paths, self.settings), queue_size
+            ):
+                files.append(
+                    FileIngestResult(
+                        file_path=file_path,
+                        success=error is None,
+                        document_id=document.document_id if document else None,
+                        num_chunks=len(chunks),
+                        elapsed_ms=elapsed_ms,
+                        error=error
+                    )
+                )
+
+                if error is not None:
+                    self.logger.warning('Failed to ingest path=%s error=%s', file_path, error)
+                    yield from self._previous_chunks(make_document_id(file_path), indexed_document_ids)
+                    continue
+
+                catalog_records.append((document, processed_path))
+                yield from chunks
+
+        with self.vector_store.open_writer(
+            replace_document_ids=changed_document_ids,
+            rebuild=rebuild
+        ) as writer:
+            if rebuild:
+                # Write every processed file first, then index the whole processed store
+                for _ in iter_new_chunks():
+                    pass
+
+                embedded_chunks = self._index_chunks(iter_processed_chunks(), writer)
+            else:
+                embedded_chunks = self._index_chunks(iter_new_chunks(), writer)
+
+            total_chunks = writer.commit()
+
+        upsert_document_records(catalog_records)
+        chunks_created = sum(document.num_chunks for document, _ in catalog_records)
+
+        self.logger.info(
+            'Completed streaming ingestion paths=%d processed_documents=%d '
+            'embedded_chunks=%d total_indexed_chunks=%d rebuild=%s',
+            len(valid_paths),
+            len(catalog_records),
+            embedded_chunks,
+            total_chunks,
+            rebuild
+        )
+
+        failed = [result for result in files if not result.success]
+        message = (
+            f'Processed {len(catalog_records)} new or changed document(s) of {len(valid_paths)} path(s), '
+            f'created {chunks_created} chunk(s) and embedded {embedded_chunks} chunk(s); '
+            f'vector index now holds {total_chunks} total chunks'
+        )
+
+        return IngestResponse(
+            success=not failed,
+            documents_ingested=len(catalog_records),
+            chunks_created=chunks_created,
+            index_path=str(self.vector_store.index_path),
+            message=message + (f'; {len(failed)} file(s) failed' if failed else ''),
+            files=files
+        )
+
+
+    def _previous_chunks(self, document_id: str, indexed_document_ids: set[str]) -> list[ChunkRecord]:
+        # The writer already replaces this document; re-index its last processed version
+        # so a file that fails to load keeps its previous chunks rather than losing them
+        processed_path = processed_document_path(document_id, self.settings)
+
+        if document_id not in indexed_document_ids or not processed_path.exists():
+            return []
+
+        return load_processed_chunks(processed_path)
+
+
+    def _index_chunks(self, chunks: Iterable[ChunkRecord], writer: IndexWriter | ShardedIndexWriter) -> int:
+        return index_chunk_stream(
+            chunks,
+            embed_texts=self.embedding_client.embed_texts,
+            writer=writer,
+            batch_size=self.settings.ingest.stream_batch_size,
+            queue_size=self.settings.ingest.stream_queue_size
+        )
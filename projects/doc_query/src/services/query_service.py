@@ -1,36 +1,365 @@
 from __future__ import annotations
 
+import threading
+from time import perf_counter
+from typing import Any, AsyncIterator, Iterator
+
+from src.config import get_settings
+from src.generation.answer_cache import CachedAnswer, SemanticAnswerCache
 from src.generation.answerer import Answerer
 from src.generation.citation_builder import build_citations
-from src.models.query import QueryTrace
+from src.generation.context_compressor import compress_context
+from src.generation.context_packer import pack_context
+from src.generation.response_cache import load_shared_response_cache
+from src.models.query import AnswerRecord, QueryTrace
+from src.models.retrieval import RetrievedChunk
 from src.observability.logging import get_logger
 from src.observability.tracing import persist_query_trace
+from src.retrieval.query_cache import QueryEmbedding
 from src.retrieval.retriever import Retriever
-from src.schemas.query import QueryRequest, QueryResponse
+from src.schemas.query import (
+    QueryRequest,
+    QueryResponse,
+    RetrieveBatchRequest,
+    RetrieveBatchResponse,
+    RetrieveBatchResult
+)
+from src.utils.executors import run_blocking
 from src.utils.ids import make_request_id
 
+# Question embedding, request signature and index version an answer is cached under
+AnswerCacheKey = tuple[QueryEmbedding, str, str | None]
+
 
 class QueryService:
     def __init__(self) -> None:
+        self.settings = get_settings()
         self.retriever = Retriever()
-        self.answerer = Answerer()
+        self.answerer = Answerer(response_cache=load_shared_response_cache())
+        self.answer_cache = self._create_answer_cache()
+        self.generations_skipped = 0
+        self._lock = threading.Lock()
         self.logger = get_logger('docquery.query')
 
 
     def query(self, request: QueryRequest) -> QueryResponse:
+        request_id, start_time, retrieval_trace = self._begin(request, 'query')
+        cache_key, cached = self._lookup_answer_cache(request)
+
+        if cached is not None:
+            return self._serve_cached(request_id, request, *cached, start_time)
+
+        retrieved_chunks = self._retrieve(request, retrieval_trace, cache_key)
+
+        if retrieved_chunks:
+            answer_record, used_chunk_ranks = self.answerer.answer(
+                question=request.question,
+                retrieved_chunks=self._prompt_chunks(request, retrieved_chunks, retrieval_trace)
+            )
+        else:
+            answer_record, used_chunk_ranks = self._refuse(request), []
+
+        return self._finish(
+            request_id,
+            request,
+            retrieved_chunks,
+            answer_record,
+            used_chunk_ranks,
+            retrieval_trace,
+            cache_key
+        )
+
+
+    def query_stream(self, request: QueryRequest) -> Iterator[tuple[str, dict[str, Any]]]:
+        '''
+        `query` as a sequence of (event, payload) pairs: `sources` with the retrieved chunks
+        as soon as retrieval is done, `token` for each piece of answer text as it is
+        generated, then `done` with the full response and its final citations.
+        '''
+        request_id, start_time, retrieval_trace = self._begin(request, 'streamed query')
+        cache_key, cached = self._lookup_answer_cache(request)
+
+        if cached is not None:
+            yield from self._cached_events(request_id, request, self._serve_cached(request_id, request, *cached, start_time))
+            return
+
+        retrieved_chunks = self._retrieve(request, retrieval_trace, cache_key)
+        progress = StreamProgress(start_time)
+
+        yield progress.sources(request_id, self._sources(request, retrieved_chunks))
+
+        if retrieved_chunks:
+            stream = self.answerer.answer_stream(
+                request.question,
+                self._prompt_chunks(request, retrieved_chunks, retrieval_trace)
+            )
+
+            for text in stream:
+                yield progress.token(text)
+
+            answer_record, used_chunk_ranks = stream.record, stream.used_chunk_ranks
+        else:
+            answer_record, used_chunk_ranks = self._refuse(request), []
+            yield progress.token(answer_record.answer)
+
+        retrieval_trace['streaming'] = progress.trace()
+
+        response = self._finish(
+            request_id,
+            request,
+            retrieved_chunks,
+            answer_record,
+            used_chunk_ranks,
+            retrieval_trace,
+            cache_key
+        )
+
+        yield progress.done(response)
+
+
+    async def query_async(self, request: QueryRequest) -> QueryResponse:
+        '''
+        `query` on the async clients. Only the network calls are awaited on the event loop;
+        index search, reranking, context packing and compression, and trace writes run on
+        the bounded blocking executor.
+        '''
+        request_id, start_time, retrieval_trace = self._begin(request, 'query')
+        cache_key, cached = await self._lookup_answer_cache_async(request)
+
+        if cached is not None:
+            return await run_blocking(self._serve_cached, request_id, request, *cached, start_time)
+
+        retrieved_chunks = await self._retrieve_async(request, retrieval_trace, cache_key)
+
+        if retrieved_chunks:
+            answer_record, used_chunk_ranks = await self.answerer.answer_async(
+                question=request.question,
+                retrieved_chunks=await run_blocking(self._prompt_chunks, request, retrieved_chunks, retrieval_trace)
+            )
+        else:
+            answer_record, used_chunk_ranks = self._refuse(request), []
+
+        return await run_blocking(
+            self._finish,
+            request_id,
+            request,
+            retrieved_chunks,
+            answer_record,
+            used_chunk_ranks,
+            retrieval_trace,
+            cache_key
+        )
+
+
+    async def query_stream_async(self, request: QueryRequest) -> AsyncIterator[tuple[str, dict[str, Any]]]:
+        # `query_stream` on the async clients, split between event loop and executor as in `query_async`
+        request_id, start_time, retrieval_trace = self._begin(request, 'streamed query')
+        cache_key, cached = await self._lookup_answer_cache_async(request)
+
+        if cached is not None:
+            response = await run_blocking(self._serve_cached, request_id, request, *cached, start_time)
+
+            for event in self._cached_events(request_id, request, response):
+                yield event
+
+            return
+
+        retrieved_chunks = await self._retrieve_async(request, retrieval_trace, cache_key)
+        progress = StreamProgress(start_time)
+
+        yield progress.sources(request_id, self._sources(request, retrieved_chunks))
+
+        if retrieved_chunks:
+            stream = await self.answerer.answer_stream_async(
+                request.question,
+                await run_blocking(self._prompt_chunks, request, retrieved_chunks, retrieval_trace)
+            )
+
+            async for text in stream:
+                yield progress.token(text)
+
+            answer_record, used_chunk_ranks = stream.record, stream.used_chunk_ranks
+        else:
+            answer_record, used_chunk_ranks = self._refuse(request), []
+            yield progress.token(answer_record.answer)
+
+        retrieval_trace['streaming'] = progress.trace()
+
+        response = await run_blocking(
+            self._finish,
+            request_id,
+            request,
+            retrieved_chunks,
+            answer_record,
+            used_chunk_ranks,
+            retrieval_trace,
+            cache_key
+        )
+
+        yield progress.done(response)
+
+
+    def _begin(self, request: QueryRequest, kind: str) -> tuple[str, float, dict[str, Any]]:
+        start_time = perf_counter()
         request_id = make_request_id()
-        self.logger.info('Starting query request_id=%s question=%s', request_id, request.question)
+        self.logger.info('Starting %s request_id=%s question=%s', kind, request_id, request.question)
+
+        return request_id, start_time, {}
+
+
+    def _cached_events(
+        self,
+        request_id: str,
+        request: QueryRequest,
+        response: QueryResponse
+    ) -> list[tuple[str, dict[str, Any]]]:
+        # A cached answer streams as one token between its sources and the final response
+        return [
+            ('sources', {'request_id': request_id, 'retrieved_chunks': self._sources(request, response.retrieved_chunks)}),
+            ('token', {'text': response.answer}),
+            ('done', response.model_dump(mode='json'))
+        ]
+
+
+    def _lookup_answer_cache(
+        self,
+        request: QueryRequest,
+        query_embedding: QueryEmbedding | None = None
+    ) -> tuple[AnswerCacheKey | None, tuple[CachedAnswer, float] | None]:
+        if self.answer_cache is None:
+            return None, None
+
+        # Paraphrases of a question answered against the current index skip retrieval and generation
+        query_embedding = query_embedding or self.retriever.embedding_client.embed_query_cached(request.question)
+        index_version = self.retriever.vector_store.get_snapshot().version
+        signature = request.model_dump_json(exclude={'question'})
+        cache_key = (query_embedding, signature, index_version)
+
+        return cache_key, self.answer_cache.lookup(query_embedding.vector, signature, index_version)
 
+
+    async def _lookup_answer_cache_async(
+        self,
+        request: QueryRequest
+    ) -> tuple[AnswerCacheKey | None, tuple[CachedAnswer, float] | None]:
+        if self.answer_cache is None:
+            return None, None
+
+        query_embedding = await self.retriever.embedding_client.embed_query_cached_async(request.question)
+        return await run_blocking(self._lookup_answer_cache, request, query_embedding)
+
+
+    def _retrieve(
+        self,
+        request: QueryRequest,
+        retrieval_trace: dict[str, Any],
+        cache_key: AnswerCacheKey | None
+    ) -> list[RetrievedChunk]:
         retrieved_chunks = self.retriever.retrieve(
             question=request.question,
-            top_k=request.top_k
+            top_k=request.top_k,
+            filters=request.filters,
+            trace=retrieval_trace,
+            query_embedding=cache_key[0] if cache_key is not None else None,
+            min_score=request.min_score
         )
-        
-        answer_record, used_chunk_ranks = self.answerer.answer(
+
+        return self._pack_context(retrieved_chunks, retrieval_trace)
+
+
+    async def _retrieve_async(
+        self,
+        request: QueryRequest,
+        retrieval_trace: dict[str, Any],
+        cache_key: AnswerCacheKey | None
+    ) -> list[RetrievedChunk]:
+        retrieved_chunks = await self.retriever.retrieve_async(
             question=request.question,
-            retrieved_chunks=retrieved_chunks
+            top_k=request.top_k,
+            filters=request.filters,
+            trace=retrieval_trace,
+            query_embedding=cache_key[0] if cache_key is not None else None,
+            min_score=request.min_score
         )
-        
+
+        return await run_blocking(self._pack_context, retrieved_chunks, retrieval_trace)
+
+
+    def _pack_context(
+        self,
+        retrieved_chunks: list[RetrievedChunk],
+        retrieval_trace: dict[str, Any]
+    ) -> list[RetrievedChunk]:
+        # The packed blocks are renumbered, so sources and citations use them as well as
+        # the prompt; /retrieve and /retrieve/batch return the chunks unpacked
+        if not retrieved_chunks or not self.settings.prompts.pack_context:
+            return retrieved_chunks
+
+        pack = pack_context(
+            retrieved_chunks,
+            max_tokens=self.settings.prompts.max_context_tokens,
+            max_blocks=self.settings.prompts.max_context_chunks,
+            max_overlap=self.settings.chunking.chunk_overlap
+        )
+        retrieval_trace['context'] = pack.trace()
+
+        return pack.chunks
+
+
+    def _prompt_chunks(
+        self,
+        request: QueryRequest,
+        retrieved_chunks: list[RetrievedChunk],
+        retrieval_trace: dict[str, Any]
+    ) -> list[RetrievedChunk]:
+        # Sources and citations keep the full chunks; only the prompt gets the compressed text
+        prompts = self.settings.prompts
+
+        if not prompts.compress_context:
+            return retrieved_chunks
+
+        compression = compress_context(
+            request.question,
+            retrieved_chunks,
+            max_sentences=prompts.compression_max_sentences,
+            neighbor_sentences=prompts.compression_neighbor_sentences
+        )
+        retrieval_trace['compression'] = compression.trace()
+
+        return compression.chunks
+
+
+    def _refuse(self, request: QueryRequest) -> AnswerRecord:
+        # Nothing cleared the similarity threshold: refuse without a generation call
+        with self._lock:
+            self.generations_skipped += 1
+
+        return self.answerer.refuse(request.question)
+
+
+    def _sources(self, request: QueryRequest, retrieved_chunks: list[RetrievedChunk]) -> list[dict[str, Any]]:
+        # Chunk text only goes out when snippets were asked for
+        return [
+            chunk.model_dump(mode='json', exclude=None if request.return_snippets else {'text'})
+            for chunk in retrieved_chunks
+        ]
+
+
+    def _finish(
+        self,
+        request_id: str,
+        request: QueryRequest,
+        retrieved_chunks: list[RetrievedChunk],
+        answer_record: AnswerRecord,
+        used_chunk_ranks: list[int],
+        retrieval_trace: dict[str, Any],
+        cache_key: AnswerCacheKey | None
+    ) -> QueryResponse:
+        retrieval_trace['generation'] = {
+            'skipped': not retrieved_chunks,
+            'skipped_total': self.generations_skipped
+        }
+
         citations = build_citations(
             retrieved_chunks=retrieved_chunks,
             used_chunk_ranks=used_chunk_ranks
@@ -38,6 +367,21 @@ class QueryService:
 
         answer_record.cirations = citations
 
+        response = QueryResponse(
+            question=answer_record.question,
+            answer=answer_record.answer,
+            grounded=answer_record.grounded,
+            citations=citations,
+            reason_if_unanswered=answer_record.reason_if_unanswered,
+            retrieved_chunks=retrieved_chunks if request.return_snippets else [],
+            latency_ms=answer_record.latency_ms
+        )
+
+        if cache_key is not None:
+            query_embedding, signature, index_version = cache_key
+            self.answer_cache.store(query_embedding.vector, request.question, signature, index_version, response)
+            retrieval_trace['answer_cache'] = {'hit': False, **self.answer_cache.stats()}
+
         trace = QueryTrace(
             request_id=request_id,
             question=request.question,
@@ -47,7 +391,11 @@ class QueryService:
             citations=citations,
             latency_ms=answer_record.latency_ms,
             prompt_version='v1',
-            metadata={'used_chunk_ranks': used_chunk_ranks}
+            metadata={
+                'used_chunk_ranks': used_chunk_ranks,
+                'filters': request.filters.model_dump(mode='json', exclude_none=True) if request.filters else None,
+                **retrieval_trace
+            }
         )
 
         persist_query_trace(trace)
@@ -60,12 +408,125 @@ class QueryService:
             answer_record.latency_ms
         )
 
-        return QueryResponse(
-            question=answer_record.question,
-            answer=answer_record.answer,
-            grounded=answer_record.grounded,
-            citations=citations,
-            reason_if_unanswered=answer_record.reason_if_unanswered,
-            retrieved_chunks=retrieved_chunks if request.return_snippets else [],
-            latency_ms=answer_record.latency_ms
-        )
\ No newline at end of file
+        return response
+
+
+    def _serve_cached(
+        self,
+        request_id: str,
+        request: QueryRequest,
+        entry: CachedAnswer,
+        similarity: float,
+        start_time: float
+    ) -> QueryResponse:
+        latency_ms = (perf_counter() - start_time) * 1000
+        response = entry.response.model_copy(update={'question': request.question, 'latency_ms': latency_ms})
+
+        trace = QueryTrace(
+            request_id=request_id,
+            question=request.question,
+            retrieved_chunk_ids=[chunk.chunk_id for chunk in response.retrieved_chunks],
+            grounded=response.grounded,
+            citations=response.citations,
+            latency_ms=latency_ms,
+            prompt_version='v1',
+            metadata={
+                'answer_cache': {
+                    'hit': True,
+                    'similarity': round(similarity, 4),
+                    'cached_question': entry.question,
+                    **self.answer_cache.stats()
+                }
+            }
+        )
+
+        persist_query_trace(trace)
+
+        self.logger.info(
+            'Served query from answer cache request_id=%s similarity=%.4f latency_ms=%.2f',
+            request_id,
+            similarity,
+            latency_ms
+        )
+
+        return response
+
+
+    def _create_answer_cache(self) -> SemanticAnswerCache | None:
+        answer_cache_settings = self.settings.answer_cache
+
+        if not answer_cache_settings.enabled:
+            return None
+
+        return SemanticAnswerCache(
+            dimension=self.settings.models.embedding_dimension,
+            similarity_threshold=answer_cache_settings.similarity_threshold,
+            max_entries=answer_cache_settings.max_entries,
+            ttl_seconds=answer_cache_settings.ttl_seconds
+        )
+
+
+    def retrieve_batch(self, request: RetrieveBatchRequest) -> RetrieveBatchResponse:
+        start_time = perf_counter()
+        self.logger.info('Starting batch retrieval questions=%d', len(request.questions))
+
+        results = self.retriever.retrieve_many(
+            questions=request.questions,
+            top_k=request.top_k,
+            filters=request.filters
+        )
+
+        latency_ms = (perf_counter() - start_time) * 1000
+
+        self.logger.info(
+            'Completed batch retrieval questions=%d latency_ms=%.2f',
+            len(request.questions),
+            latency_ms
+        )
+
+        return RetrieveBatchResponse(
+            results=[
+                RetrieveBatchResult(question=question, retrieved_chunks=chunks)
+                for question, chunks in zip(request.questions, results)
+            ],
+            latency_ms=latency_ms
+        )
+
+
+class StreamProgress:
+    '''
+    Builds the events of a streamed query and times them: time to first byte at the
+    `sources` event, time to first token at the first `token` event.
+    '''
+
+    def __init__(self, start_time: float) -> None:
+        self.start_time = start_time
+        self.ttfb_ms: float | None = None
+        self.ttft_ms: float | None = None
+        self.tokens = 0
+
+
+    def sources(self, request_id: str, sources: list[dict[str, Any]]) -> tuple[str, dict[str, Any]]:
+        # Time to first byte: the sources event opens the response
+        self.ttfb_ms = (perf_counter() - self.start_time) * 1000
+        return 'sources', {'request_id': request_id, 'retrieved_chunks': sources}
+
+
+    def token(self, text: str) -> tuple[str, dict[str, Any]]:
+        if self.ttft_ms is None:
+            self.ttft_ms = (perf_counter() - self.start_time) * 1000
+
+        self.tokens += 1
+        return 'token', {'text': text}
+
+
+    def done(self, response: QueryResponse) -> tuple[str, dict[str, Any]]:
+        return 'done', {**response.model_dump(mode='json'), 'ttfb_ms': self.ttfb_ms, 'ttft_ms': self.ttft_ms}
+
+
+    def trace(self) -> dict[str, Any]:
+        return {
+            'ttfb_ms': round(self.ttfb_ms, 3) if self.ttfb_ms is not None else None,
+            'ttft_ms': round(self.ttft_ms, 3) if self.ttft_ms is not None else None,
+            'token_events': self.tokens
+        }
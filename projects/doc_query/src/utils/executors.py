@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+from src.config import get_settings
+
+T = TypeVar('T')
+
+_cpu_executor: ThreadPoolExecutor | None = None
+_cpu_executor_lock = threading.Lock()
+
+
+def get_cpu_executor() -> ThreadPoolExecutor:
+    '''
+    Process-wide pool for the blocking steps of the async query path: index search,
+    reranking, trace writes. Its size bounds how many of them run at once, however many
+    requests are waiting on the network.
+    '''
+    global _cpu_executor
+
+    if _cpu_executor is None:
+        with _cpu_executor_lock:
+            if _cpu_executor is None:
+                _cpu_executor = ThreadPoolExecutor(
+                    max_workers=get_settings().concurrency.cpu_workers,
+                    thread_name_prefix='docquery-cpu'
+                )
+
+    return _cpu_executor
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_cpu_executor(), functools.partial(func, *args, **kwargs))
@@ -1,26 +1,41 @@
+import hashlib
 import json
 from pathlib import Path
+from typing import Iterator
 
 from src.config import get_settings
 from src.models.chunk import ChunkRecord
 
 
 def load_all_processed_chunks() -> list[ChunkRecord]:
+    return list(iter_processed_chunks())
+
+
+def iter_processed_chunks() -> Iterator[ChunkRecord]:
     settings = get_settings()
     processed_dir = settings.paths.processed_data_dir
 
     if not processed_dir.exists():
-        return []
-    
-    chunks: list[ChunkRecord] = []
+        return
 
-    for path in processed_dir.glob('*.json'):
+    # One processed document is held in memory at a time
+    for path in sorted(processed_dir.glob('*.json')):
         if path.name == "catalog.json":
             continue
          
-        payload = json.loads(path.read_text(encoding='utf-8'))
+        yield from load_processed_chunks(path)
+
+
+def load_processed_chunks(path: Path) -> list[ChunkRecord]:
+    payload = json.loads(path.read_text(encoding='utf-8'))
+    return [ChunkRecord(**chunk_data) for chunk_data in payload.get('chunks', [])]
+
+
+def compute_file_hash(file_path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
 
-        for chunk_data in payload.get('chunks', []):
-            chunks.append(ChunkRecord(**chunk_data))
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
 
-    return chunks
\ No newline at end of file
+    return digest.hexdigest()
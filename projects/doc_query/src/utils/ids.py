@@ -12,7 +12,56 @@ def make_chunk_id(document_id: str, chunk_index: int) -> str:
     return f'{document_id}_chunk_{chunk_index:04d}'
 
 
+CHUNK_INDEX_BITS = 20
+DOCUMENT_KEY_BITS = 43
+
+
+def make_document_key(document_id: str) -> int:
+    digest = hashlib.sha1(document_id.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') >> (64 - DOCUMENT_KEY_BITS)
+
+
+def make_faiss_id(document_id: str, chunk_index: int) -> int:
+    # 43-bit document key | 20-bit chunk index: stable across rebuilds, fits a signed int64,
+    # and keeps each document's chunks in one contiguous id range
+    if not 0 <= chunk_index < (1 << CHUNK_INDEX_BITS):
+        raise ValueError(f'chunk_index out of range for a FAISS id: {chunk_index}')
+
+    return (make_document_key(document_id) << CHUNK_INDEX_BITS) | chunk_index
+
+
+def document_id_range(document_id: str) -> tuple[int, int]:
+    start = make_document_key(document_id) << CHUNK_INDEX_BITS
+    return start, start + (1 << CHUNK_INDEX_BITS)
+
+
+def shard_for_document(document_id: str, num_shards: int) -> int:
+    return make_document_key(document_id) % num_shards
+
+
+def shard_for_faiss_id(faiss_id: int, num_shards: int) -> int:
+    # The document key is the high bits of every chunk id, so ids route without a lookup;
+    # works elementwise on numpy id arrays too
+    return (faiss_id >> CHUNK_INDEX_BITS) % num_shards
+
+
+def neighbor_faiss_id(faiss_id: int, offset: int) -> int | None:
+    # Chunk `chunk_index + offset` of the same document, or None past either end of the id range
+    chunk_index = (faiss_id & ((1 << CHUNK_INDEX_BITS) - 1)) + offset
+
+    if not 0 <= chunk_index < (1 << CHUNK_INDEX_BITS):
+        return None
+
+    return faiss_id + offset
+
+
 def make_request_id() -> str:
     import uuid
 
     return f'req_{uuid.uuid4().hex[:12]}'
+
+
+def make_index_version() -> str:
+    import uuid
+
+    return f'idx_{uuid.uuid4().hex[:12]}'
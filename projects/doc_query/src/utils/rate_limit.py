@@ -0,0 +1,24 @@
+import threading
+from time import monotonic, sleep
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute: int | None) -> None:
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def acquire(self) -> None:
+        if self.interval <= 0:
+            return
+
+        # Reserve the next free slot under the lock, then sleep outside of it
+        with self._lock:
+            now = monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+
+        delay = slot - now
+
+        if delay > 0:
+            sleep(delay)
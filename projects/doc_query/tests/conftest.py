@@ -0,0 +1,44 @@
+import hashlib
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from src.config import get_settings
+
+DIMENSION = 16
+
+
+@pytest.fixture
+def settings(tmp_path, monkeypatch):
+    '''
+    Fresh settings with every data path under `tmp_path`, a small embedding dimension
+    and the on-disk embedding cache off. Sections are replaced, never mutated in place,
+    so no test leaks into the defaults of the next one.
+    '''
+    monkeypatch.setenv('GEMINI_API_KEY', 'test-key')
+    monkeypatch.setenv('LLM_CACHE_ENABLED', 'false')
+    get_settings.cache_clear()
+    settings = get_settings()
+
+    # Path settings are relative to the project root; root all of them under tmp_path
+    settings.paths = settings.paths.model_copy(update={
+        name: tmp_path / value for name, value in settings.paths if isinstance(value, Path)
+    })
+    settings.models = settings.models.model_copy(update={'embedding_dimension': DIMENSION})
+    settings.embedding_cache = settings.embedding_cache.model_copy(update={'enabled': False})
+
+    yield settings
+
+    get_settings.cache_clear()
+
+
+def fake_embedding(text: str, dimension: int = DIMENSION) -> np.ndarray:
+    # Deterministic unit vector per text
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+    vector = np.random.default_rng(seed).standard_normal(dimension).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def fake_embed_texts(texts) -> np.ndarray:
+    return np.stack([fake_embedding(text) for text in texts]) if texts else np.empty((0, DIMENSION), dtype=np.float32)
@@ -0,0 +1,161 @@
+import asyncio
+import importlib
+import json
+import threading
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from conftest import fake_embed_texts, fake_embedding
+from src.ingest.chunking import build_chunk_records
+from src.retrieval.query_cache import QueryEmbedding
+from src.retrieval.sharded_store import create_vector_store
+from src.schemas.query import QueryRequest
+
+LEASE_TEXT = 'The tenant shall pay rent monthly in advance and keep the premises in good repair. ' * 3
+
+ANSWER = json.dumps({
+    'answer': 'Rent is paid monthly in advance.',
+    'grounded': True,
+    'used_chunk_ranks': [1],
+    'reason_if_unanswered': None
+})
+
+
+class FakeModels:
+    def __init__(self, parts: list[str]) -> None:
+        self.parts = parts
+        self.calls = 0
+
+    def generate_content(self, model, contents):
+        self.calls += 1
+        return SimpleNamespace(text=''.join(self.parts))
+
+    def generate_content_stream(self, model, contents):
+        self.calls += 1
+        return iter(SimpleNamespace(text=part) for part in self.parts)
+
+
+class FakeAsyncModels(FakeModels):
+    async def generate_content(self, model, contents):
+        return super().generate_content(model, contents)
+
+    async def generate_content_stream(self, model, contents):
+        async def responses():
+            for response in super(FakeAsyncModels, self).generate_content_stream(model, contents):
+                yield response
+
+        return responses()
+
+
+@pytest.fixture
+def api(settings, monkeypatch):
+    chunks = build_chunk_records(
+        'lease',
+        'lease.md',
+        [{'page_number': 1, 'text': LEASE_TEXT}],
+        settings.chunking.chunk_size,
+        settings.chunking.chunk_overlap,
+        settings.chunking.min_chunk_chars
+    )
+    create_vector_store().add(chunks, fake_embed_texts([chunk.text for chunk in chunks]))
+
+    # The module builds its services on import, so it is reloaded against the test settings
+    main = importlib.reload(importlib.import_module('app.main'))
+    parts = [ANSWER[:20], ANSWER[20:45], ANSWER[45:]]
+    main.query_service.answerer.client = SimpleNamespace(
+        models=FakeModels(parts),
+        aio=SimpleNamespace(models=FakeAsyncModels(parts))
+    )
+
+    # Every question lands on the lease chunk
+    query_embedding = QueryEmbedding(fake_embedding(chunks[0].text), 'api', 0.0, 0.0)
+
+    async def embed_query_async(question):
+        return query_embedding
+
+    embedding_client = main.query_service.retriever.embedding_client
+    monkeypatch.setattr(embedding_client, 'embed_query_cached', lambda question: query_embedding)
+    monkeypatch.setattr(embedding_client, 'embed_query_cached_async', embed_query_async)
+
+    return TestClient(main.app), main.query_service
+
+
+def parse_events(body: str) -> list[tuple[str, dict]]:
+    events = []
+
+    for block in body.strip().split('\n\n'):
+        event, data = block.split('\n', 1)
+        events.append((event.removeprefix('event: '), json.loads(data.removeprefix('data: '))))
+
+    return events
+
+
+def test_query_returns_answer_with_citations(api):
+    client, _ = api
+
+    response = client.post('/query', json={'question': 'When is rent due?'})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body['answer'] == 'Rent is paid monthly in advance.'
+    assert body['grounded'] is True
+    assert [citation['filename'] for citation in body['citations']] == ['lease.md']
+
+
+def test_query_stream_sends_sources_tokens_and_done(api):
+    client, query_service = api
+
+    response = client.post('/query/stream', json={'question': 'When is rent due?'})
+    events = parse_events(response.text)
+    names = [event for event, _ in events]
+
+    assert names[0] == 'sources' and names[-1] == 'done'
+    assert set(names[1:-1]) == {'token'}
+    assert ''.join(payload['text'] for event, payload in events if event == 'token') == 'Rent is paid monthly in advance.'
+
+    done = events[-1][1]
+    assert done['answer'] == 'Rent is paid monthly in advance.'
+    assert done['ttfb_ms'] <= done['ttft_ms']
+    assert [citation['filename'] for citation in done['citations']] == ['lease.md']
+
+
+def test_sync_and_async_streams_send_the_same_events(api):
+    _, query_service = api
+    request = QueryRequest(question='When is rent due?')
+
+    async def collect():
+        return [event async for event in query_service.query_stream_async(request)]
+
+    sync_events = list(query_service.query_stream(request))
+    async_events = asyncio.run(collect())
+
+    def strip_timings(events):
+        return [(event, {k: v for k, v in payload.items() if not k.endswith('_ms') and k != 'request_id'}) for event, payload in events]
+
+    assert strip_timings(sync_events) == strip_timings(async_events)
+
+
+def test_async_query_packs_and_compresses_context_off_the_event_loop(api, settings, monkeypatch):
+    _, query_service = api
+    settings.prompts = settings.prompts.model_copy(update={'pack_context': True, 'compress_context': True})
+    threads = {}
+
+    for step in ('_pack_context', '_prompt_chunks'):
+        original = getattr(query_service, step)
+
+        def record(*args, step=step, original=original):
+            threads[step] = threading.get_ident()
+            return original(*args)
+
+        monkeypatch.setattr(query_service, step, record)
+
+    async def query():
+        return threading.get_ident(), await query_service.query_async(QueryRequest(question='When is rent due?'))
+
+    loop_thread, response = asyncio.run(query())
+
+    assert response.answer == 'Rent is paid monthly in advance.'
+    assert set(threads) == {'_pack_context', '_prompt_chunks'}
+    assert loop_thread not in threads.values()
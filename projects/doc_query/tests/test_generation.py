@@ -0,0 +1,185 @@
+import json
+import time
+from types import SimpleNamespace
+
+from shared.llm_client.cache import ResponseCache
+from src.generation.answerer import Answerer
+from src.generation.citation_builder import build_citations
+from src.generation.context_compressor import compress_context
+from src.generation.context_packer import estimate_tokens, pack_context
+from src.generation.prompts import format_context
+from src.generation.streaming import AnswerTextExtractor
+from src.models.retrieval import RetrievedChunk
+
+
+def make_chunk(document_id: str, chunk_index: int, text: str, score: float) -> RetrievedChunk:
+    return RetrievedChunk(
+        chunk_id=f'{document_id}_{chunk_index}',
+        document_id=document_id,
+        filename=f'{document_id}.md',
+        text=text,
+        score=score,
+        rank=0,
+        page_number=1,
+        metadata={'chunk_index': chunk_index}
+    )
+
+
+def test_pack_context_merges_consecutive_chunks_and_removes_overlap():
+    chunks = [
+        make_chunk('lease', 1, 'rent is due monthly. Late payment accrues interest', 0.9),
+        make_chunk('lease', 0, 'The tenant pays rent. rent is due monthly.', 0.5)
+    ]
+
+    pack = pack_context(chunks, max_overlap=40)
+
+    assert len(pack.chunks) == 1
+    assert pack.chunks[0].text == 'The tenant pays rent. rent is due monthly. Late payment accrues interest'
+    assert pack.chunks[0].rank == 1
+    assert pack.overlap_chars_removed == len('rent is due monthly.')
+
+    # Citing the merged block cites both chunks, each with its own text
+    citations = build_citations(pack.chunks, used_chunk_ranks=[1])
+
+    assert [citation.chunk_id for citation in citations] == ['lease_0', 'lease_1']
+    assert [citation.snippet for citation in citations] == [chunk.text for chunk in reversed(chunks)]
+
+
+def test_pack_context_keeps_best_chunks_within_budget():
+    chunks = [
+        make_chunk('a', 0, 'x' * 400, 0.2),
+        make_chunk('b', 0, 'y' * 400, 0.9),
+        make_chunk('c', 0, 'z' * 400, 0.5)
+    ]
+
+    pack = pack_context(chunks, max_tokens=250)
+
+    assert [chunk.document_id for chunk in pack.chunks] == ['b', 'c']
+    assert [chunk.rank for chunk in pack.chunks] == [1, 2]
+    assert pack.token_count == estimate_tokens(format_context(pack.chunks)) <= 250
+    assert pack.packed == 2 and pack.candidates == 3
+
+
+def test_pack_context_truncates_a_chunk_larger_than_the_budget():
+    pack = pack_context([make_chunk('a', 0, 'w' * 1000, 0.9)], max_tokens=50)
+
+    assert pack.truncated
+    assert pack.token_count <= 50
+
+
+def test_response_cache_evicts_least_recently_used_over_max_bytes(tmp_path):
+    cache = ResponseCache(tmp_path / 'responses.sqlite3', max_bytes=250)
+
+    for key in ('a', 'b', 'c'):
+        cache.put(key, key * 100, provider='gemini', model='flash')
+
+        if key == 'b':
+            cache.get('a')
+
+    assert cache.get('a') == 'a' * 100
+    assert cache.get('b') is None
+    assert cache.get('c') == 'c' * 100
+    assert cache.stats()['bytes'] == 200
+    assert cache.stats()['evictions'] == 1
+
+
+def test_response_cache_replacing_an_entry_counts_its_new_size_only(tmp_path):
+    cache = ResponseCache(tmp_path / 'responses.sqlite3', max_bytes=250)
+
+    for _ in range(5):
+        cache.put('a', 'x' * 200, provider='gemini', model='flash')
+
+    assert cache.get('a') == 'x' * 200
+    assert cache.stats()['evictions'] == 0
+
+
+def test_response_cache_expires_entries_after_ttl(tmp_path, monkeypatch):
+    cache = ResponseCache(tmp_path / 'responses.sqlite3', ttl_seconds=60)
+    now = time.time()
+
+    monkeypatch.setattr(time, 'time', lambda: now)
+    cache.put('a', 'answer', provider='gemini', model='flash')
+    assert cache.get('a') == 'answer'
+
+    monkeypatch.setattr(time, 'time', lambda: now + 61)
+    assert cache.get('a') is None
+    assert cache.stats()['expirations'] == 1
+    assert cache.stats()['entries'] == 0
+
+
+def test_answer_text_extractor_streams_the_answer_across_chunk_boundaries():
+    reply = '{"answer": "Rent is \\u20ac900 \\"net\\"\\nper month \\ud83c\\udfe0", "citations": ["lease_0"]}'
+    extractor = AnswerTextExtractor()
+
+    deltas = [extractor.feed(reply[i:i + 3]) for i in range(0, len(reply), 3)]
+
+    assert ''.join(deltas) == extractor.answer == 'Rent is \u20ac900 "net"\nper month \U0001f3e0'
+    assert extractor.complete
+    assert extractor.text == reply
+    assert extractor.feed(' ') == ''
+
+
+def test_answer_text_extractor_waits_for_the_answer_key():
+    extractor = AnswerTextExtractor()
+
+    assert extractor.feed('{"grounded": true, "ans') == ''
+    assert extractor.feed('wer": "Yes') == 'Yes'
+    assert not extractor.complete
+
+
+def test_compress_context_keeps_matching_sentences_with_their_neighbors():
+    chunks = [
+        make_chunk('lease', 0, 'Rent is paid monthly. Keys are returned at the end. The notice period is 30 days. '
+                   'Pets need consent. Parking is not included.', 0.9),
+        make_chunk('nda', 0, 'Information stays confidential for five years.', 0.5)
+    ]
+
+    compression = compress_context('What is the notice period?', chunks, max_sentences=1, neighbor_sentences=1)
+
+    assert compression.chunks[0].text == (
+        '... Keys are returned at the end. The notice period is 30 days. Pets need consent. ...'
+    )
+    assert compression.chunks[1] == chunks[1]
+    assert [chunk.chunk_id for chunk in compression.chunks] == ['lease_0', 'nda_0']
+    assert (compression.sentences, compression.kept_sentences, compression.compressed_chunks) == (6, 4, 1)
+    assert compression.tokens_after < compression.tokens_before
+
+
+def test_compress_context_marks_gaps_between_kept_sentences():
+    chunk = make_chunk('msa', 0, 'Notice is written. Filler one. Filler two. Filler three. Termination needs notice.', 0.9)
+
+    compression = compress_context('notice', [chunk], max_sentences=2, neighbor_sentences=0)
+
+    assert compression.chunks[0].text == 'Notice is written. ... Termination needs notice.'
+
+
+class DictResponseStore:
+    def __init__(self) -> None:
+        self.entries: dict[str, str] = {}
+
+    def get(self, key: str) -> str | None:
+        return self.entries.get(key)
+
+    def put(self, key: str, text: str, provider: str, model: str) -> None:
+        self.entries[key] = text
+
+
+def test_answerer_serves_repeated_prompts_from_the_injected_response_cache(settings):
+    reply = json.dumps({'answer': 'Monthly.', 'grounded': True, 'used_chunk_ranks': [1], 'reason_if_unanswered': None})
+    prompts = []
+
+    def generate_content(model, contents):
+        prompts.append(contents)
+        return SimpleNamespace(text=reply)
+
+    store = DictResponseStore()
+    answerer = Answerer(response_cache=store)
+    answerer.client = SimpleNamespace(models=SimpleNamespace(generate_content=generate_content))
+    chunks = [make_chunk('lease', 0, 'Rent is paid monthly.', 0.9).model_copy(update={'rank': 1})]
+
+    first, _ = answerer.answer('When is rent due?', chunks)
+    second, _ = answerer.answer('When is rent due?', chunks)
+
+    assert first.answer == second.answer == 'Monthly.'
+    assert len(prompts) == 1
+    assert list(store.entries.values()) == [reply]
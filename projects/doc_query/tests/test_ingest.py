@@ -0,0 +1,90 @@
+import pytest
+
+from conftest import fake_embed_texts
+from src.ingest import pipeline
+from src.ingest.catalog import list_document_entries
+from src.retrieval.sharded_store import create_vector_store
+from src.schemas.ingest import IngestRequest
+from src.services.ingest_service import IngestService
+
+NDA_TEXT = 'The receiving party shall keep all confidential information of the disclosing party secret. ' * 4
+LEASE_TEXT = 'The tenant shall pay rent monthly in advance and keep the premises in good repair at all times. ' * 4
+
+
+def indexed_texts() -> set[str]:
+    return {chunk['text'] for chunk in create_vector_store().get_snapshot().chunk_table.values()}
+
+
+def test_incremental_ingest_reembeds_after_failed_run(settings, tmp_path, monkeypatch):
+    document = tmp_path / 'contract.md'
+    document.write_text(NDA_TEXT, encoding='utf-8')
+
+    service = IngestService()
+    monkeypatch.setattr(service.embedding_client, 'embed_texts', fake_embed_texts)
+    service.ingest(IngestRequest(paths=[str(document)]))
+    old_hash = list_document_entries()[0]['metadata']['content_hash']
+
+    document.write_text(LEASE_TEXT, encoding='utf-8')
+
+    def failing_embed(texts):
+        raise RuntimeError('embedding API unavailable')
+
+    monkeypatch.setattr(service.embedding_client, 'embed_texts', failing_embed)
+
+    with pytest.raises(RuntimeError):
+        service.ingest(IngestRequest(paths=[str(document)]))
+
+    # The failed run must not record the new content as indexed
+    assert list_document_entries()[0]['metadata']['content_hash'] == old_hash
+
+    monkeypatch.setattr(service.embedding_client, 'embed_texts', fake_embed_texts)
+    response = service.ingest(IngestRequest(paths=[str(document)]))
+
+    assert 'embedded 1 chunk(s) from 1 new or changed document(s)' in response.message
+    assert any('tenant shall pay rent' in text for text in indexed_texts())
+    assert not any('confidential information' in text for text in indexed_texts())
+    assert list_document_entries()[0]['metadata']['content_hash'] != old_hash
+
+
+def test_unchanged_document_is_not_reembedded(settings, tmp_path, monkeypatch):
+    document = tmp_path / 'contract.md'
+    document.write_text(NDA_TEXT, encoding='utf-8')
+
+    service = IngestService()
+    monkeypatch.setattr(service.embedding_client, 'embed_texts', fake_embed_texts)
+    service.ingest(IngestRequest(paths=[str(document)]))
+    response = service.ingest(IngestRequest(paths=[str(document)]))
+
+    assert 'embedded 0 chunk(s) from 0 new or changed document(s)' in response.message
+
+
+def test_streaming_ingest_keeps_going_past_a_failing_file(settings, tmp_path, monkeypatch):
+    settings.ingest = settings.ingest.model_copy(update={'streaming': True})
+    nda, lease = tmp_path / 'nda.md', tmp_path / 'lease.md'
+    nda.write_text(NDA_TEXT, encoding='utf-8')
+    lease.write_text(LEASE_TEXT, encoding='utf-8')
+
+    service = IngestService()
+    monkeypatch.setattr(service.embedding_client, 'embed_texts', fake_embed_texts)
+    service.ingest(IngestRequest(paths=[str(nda), str(lease)]))
+
+    nda.write_text(NDA_TEXT.replace('secret', 'private'), encoding='utf-8')
+    lease.write_text(LEASE_TEXT.replace('monthly', 'weekly'), encoding='utf-8')
+    load_document = pipeline.load_document
+
+    def failing_load(file_path):
+        if file_path.endswith('nda.md'):
+            raise ValueError('unreadable file')
+
+        return load_document(file_path)
+
+    monkeypatch.setattr(pipeline, 'load_document', failing_load)
+    response = service.ingest(IngestRequest(paths=[str(nda), str(lease)]))
+
+    assert not response.success
+    assert [result.success for result in response.files] == [False, True]
+    assert 'unreadable file' in response.files[0].error
+
+    # The failed document keeps its previously indexed chunks
+    assert any('information of the disclosing party secret' in text for text in indexed_texts())
+    assert any('rent weekly' in text for text in indexed_texts())
@@ -0,0 +1,456 @@
+import faiss
+import numpy as np
+import pytest
+
+from conftest import fake_embed_texts, fake_embedding
+from src.config import VectorIndexSettings
+from src.ingest.chunking import build_chunk_records
+from src.models.retrieval import RetrievalFilters, RetrievedChunk
+from src.retrieval import binary_index, query_cache
+from src.retrieval.binary_index import BinaryRescoreIndex, BinaryRescoreWriter
+from src.retrieval.bm25 import BM25Builder
+from src.retrieval.embedding_cache import EmbeddingCache, INITIAL_ROWS
+from src.retrieval.filters import resolve_document_ids
+from src.retrieval.index_factory import configure_search, read_index
+from src.retrieval.query_cache import QueryEmbedding, QueryEmbeddingCache
+from src.retrieval.reranker import exact_match_score, rerank_chunks, rerank_tokens
+from src.retrieval.retriever import Retriever
+from src.retrieval.sharded_store import create_vector_store, merge_top_k
+from src.retrieval.vector_store import IndexWriter
+from src.utils.ids import make_faiss_id
+
+
+def make_chunks(settings, document_id: str, text: str):
+    return build_chunk_records(
+        document_id,
+        f'{document_id}.md',
+        [{'page_number': 1, 'text': text}],
+        settings.chunking.chunk_size,
+        settings.chunking.chunk_overlap,
+        settings.chunking.min_chunk_chars
+    )
+
+
+def index_documents(settings, documents: dict[str, str], replace: set[str] | None = None) -> int:
+    chunks = [chunk for document_id, text in documents.items() for chunk in make_chunks(settings, document_id, text)]
+    return create_vector_store().add(chunks, fake_embed_texts([chunk.text for chunk in chunks]), replace)
+
+
+def build_bm25(texts: dict[int, str]):
+    builder = BM25Builder()
+    builder.add(list(texts), list(texts.values()))
+    return builder.build()
+
+
+def test_bm25_search_ranks_keyword_matches():
+    index = build_bm25({
+        10: 'The tenant shall pay rent monthly.',
+        20: 'Rent is reviewed every year and rent increases are capped.',
+        30: 'Confidential information must be kept secret.'
+    })
+
+    scores, ids = index.search('rent increases', top_k=5)
+
+    assert list(ids) == [20, 10]
+    assert scores[0] > scores[1] > 0
+    assert index.search('indemnity', top_k=5)[1].size == 0
+
+
+def test_bm25_search_respects_row_mask_and_top_k():
+    index = build_bm25({1: 'rent due', 2: 'rent late', 3: 'rent paid'})
+
+    _, ids = index.search('rent', top_k=2)
+    assert len(ids) == 2
+
+    _, ids = index.search('rent', top_k=5, row_mask=np.array([False, True, False]))
+    assert list(ids) == [2]
+
+
+def test_bm25_carry_over_with_no_kept_rows():
+    previous = build_bm25({1: 'rent due monthly'})
+
+    builder = BM25Builder()
+    builder.carry_over(previous, [], [])
+    builder.add([2], ['governing law clause'])
+    index = builder.build()
+
+    assert list(index.search('law', top_k=5)[1]) == [2]
+    assert index.search('rent', top_k=5)[1].size == 0
+
+
+def test_embedding_cache_grows_on_demand_and_evicts_least_recently_used(tmp_path):
+    cache = EmbeddingCache(tmp_path, 'model', dimension=4, max_entries=300)
+    row_bytes = 4 * 4
+
+    assert cache.vectors_path.stat().st_size == INITIAL_ROWS * row_bytes
+
+    texts = [f'clause {i}' for i in range(300)]
+    vectors = np.arange(300 * 4, dtype=np.float32).reshape(300, 4)
+    cache.put_many(texts, vectors)
+    cache.flush()
+
+    assert cache.vectors_path.stat().st_size == 300 * row_bytes
+
+    cache.get('clause 0')
+    cache.put_many(['clause 300'], np.ones((1, 4), dtype=np.float32))
+    cache.flush()
+
+    assert cache.get('clause 0') is not None
+    assert cache.get('clause 300') is not None
+    assert cache.stats()['entries'] == 300
+    assert cache.stats()['evictions'] == 1
+
+
+def test_embedding_cache_processes_do_not_overwrite_each_other(tmp_path):
+    # Two handles on one directory stand in for two processes
+    first = EmbeddingCache(tmp_path, 'model', dimension=4, max_entries=10)
+    second = EmbeddingCache(tmp_path, 'model', dimension=4, max_entries=10)
+
+    first.put_many(['indemnity'], np.full((1, 4), 1.0, dtype=np.float32))
+    second.put_many(['termination'], np.full((1, 4), 2.0, dtype=np.float32))
+    first.flush()
+    second.flush()
+
+    reopened = EmbeddingCache(tmp_path, 'model', dimension=4, max_entries=10)
+
+    np.testing.assert_array_equal(reopened.get('indemnity'), np.full(4, 1.0, dtype=np.float32))
+    np.testing.assert_array_equal(reopened.get('termination'), np.full(4, 2.0, dtype=np.float32))
+    np.testing.assert_array_equal(first.get('termination'), np.full(4, 2.0, dtype=np.float32))
+
+
+def test_embedding_cache_reads_rows_another_process_grew_without_resizing(tmp_path, monkeypatch):
+    reader = EmbeddingCache(tmp_path, 'model', dimension=4, max_entries=1000)
+    writer = EmbeddingCache(tmp_path, 'model', dimension=4, max_entries=1000)
+
+    texts = [f'clause {i}' for i in range(300)]
+    writer.put_many(texts, np.arange(300 * 4, dtype=np.float32).reshape(300, 4))
+    writer.flush()
+    size = writer.vectors_path.stat().st_size
+
+    # Only the shared lock is held on reads; growing the file there would race writers
+    monkeypatch.setattr(EmbeddingCache, '_resize', lambda cache, capacity: pytest.fail('resized on read'))
+
+    np.testing.assert_array_equal(reader.get('clause 299'), np.arange(1196, 1200, dtype=np.float32))
+    assert reader.vectors_path.stat().st_size == size
+
+
+def test_embedding_cache_reopens_flushed_entries(tmp_path):
+    cache = EmbeddingCache(tmp_path, 'model', dimension=4, max_entries=10)
+    cache.put_many(['governing law'], np.full((1, 4), 0.5, dtype=np.float32))
+    cache.flush()
+
+    reopened = EmbeddingCache(tmp_path, 'model', dimension=4, max_entries=10)
+
+    np.testing.assert_array_equal(reopened.get('governing  law'), np.full(4, 0.5, dtype=np.float32))
+
+
+def test_embedding_cache_reopened_with_a_smaller_capacity_keeps_its_entries(tmp_path):
+    texts = [f'clause {i}' for i in range(8)]
+
+    with EmbeddingCache(tmp_path, 'model', dimension=4, max_entries=8) as cache:
+        cache.put_many(texts, np.arange(8 * 4, dtype=np.float32).reshape(8, 4))
+
+    assert cache._lock_file.closed
+
+    with EmbeddingCache(tmp_path, 'model', dimension=4, max_entries=4) as smaller:
+        _, missing = smaller.get_many(texts)
+
+    assert missing == [4, 5, 6, 7]
+
+    with EmbeddingCache(tmp_path, 'model', dimension=4, max_entries=8) as reopened:
+        np.testing.assert_array_equal(reopened.get('clause 3'), np.arange(12, 16, dtype=np.float32))
+
+
+def test_hybrid_retrieval_answers_keyword_only_matches(settings):
+    settings.retrieval = settings.retrieval.model_copy(update={'hybrid': True})
+    index_documents(settings, {
+        'lease': 'The tenant shall pay rent monthly in advance under clause ZX-42 of this lease. ' * 2,
+        'nda': 'The receiving party shall keep confidential information of the other party secret. ' * 2
+    })
+
+    question = 'What does clause ZX-42 say?'
+    query_embedding = QueryEmbedding(fake_embedding('unrelated question'), 'api', 0.0, 0.0)
+    trace = {}
+
+    chunks = Retriever().retrieve(question, query_embedding=query_embedding, min_score=0.99, trace=trace)
+
+    assert [chunk.document_id for chunk in chunks] == ['lease']
+    assert trace['score_gate']['candidates_kept'] == 0
+    assert trace['score_gate']['passed']
+
+    settings.retrieval = settings.retrieval.model_copy(update={'hybrid': False})
+    assert Retriever().retrieve(question, query_embedding=query_embedding, min_score=0.99) == []
+
+
+def test_retrieve_returns_chunks_unpacked_in_document_order(settings):
+    sentences = ' '.join(f'Clause {i} requires the supplier to report incident {i} within one week.' for i in range(40))
+    index_documents(settings, {'msa': sentences})
+
+    query_embedding = QueryEmbedding(fake_embedding('incident reporting'), 'api', 0.0, 0.0)
+    chunks = Retriever().retrieve('incident reporting', top_k=2, query_embedding=query_embedding, min_score=-1.0)
+
+    assert len(chunks) > 2
+    assert [chunk.rank for chunk in chunks] == list(range(1, len(chunks) + 1))
+    assert [chunk.metadata['chunk_index'] for chunk in chunks] == sorted(chunk.metadata['chunk_index'] for chunk in chunks)
+    assert not any('merged_chunks' in chunk.metadata for chunk in chunks)
+
+
+def test_binary_first_pass_keeps_the_dense_index_empty(settings):
+    settings.vector_index = settings.vector_index.model_copy(update={'binary_first_pass': True})
+    text = 'The licensee may audit the licensor once per year on thirty days notice. ' * 2
+    index_documents(settings, {'licence': text, 'nda': 'Confidential information stays secret for five years. ' * 3})
+
+    assert faiss.read_index(str(settings.paths.faiss_index_path)).ntotal == 0
+    assert create_vector_store().is_consistent()
+
+    query_embedding = QueryEmbedding(fake_embedding(make_chunks(settings, 'licence', text)[0].text), 'api', 0.0, 0.0)
+    chunks = Retriever().retrieve('audit rights', top_k=1, query_embedding=query_embedding, min_score=0.5)
+
+    assert [chunk.document_id for chunk in chunks] == ['licence']
+
+    settings.vector_index = settings.vector_index.model_copy(update={'binary_first_pass': False})
+    assert not create_vector_store().is_consistent()
+
+
+@pytest.mark.parametrize('selector', [True, False])
+def test_binary_rescore_index_filters_rows_with_or_without_faiss_selectors(tmp_path, monkeypatch, selector):
+    monkeypatch.setattr(binary_index, 'supports_binary_selector', lambda: selector)
+    vectors = fake_embed_texts([f'clause {i}' for i in range(40)])
+
+    writer = BinaryRescoreWriter(tmp_path / 'binary.index', tmp_path / 'vectors.f32', 16)
+    writer.add(vectors)
+    writer.commit()
+    index = BinaryRescoreIndex.load(tmp_path / 'binary.index', tmp_path / 'vectors.f32', np.arange(100, 140), 4)
+
+    row_mask = np.zeros(40, dtype=bool)
+    row_mask[[3, 17, 29]] = True
+    scores, ids = index.search(vectors[17], top_k=5, row_mask=row_mask)
+
+    assert ids[0][0] == 117 and scores[0][0] > 0.99
+    assert set(ids[0][ids[0] >= 0]) == {103, 117, 129}
+
+
+def test_binary_first_pass_rejects_dense_index_storage_options():
+    with pytest.raises(ValueError, match='binary_first_pass'):
+        VectorIndexSettings(binary_first_pass=True, quantization='int8')
+
+    assert VectorIndexSettings(binary_first_pass=True, truncate_dimension=8).truncate_dimension == 8
+
+
+@pytest.mark.parametrize('index_type', ['flat', 'ivf_flat', 'hnsw'])
+def test_memory_mapped_index_searches_like_a_loaded_one(settings, index_type):
+    settings.vector_index = settings.vector_index.model_copy(update={'index_type': index_type, 'nlist': 2})
+    index_documents(settings, {f'doc{i}': f'Clause {i} covers topic number {i} in detail. ' * 3 for i in range(20)})
+    query = fake_embed_texts(['Clause 7 covers topic number 7 in detail.'])
+
+    loaded = read_index(settings.paths.faiss_index_path, mmap=False)
+    mapped = read_index(settings.paths.faiss_index_path, mmap=True)
+    configure_search(loaded, settings.vector_index)
+    configure_search(mapped, settings.vector_index)
+
+    np.testing.assert_array_equal(mapped.search(query, 5)[1], loaded.search(query, 5)[1])
+
+
+def test_rerank_tokens_agrees_with_rerank_chunks_on_exact_match():
+    texts = {
+        1: 'Section 12, governing law? Ireland, without regard to conflict rules.',
+        2: 'The governing law of this lease is the law of Ireland.',
+        3: 'The law governing this lease is Irish law.'
+    }
+    chunks = [
+        RetrievedChunk(chunk_id=f'c{i}', document_id='lease', filename='lease.md', text=text, score=0.5, rank=i)
+        for i, text in texts.items()
+    ]
+    index = build_bm25(texts)
+    question = 'governing law?'
+
+    result = rerank_tokens(question, index.encode_query(question), chunks, *index.tokens_for(np.array(list(texts))))
+    by_id = {chunk.chunk_id: chunk.exact_match_score for chunk in rerank_chunks(question, chunks)}
+
+    assert list(result.exact_match_scores) == [1.0, 0.6, 0.0]
+    assert [by_id[chunk.chunk_id] for chunk in chunks] == [1.0, 0.6, 0.0]
+    assert [exact_match_score(question, text) for text in texts.values()] == [1.0, 0.6, 0.0]
+
+
+@pytest.mark.parametrize('binary_first_pass', [False, True])
+def test_upsert_and_delete_keep_other_documents(settings, binary_first_pass):
+    settings.vector_index = settings.vector_index.model_copy(update={'binary_first_pass': binary_first_pass})
+    lease = 'The tenant shall pay rent monthly in advance to the landlord. ' * 2
+    index_documents(settings, {'lease': lease, 'nda': 'The receiving party keeps information secret. ' * 3})
+
+    store = create_vector_store()
+    lease_vector = fake_embedding(make_chunks(settings, 'lease', lease)[0].text)
+    lease_id = make_faiss_id('lease', 0)
+
+    nda = make_chunks(settings, 'nda', 'Confidentiality ends five years after termination of this agreement. ' * 2)
+    store.upsert_document('nda', nda, fake_embed_texts([chunk.text for chunk in nda]))
+
+    scores, ids = store.search(lease_vector, top_k=1)
+    chunk_table = store.load_chunk_table()
+
+    assert ids[0][0] == lease_id and scores[0][0] > 0.99
+    assert [entry['text'] for entry in chunk_table.values() if entry['document_id'] == 'nda'] == [
+        chunk.text for chunk in nda
+    ]
+
+    assert store.delete_document('lease') == len(nda)
+    assert store.indexed_document_ids() == {'nda'}
+    assert lease_id not in store.search(lease_vector, top_k=5)[1][0]
+    assert store.is_consistent()
+
+
+@pytest.mark.parametrize('failing_step', ['prepare', 'publish'])
+def test_failed_sharded_commit_leaves_a_consistent_store(settings, monkeypatch, failing_step):
+    settings.vector_index = settings.vector_index.model_copy(update={'num_shards': 2})
+    documents = {'lease': 'The tenant shall pay rent monthly. ' * 3, 'policy': 'Refunds are issued within thirty days. ' * 3}
+    index_documents(settings, documents)
+    before = create_vector_store().load_chunk_table()
+
+    # The second shard fails after the first one already staged (or swapped in) its files
+    original = getattr(IndexWriter, failing_step)
+    calls = []
+
+    def fail_second_shard(writer):
+        calls.append(writer)
+
+        if len(calls) == 2:
+            raise OSError('disk full')
+
+        original(writer)
+
+    monkeypatch.setattr(IndexWriter, failing_step, fail_second_shard)
+
+    with pytest.raises(OSError):
+        index_documents(settings, {'lease': 'The landlord repairs the roof every spring. ' * 3, 'policy': 'No refunds are issued. ' * 3}, {'lease', 'policy'})
+
+    store = create_vector_store()
+    texts = {entry['document_id']: entry['text'] for entry in store.load_chunk_table().values()}
+
+    assert store.is_consistent()
+    assert store.load_manifest()['counts'] == [len(shard.load_metadata()['chunks']) for shard in store.shards]
+    assert not list(settings.paths.index_dir.rglob('*.tmp*'))
+
+    if failing_step == 'prepare':
+        assert store.load_chunk_table() == before
+    else:
+        assert texts['lease'].startswith('The landlord') and texts['policy'].startswith('Refunds')
+
+
+def test_index_writer_rejects_chunk_ids_repeated_across_batches_on_commit(settings):
+    index_documents(settings, {'nda': 'The receiving party keeps information secret. ' * 3})
+    chunks = make_chunks(settings, 'lease', 'The tenant shall pay rent monthly in advance. ' * 3)
+    embeddings = fake_embed_texts([chunk.text for chunk in chunks])
+
+    with pytest.raises(ValueError, match='already indexed'):
+        with create_vector_store().open_writer() as writer:
+            writer.add(chunks, embeddings)
+            writer.add(chunks, embeddings)
+            writer.commit()
+
+    assert create_vector_store().indexed_document_ids() == {'nda'}
+
+
+def test_resolve_document_ids_intersects_every_criterion():
+    catalog = [
+        {'document_id': 'lease', 'file_type': '.pdf', 'ingested_at': '2026-01-10T09:00:00'},
+        {'document_id': 'nda', 'file_type': '.md', 'ingested_at': '2026-03-01T09:00:00'},
+        {'document_id': 'msa', 'file_type': '.pdf', 'ingested_at': '2026-05-20T09:00:00'}
+    ]
+
+    assert resolve_document_ids(RetrievalFilters(), catalog) is None
+    assert resolve_document_ids(RetrievalFilters(file_types=['PDF']), catalog) == {'lease', 'msa'}
+    assert resolve_document_ids(RetrievalFilters(ingested_after='2026-02-01T00:00:00Z'), catalog) == {'nda', 'msa'}
+    assert resolve_document_ids(
+        RetrievalFilters(document_ids=['lease', 'nda'], file_types=['pdf'], ingested_before='2026-04-01T00:00:00'),
+        catalog
+    ) == {'lease'}
+
+
+def test_document_filter_restricts_search_to_its_documents(settings):
+    documents = {
+        'lease': 'The tenant shall pay rent monthly in advance to the landlord. ' * 2,
+        'nda': 'The receiving party keeps information secret. ' * 3,
+        'msa': 'The supplier reports incidents within one week of discovery. ' * 2
+    }
+    index_documents(settings, documents)
+
+    snapshot = create_vector_store().get_snapshot()
+    lease_vector = fake_embedding(make_chunks(settings, 'lease', documents['lease'])[0].text)
+    document_filter = snapshot.document_filter({'nda', 'msa'})
+
+    assert document_filter.size == len(make_chunks(settings, 'nda', documents['nda'])) + len(
+        make_chunks(settings, 'msa', documents['msa'])
+    )
+    assert document_filter.row_mask.sum() == document_filter.size
+
+    _, ids = snapshot.search(lease_vector, top_k=10, document_filter=document_filter)
+    found = {snapshot.chunk_table[int(faiss_id)]['document_id'] for faiss_id in ids[0] if faiss_id >= 0}
+
+    assert found == {'nda', 'msa'}
+    assert snapshot.search(lease_vector, top_k=10, document_filter=snapshot.document_filter({'other'}))[1].size == 0
+
+
+def test_query_embedding_cache_expires_entries_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(query_cache, 'monotonic', lambda: now[0])
+    cache = QueryEmbeddingCache('model', dimension=4, max_entries=10, ttl_seconds=60)
+    cache.put('What is the  notice period?', np.ones(4, dtype=np.float32))
+
+    now[0] += 59
+    np.testing.assert_array_equal(cache.get('What is the notice period?'), np.ones(4, dtype=np.float32))
+
+    now[0] += 1
+    assert cache.get('What is the notice period?') is None
+    assert cache.stats()['expirations'] == 1
+    assert cache.stats()['entries'] == 0
+
+
+def test_query_embedding_cache_evicts_least_recently_used():
+    cache = QueryEmbeddingCache('model', dimension=4, max_entries=2)
+    cache.put('rent', np.zeros(4, dtype=np.float32))
+    cache.put('notice', np.ones(4, dtype=np.float32))
+    cache.get('rent')
+    cache.put('deposit', np.full(4, 2.0, dtype=np.float32))
+
+    assert cache.get('notice') is None
+    assert cache.get('rent') is not None and cache.get('deposit') is not None
+
+
+def test_merge_top_k_merges_shard_rows_and_drops_padding():
+    first = (
+        np.array([[0.9, 0.5, -np.inf], [0.4, -np.inf, -np.inf]], dtype=np.float32),
+        np.array([[1, 2, -1], [3, -1, -1]])
+    )
+    second = (
+        np.array([[0.7, 0.6, 0.1], [-np.inf, -np.inf, -np.inf]], dtype=np.float32),
+        np.array([[4, 5, 6], [-1, -1, -1]])
+    )
+
+    scores, ids = merge_top_k([first, second], top_k=4)
+
+    assert ids.tolist() == [[1, 4, 5, 2], [3, -1, -1, -1]]
+    np.testing.assert_allclose(scores[0], [0.9, 0.7, 0.6, 0.5])
+    assert scores[1, 0] == np.float32(0.4) and np.isneginf(scores[1, 1:]).all()
+    assert merge_top_k([], top_k=3)[0].shape == (0, 3)
+
+
+def test_retrieve_many_embeds_through_the_query_cache(settings):
+    text = 'The supplier reports incidents within one week of discovery. ' * 2
+    index_documents(settings, {'msa': text})
+
+    retriever = Retriever()
+    api_batches = []
+
+    def embed_uncached(texts):
+        api_batches.append(list(texts))
+        return fake_embed_texts(texts)
+
+    retriever.embedding_client._embed_uncached = embed_uncached
+    questions = ['incident reporting', 'notice period', 'incident  reporting']
+
+    first = retriever.retrieve_many(questions, min_score=-1.0)
+    second = retriever.retrieve_many(questions[:2], min_score=-1.0)
+
+    assert api_batches == [['incident reporting', 'notice period']]
+    assert first[:2] == second
+    assert retriever.embedding_client.embed_query_cached('notice period').source == 'memory'
@@ -1,3 +1,4 @@
 from .client import LLMClient
 from .types import ChatMessage, LLMResponse
-from .config import LLMConfig
\ No newline at end of file
+from .config import CacheConfig, LLMConfig
+from .cache import ResponseCache, get_response_cache, make_cache_key
\ No newline at end of file
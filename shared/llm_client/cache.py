@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from .config import CacheConfig
+
+# Puts between re-reads of the stored size, which picks up other processes' writes
+SIZE_RESYNC_PUTS = 256
+
+
+def make_cache_key(
+    provider: str,
+    model: str,
+    temperature: Optional[float],
+    max_tokens: Optional[int],
+    messages: Sequence[Tuple[str, str]]
+) -> str:
+    '''
+    Cache key of one generation request. `messages` are (role, content) pairs in order;
+    settings a caller does not pass to the provider are keyed as None.
+    '''
+    messages_hash = hashlib.sha256(
+        json.dumps([[role, content] for role, content in messages], ensure_ascii=False).encode('utf-8')
+    ).hexdigest()
+
+    return hashlib.sha256(
+        json.dumps([provider, model, temperature, max_tokens, messages_hash]).encode('utf-8')
+    ).hexdigest()
+
+
+class ResponseCache:
+    '''
+    Disk-backed cache of LLM response text in SQLite, shared by every process that opens
+    the same file.
+
+    Entries older than `ttl_seconds` are treated as missing and deleted. Once the stored
+    text exceeds `max_bytes`, the least recently used entries are evicted. With `bypass`
+    set, lookups always miss but fresh responses are still written, which refreshes the
+    cache without clearing it. Hit/miss counters are per process.
+
+    The stored size is kept as a running total rather than summed on every put; it is
+    re-read from the table every few hundred puts and before evicting, so writes from
+    other processes are accounted for.
+    '''
+
+    def __init__(
+        self,
+        path: Path,
+        ttl_seconds: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        bypass: bool = False
+    ) -> None:
+        self.path = Path(path)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.writes = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                provider TEXT NOT NULL,
+                model TEXT NOT NULL,
+                text TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            )
+            '''
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_last_used_at ON responses (last_used_at)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_created_at ON responses (created_at)')
+
+        self._total_bytes = 0
+        self._puts_since_resync = 0
+        self._resync_size()
+
+
+    def get(self, key: str) -> Optional[str]:
+        if self.bypass:
+            with self._lock:
+                self.bypassed += 1
+            return None
+
+        now = time.time()
+
+        with self._lock:
+            row = self._conn.execute('SELECT text, size, created_at FROM responses WHERE key = ?', (key,)).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            text, size, created_at = row
+
+            if self.ttl_seconds is not None and now - created_at > self.ttl_seconds:
+                self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self._total_bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._conn.execute('UPDATE responses SET last_used_at = ? WHERE key = ?', (now, key))
+            self.hits += 1
+
+        return text
+
+
+    def put(self, key: str, text: str, provider: str, model: str) -> None:
+        now = time.time()
+        size = len(text.encode('utf-8'))
+
+        with self._lock:
+            replaced = self._conn.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (key, provider, model, text, size, created_at, last_used_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, provider, model, text, size, now, now)
+            )
+            self._total_bytes += size - (replaced[0] if replaced is not None else 0)
+            self.writes += 1
+            self._puts_since_resync += 1
+
+            if self._puts_since_resync >= SIZE_RESYNC_PUTS:
+                self._resync_size()
+
+            self._evict(now)
+
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute('DELETE FROM responses')
+            self._total_bytes = 0
+
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, size = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+            lookups = self.hits + self.misses
+
+            return {
+                'entries': entries,
+                'bytes': size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'bypassed': self.bypassed,
+                'expirations': self.expirations,
+                'evictions': self.evictions,
+                'writes': self.writes,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+    def _evict(self, now: float) -> None:
+        # Called with the lock held: expired entries first, then least recently used ones
+        if self.ttl_seconds is not None:
+            cutoff = now - self.ttl_seconds
+            expired, expired_bytes = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses WHERE created_at < ?', (cutoff,)
+            ).fetchone()
+
+            if expired:
+                self._conn.execute('DELETE FROM responses WHERE created_at < ?', (cutoff,))
+                self._total_bytes -= expired_bytes
+                self.expirations += expired
+
+        if self.max_bytes is None or self._total_bytes <= self.max_bytes:
+            return
+
+        # Over budget by this process's count: confirm against the table before evicting
+        self._resync_size()
+        excess = self._total_bytes - self.max_bytes
+
+        if excess <= 0:
+            return
+
+        victims = []
+
+        for key, size in self._conn.execute('SELECT key, size FROM responses ORDER BY last_used_at'):
+            victims.append((key,))
+            excess -= size
+
+            if excess <= 0:
+                break
+
+        self._conn.executemany('DELETE FROM responses WHERE key = ?', victims)
+        self._total_bytes = self.max_bytes + excess
+        self.evictions += len(victims)
+
+
+    def _resync_size(self) -> None:
+        self._total_bytes = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        self._puts_since_resync = 0
+
+
+_caches: Dict[Path, ResponseCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_response_cache(config: Optional[CacheConfig] = None) -> Optional[ResponseCache]:
+    '''
+    Process-wide cache for the configured file (`LLM_CACHE_*` environment variables),
+    or None when caching is disabled.
+    '''
+    config = config or CacheConfig.from_env()
+
+    if not config.enabled:
+        return None
+
+    with _caches_lock:
+        cache = _caches.get(config.path)
+
+        if cache is None:
+            cache = ResponseCache(
+                path=config.path,
+                ttl_seconds=config.ttl_seconds,
+                max_bytes=config.max_bytes,
+                bypass=config.bypass
+            )
+            _caches[config.path] = cache
+
+        return cache
@@ -3,6 +3,7 @@ from __future__ import annotations
 from typing import List, Optional
 from tenacity import retry, stop_after_attempt, wait_exponential_jitter
 
+from .cache import ResponseCache, get_response_cache, make_cache_key
 from .types import ChatMessage, LLMResponse
 from .config import LLMConfig, require_env
 
@@ -14,10 +15,14 @@ class LLMClient:
     Supports:
         - OpenAI (Chat Completions via OpenAI SDK)
         - Anthropic (Claude via Anthropic SDK)
+
+    Responses go through the shared response cache (see `get_response_cache`), so an
+    identical request is only sent to the provider once
     '''
 
-    def __init__(self, config: Optional[LLMConfig] = None):
+    def __init__(self, config: Optional[LLMConfig] = None, cache: Optional[ResponseCache] = None):
         self.config = config or LLMConfig.from_env()
+        self.cache = cache or get_response_cache()
 
         if self.config.provider not in {'gemini', 'openai', 'anthropic'}:
             raise ValueError(f'Unsupported provider: {self.config.provider}')
@@ -41,8 +46,35 @@ class LLMClient:
             api_key = require_env("GEMINI_API_KEY")
             self._gemini = genai.Client(api_key=api_key)
 
+    def generate(self, messages: List[ChatMessage], max_tokens: int = 600, use_cache: bool = True) -> LLMResponse:
+        cache = self.cache if use_cache else None
+
+        if cache is None:
+            return self._generate(messages=messages, max_tokens=max_tokens)
+
+        key = make_cache_key(
+            self.config.provider,
+            self.config.model,
+            self.config.temperature,
+            max_tokens,
+            [(m.role, m.content) for m in messages]
+        )
+        text = cache.get(key)
+
+        if text is not None:
+            return LLMResponse(text=text, provider=self.config.provider, model=self.config.model, cached=True)
+
+        resp = self._generate(messages=messages, max_tokens=max_tokens)
+
+        # Empty output is usually a failure worth retrying on the next run
+        if resp.text:
+            cache.put(key, resp.text, provider=resp.provider, model=resp.model)
+
+        return resp
+
+
     @retry(stop=stop_after_attempt(3), wait=wait_exponential_jitter(initial=1, max=6))
-    def generate(self, messages: List[ChatMessage], max_tokens: int = 600) -> LLMResponse:
+    def _generate(self, messages: List[ChatMessage], max_tokens: int) -> LLMResponse:
         if self.config.provider == 'openai':
             return self._generate_openai(messages=messages, max_tokens=max_tokens)
         
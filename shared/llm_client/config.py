@@ -1,6 +1,8 @@
 from __future__ import annotations
 import os
 from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -23,6 +25,38 @@ class LLMConfig:
             temperature=temperature
         )
     
+
+@dataclass(frozen=True)
+class CacheConfig:
+    enabled: bool
+    path: Path
+    ttl_seconds: Optional[float]
+    max_bytes: Optional[int]
+    bypass: bool
+
+    @staticmethod
+    def from_env() -> "CacheConfig":
+        ttl = os.getenv("LLM_CACHE_TTL_SECONDS", "604800").strip()
+        max_bytes = os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)).strip()
+
+        return CacheConfig(
+            enabled=_env_flag("LLM_CACHE_ENABLED", True),
+            path=Path(os.getenv("LLM_CACHE_PATH", str(Path.home() / ".cache" / "llm-systems" / "llm_responses.sqlite3"))),
+            ttl_seconds=float(ttl) if ttl else None,
+            max_bytes=int(max_bytes) if max_bytes else None,
+            bypass=_env_flag("LLM_CACHE_BYPASS", False)
+        )
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+
+    if value is None or not value.strip():
+        return default
+
+    return value.strip().lower() in {"1", "true", "yes", "on"}
+
+
 def require_env(name: str) -> str:
     v = os.getenv(name)
 
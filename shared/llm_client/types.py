@@ -17,4 +17,5 @@ class LLMResponse:
     model: str
     input_tokens: Optional[int] = None
     output_tokens: Optional[int] = None
+    cached: bool = False
 
@@ -4,10 +4,11 @@ import json
 import os
 import re
 from dataclasses import dataclass
-from typing import Any, Dict
+from typing import Any, Dict, Optional, Tuple
 
 from google import genai
 
+from shared.llm_client import get_response_cache, make_cache_key
 from src.core.tools.base import ToolSpec
 
 
@@ -71,6 +72,7 @@ class RiskRubricGeminiTool:
             
         self.model = os.getenv('GEMINI_MODEL', 'gemini-2.5-flash')
         self.client = genai.Client(api_key=api_key)
+        self.cache = get_response_cache()
 
 
     def run(self, args: Dict[str, Any]) -> Dict[str, Any]:
@@ -83,16 +85,14 @@ class RiskRubricGeminiTool:
         rubric_prompt = self._build_prompt(clauses=clauses, context=context)
 
         # First attempt
-        text = self.client.models.generate_content(
-            model=self.model,
-            contents=[{ 'role': 'user', 'parts': [{'text': rubric_prompt}]}],
-            config={'temperature': 0.2 }
-        ).text
+        text, key = self._generate(rubric_prompt)
 
         try:
 
             obj = _extract_json_object(text)
-            return self._validate_and_normalize(obj)
+            report = self._validate_and_normalize(obj)
+            self._remember(key, text)
+            return report
         
         except Exception:
             # One repair attempt
@@ -104,14 +104,39 @@ class RiskRubricGeminiTool:
                 'Now return the corrected JSON:'
             )
 
-            text2 = self.client.models.generate_content(
-                model=self.model,
-                contents=[{'role': 'user', 'parts': [{'text': repair_prompt}]}],
-                config={ 'temperature': 0.2}
-            ).text
+            text2, key2 = self._generate(repair_prompt)
 
             obj2 = _extract_json_object(text2)
-            return self._validate_and_normalize(obj2)
+            report = self._validate_and_normalize(obj2)
+            self._remember(key2, text2)
+            return report
+
+
+    def _generate(self, prompt: str) -> Tuple[str, Optional[str]]:
+        '''
+            Returns the model output and, when it was freshly generated, its cache key.
+            Outputs are only cached once they pass validation (see `_remember`)
+        '''
+        key = make_cache_key('gemini', self.model, 0.2, None, [('user', prompt)]) if self.cache else None
+
+        if key is not None:
+            cached = self.cache.get(key)
+
+            if cached is not None:
+                return cached, None
+
+        text = self.client.models.generate_content(
+            model=self.model,
+            contents=[{'role': 'user', 'parts': [{'text': prompt}]}],
+            config={'temperature': 0.2}
+        ).text
+
+        return text, key
+
+
+    def _remember(self, key: Optional[str], text: str) -> None:
+        if key is not None and text:
+            self.cache.put(key, text, provider='gemini', model=self.model)
         
     
     def _build_prompt(self, clauses: Dict[str, str], context: Dict[str, Any]) -> str: